@@ -0,0 +1,403 @@
+from __future__ import annotations
+import asyncio
+import logging
+import queue
+import re
+import shlex
+import subprocess
+import threading
+import time
+from collections import OrderedDict
+from batching import Overloaded
+
+logger = logging.getLogger("chess-api")
+
+_RANK = re.compile(r"[pnbrqkPNBRQK1-8]+")
+_CASTLING = re.compile(r"-|K?Q?k?q?")
+_EN_PASSANT = re.compile(r"-|[a-h][36]")
+# Castling right -> (king square, rook square) that must still be in place, as (rank index, file index)
+_CASTLING_SQUARES = {"K": ((7, 4), (7, 7)), "Q": ((7, 4), (7, 0)), "k": ((0, 4), (0, 7)), "q": ((0, 4), (0, 0))}
+
+
+class EngineError(RuntimeError):
+    """The engine process exited, or did not answer in time."""
+
+
+def normalize_fen(fen: str, turn: str = "w") -> str:
+    """
+    Validate a FEN and reduce it to the fields analysis depends on: board, side to
+    move, castling and en passant (the move clocks are dropped). A board-only FEN,
+    like /infer returns, gets `turn` to move and no castling or en passant.
+    Castling rights whose king or rook has left its square are removed.
+    Raises ValueError for positions an engine cannot analyse.
+    """
+    fields = (fen or "").split()
+    if not fields:
+        raise ValueError("fen is empty")
+    ranks = fields[0].split("/")
+    grid = []
+    for rank in ranks:
+        if not _RANK.fullmatch(rank):
+            raise ValueError(f"Invalid FEN rank: {rank!r}")
+        row = "".join("." * int(ch) if ch.isdigit() else ch for ch in rank)
+        if len(row) != 8:
+            raise ValueError(f"FEN rank {rank!r} does not have 8 squares")
+        grid.append(row)
+    if len(grid) != 8:
+        raise ValueError("FEN board must have 8 ranks")
+    squares = "".join(grid)
+    if squares.count("K") != 1 or squares.count("k") != 1:
+        raise ValueError("Position must have exactly one king of each color")
+    if any(ch in "pP" for ch in grid[0] + grid[7]):
+        raise ValueError("Pawns cannot stand on the first or last rank")
+
+    side = fields[1] if len(fields) > 1 else turn
+    if side not in ("w", "b"):
+        raise ValueError("Side to move must be 'w' or 'b'")
+    castling = fields[2] if len(fields) > 2 else "-"
+    if not _CASTLING.fullmatch(castling):
+        raise ValueError(f"Invalid castling field: {castling!r}")
+    castling = "".join(
+        right for right in castling.replace("-", "")
+        if all(grid[r][f] == piece for (r, f), piece in zip(
+            _CASTLING_SQUARES[right], ("K", "R") if right.isupper() else ("k", "r")))
+    ) or "-"
+    en_passant = fields[3] if len(fields) > 3 else "-"
+    if not _EN_PASSANT.fullmatch(en_passant):
+        raise ValueError(f"Invalid en passant field: {en_passant!r}")
+    board = "/".join(re.sub(r"\.+", lambda m: str(len(m.group())), row) for row in grid)
+    return f"{board} {side} {castling} {en_passant}"
+
+
+def parse_info(line: str):
+    """A UCI 'info' line with a score and PV as a dict, else None (bound-only scores are skipped too)."""
+    tokens = line.split()
+    info = {}
+    i = 1
+    while i < len(tokens):
+        token = tokens[i]
+        if token in ("depth", "seldepth", "multipv", "nodes", "nps", "time") and i + 1 < len(tokens):
+            info[token] = int(tokens[i + 1])
+            i += 2
+        elif token == "score" and i + 2 < len(tokens):
+            info["score"] = {"type": tokens[i + 1], "value": int(tokens[i + 2])}
+            i += 3
+            if i < len(tokens) and tokens[i] in ("lowerbound", "upperbound"):
+                return None
+        elif token == "pv":
+            info["pv"] = tokens[i + 1:]
+            break
+        else:
+            i += 1
+    if "score" not in info or not info.get("pv"):
+        return None
+    info.setdefault("multipv", 1)
+    return info
+
+
+class UciEngine:
+    """
+    One engine subprocess spoken to over UCI. Blocking; a reader thread queues
+    its output so every wait has a timeout. Used by one caller at a time.
+    """
+    def __init__(self, command, options: dict = None, timeout: float = 10.0):
+        self.command = shlex.split(command) if isinstance(command, str) else list(command)
+        self.process = subprocess.Popen(self.command, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                        stderr=subprocess.DEVNULL, text=True, bufsize=1)
+        self._lines = queue.Queue()
+        self._write_lock = threading.Lock()
+        self._interrupted = False
+        threading.Thread(target=self._read, name="uci-reader", daemon=True).start()
+        self.name = self.command[0]
+        self._multipv = 1
+        deadline = time.monotonic() + timeout
+        self._send("uci")
+        for line in self._until("uciok", deadline):
+            if line.startswith("id name "):
+                self.name = line[len("id name "):]
+        for name, value in (options or {}).items():
+            self._send(f"setoption name {name} value {value}")
+        self._ready(deadline)
+
+
+    def _read(self):
+        for line in self.process.stdout:
+            self._lines.put(line.strip())
+        self._lines.put(None)
+
+
+    def _send(self, command: str):
+        try:
+            with self._write_lock:
+                self.process.stdin.write(command + "\n")
+                self.process.stdin.flush()
+        except OSError as e:
+            raise EngineError(f"Engine is not running: {e}")
+
+
+    def _until(self, token: str, deadline: float):
+        # Yield output lines up to (not including) the first one starting with token
+        while True:
+            try:
+                line = self._lines.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                raise EngineError(f"Engine did not answer '{token}' in time")
+            if line is None:
+                raise EngineError("Engine exited")
+            if line.split(" ", 1)[0] == token:
+                self.last_line = line
+                return
+            yield line
+
+
+    def _ready(self, deadline: float):
+        self._send("isready")
+        for _ in self._until("readyok", deadline):
+            pass
+
+
+    @property
+    def alive(self) -> bool:
+        return self.process.poll() is None
+
+
+    def analyse(self, fen: str, depth: int, multipv: int = 1, timeout: float = 30.0):
+        """
+        Search fen (a normalize_fen result) to depth with multipv lines. After
+        `timeout` seconds the search is stopped and what was found is returned
+        (complete=False). Returns {"bestmove", "depth", "lines", "complete", "engine_ms"}.
+        """
+        start = time.monotonic()
+        self._interrupted = False
+        if multipv != self._multipv:
+            self._send(f"setoption name MultiPV value {multipv}")
+            self._multipv = multipv
+        self._send(f"position fen {fen} 0 1")
+        self._send(f"go depth {depth}")
+        lines = {}
+        complete = True
+        try:
+            for line in self._until("bestmove", start + timeout):
+                if line.startswith("info"):
+                    info = parse_info(line)
+                    if info is not None and info["multipv"] <= multipv:
+                        lines[info["multipv"]] = info
+        except EngineError:
+            if not self.alive:
+                raise
+            # Out of time: ask for the best move so far, with a short grace period
+            complete = False
+            self._send("stop")
+            for line in self._until("bestmove", time.monotonic() + 2.0):
+                if line.startswith("info"):
+                    info = parse_info(line)
+                    if info is not None and info["multipv"] <= multipv:
+                        lines[info["multipv"]] = info
+        complete = complete and not self._interrupted
+        parts = self.last_line.split()
+        ordered = [lines[k] for k in sorted(lines)]
+        return {
+            "bestmove": parts[1] if len(parts) > 1 and parts[1] != "(none)" else None,
+            # A stopped search only counts for the depth all its lines reached
+            "depth": depth if complete else min((info.get("depth", 0) for info in ordered), default=0),
+            "multipv": multipv,
+            "lines": ordered,
+            "complete": complete,
+            "engine_ms": round((time.monotonic() - start) * 1000.0, 3),
+        }
+
+
+    def interrupt(self):
+        """From another thread: end the running search now; analyse() returns it as incomplete."""
+        self._interrupted = True
+        try:
+            self._send("stop")
+        except EngineError:
+            pass
+
+
+    def close(self):
+        try:
+            self._send("quit")
+            self.process.wait(timeout=1.0)
+        except (EngineError, subprocess.TimeoutExpired):
+            self.process.kill()
+
+
+class EnginePool:
+    """
+    `size` persistent engine processes shared by all requests. A request waits
+    for a free engine; with max_queue requests already waiting, analyse() raises
+    Overloaded instead. An engine that fails is replaced on its next use.
+    """
+    def __init__(self, command: str, size: int = 1, options: dict = None, max_queue: int = 32,
+                 timeout: float = 30.0):
+        self.command = command
+        self.size = max(1, int(size))
+        self.options = dict(options or {})
+        self.max_queue = max(0, int(max_queue))
+        self.timeout = float(timeout)
+        self.name = None
+        self.error = None
+        self._idle = None
+        self._waiting = 0
+        self._busy = set()  # searches still running, possibly for a caller that has gone
+
+
+    @property
+    def ready(self) -> bool:
+        return self._idle is not None
+
+
+    def _spawn(self):
+        return UciEngine(self.command, self.options)
+
+
+    async def start(self):
+        """Start every engine; on failure, error says why and analyse() stays unavailable."""
+        try:
+            engines = await asyncio.gather(*(asyncio.to_thread(self._spawn) for _ in range(self.size)))
+        except Exception as e:
+            self.error = str(e)
+            logger.exception("Analysis engine startup failed")
+            return
+        self.name = engines[0].name
+        self._idle = asyncio.Queue()
+        for engine in engines:
+            self._idle.put_nowait(engine)
+        logger.info("Started %d analysis engines (%s)", self.size, self.name)
+
+
+    async def close(self):
+        if self._idle is None:
+            return
+        if self._busy:
+            await asyncio.gather(*self._busy, return_exceptions=True)
+        while not self._idle.empty():
+            engine = self._idle.get_nowait()
+            if engine is not None:
+                await asyncio.to_thread(engine.close)
+
+
+    def info(self) -> dict:
+        return {"engine": self.name, "size": self.size,
+                "idle": self._idle.qsize() if self._idle is not None else 0, "waiting": self._waiting}
+
+
+    async def analyse(self, fen: str, depth: int, multipv: int = 1):
+        if self._idle.empty() and self._waiting >= self.max_queue:
+            raise Overloaded("Analysis queue is full.")
+        self._waiting += 1
+        try:
+            engine = await self._idle.get()
+        finally:
+            self._waiting -= 1
+        slot = {"engine": engine}
+        future = asyncio.get_running_loop().run_in_executor(None, self._search, slot, fen, depth, multipv)
+        self._busy.add(future)
+        future.add_done_callback(self._busy.discard)
+        # The engine goes back only once its thread is done with it, even if this caller is cancelled
+        future.add_done_callback(lambda _: self._idle.put_nowait(slot["engine"]))
+        try:
+            return await asyncio.shield(future)
+        except asyncio.CancelledError:
+            if slot["engine"] is not None:
+                slot["engine"].interrupt()
+            raise
+
+
+    def _search(self, slot: dict, fen: str, depth: int, multipv: int):
+        # In a worker thread; slot["engine"] is what goes back to the pool afterwards
+        engine = slot["engine"]
+        try:
+            if engine is None or not engine.alive:
+                slot["engine"] = engine = self._spawn()
+            return engine.analyse(fen, depth, multipv, self.timeout)
+        except EngineError:
+            # Replaced on the next use
+            if engine is not None:
+                engine.close()
+            slot["engine"] = None
+            raise
+
+
+class AnalysisCache:
+    """
+    LRU of analyses per position (a normalize_fen result). A stored result
+    answers any request for that position with no more depth and no more
+    MultiPV lines, so a deep analysis also serves every shallower one. Requests
+    a computation in flight already covers wait for it instead of starting another.
+    """
+    def __init__(self, max_positions: int = 10000):
+        self.max_positions = max(0, int(max_positions))
+        self._positions = OrderedDict()  # fen -> [result, ...], none covering another
+        self._inflight = {}  # fen -> [(depth, multipv, task), ...]
+        self.stats = {"hits": 0, "misses": 0, "coalesced": 0}
+
+
+    def info(self) -> dict:
+        return {**self.stats, "positions": len(self._positions), "max_positions": self.max_positions}
+
+
+    @staticmethod
+    def _covers(result: dict, depth: int, multipv: int) -> bool:
+        return result["depth"] >= depth and result["multipv"] >= multipv
+
+
+    @staticmethod
+    def _answer(result: dict, multipv: int) -> dict:
+        return {**result, "lines": result["lines"][:multipv], "multipv": multipv}
+
+
+    def get(self, fen: str, depth: int, multipv: int):
+        for result in self._positions.get(fen, ()):
+            if self._covers(result, depth, multipv):
+                self._positions.move_to_end(fen)
+                return self._answer(result, multipv)
+        return None
+
+
+    def put(self, fen: str, result: dict):
+        # Incomplete (timed out) searches are stored at the depth they reached
+        results = self._positions.pop(fen, [])
+        if not any(self._covers(r, result["depth"], result["multipv"]) for r in results):
+            results = [r for r in results if not self._covers(result, r["depth"], r["multipv"])] + [result]
+        self._positions[fen] = results
+        while len(self._positions) > self.max_positions:
+            self._positions.popitem(last=False)
+
+
+    async def get_or_compute(self, fen: str, depth: int, multipv: int, compute):
+        """
+        Return (result, status), status being "hit", "miss" or "coalesced".
+        compute: zero-argument coroutine function analysing fen at depth/multipv.
+        """
+        cached = self.get(fen, depth, multipv)
+        if cached is not None:
+            self.stats["hits"] += 1
+            return cached, "hit"
+        for d, m, task in self._inflight.get(fen, ()):
+            if d >= depth and m >= multipv:
+                self.stats["coalesced"] += 1
+                return self._answer(await asyncio.shield(task), multipv), "coalesced"
+
+        async def fill():
+            result = await compute()
+            self.put(fen, result)
+            return result
+
+        # Own task, so a caller that goes away does not cancel it for the others
+        task = asyncio.get_running_loop().create_task(fill())
+        entry = (depth, multipv, task)
+        self._inflight.setdefault(fen, []).append(entry)
+
+        def done(_):
+            waiting = self._inflight.get(fen, [])
+            if entry in waiting:
+                waiting.remove(entry)
+            if not waiting:
+                self._inflight.pop(fen, None)
+
+        task.add_done_callback(done)
+        self.stats["misses"] += 1
+        return self._answer(await asyncio.shield(task), multipv), "miss"
@@ -1,23 +1,167 @@
+import asyncio
 import base64
+import hmac
+import json
+import logging
 import os
+import time
+from contextlib import asynccontextmanager
 from dotenv import load_dotenv
-from fastapi import FastAPI, File, UploadFile, Form
+from fastapi import FastAPI, File, UploadFile, Form, Header, Request, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
-from PIL import Image
-from io import BytesIO
-from inference import Detector
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from decode import ImageSource, ImageTooLarge
+from inference import Detector, IMAGE_FORMATS, IMAGE_MIME_TYPES, PIECES_ENGINES
+from cache import ResultCache, content_key
+from tracking import BoardTracker, TrackerStore
+from batching import MicroBatcher, Overloaded, DeadlineExceeded, make_executor, plan_workers, start_workers
+from metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, Counter, Gauge, Histogram, Registry
+from profiling import RateLimiter, request_id, write_profile
+from analysis import AnalysisCache, EngineError, EnginePool, normalize_fen
+from uploads import UploadTooLarge, archive_images, check_content_length, read_body, spool_body
 
 load_dotenv()
 
+logger = logging.getLogger("uvicorn.error")
+
 BOARD_MODEL_PATH = os.getenv("BOARD_MODEL_PATH")
 PIECES_MODEL_PATH = os.getenv("PIECES_MODEL_PATH")
+MODEL_BACKEND = os.getenv("MODEL_BACKEND", "torch")  # "torch", "onnx" or "openvino"
+MODEL_INT8 = os.getenv("MODEL_INT8", "false").lower() in ("1", "true", "yes")
+BOARD_CALIBRATION_DATA = os.getenv("BOARD_CALIBRATION_DATA")  # dataset yaml for OpenVINO INT8 calibration
+PIECES_CALIBRATION_DATA = os.getenv("PIECES_CALIBRATION_DATA")
 BOARD_CONF = float(os.getenv("BOARD_CONF", 0.25))
 PIECES_CONF = float(os.getenv("PIECES_CONF", 0.25))
+BOARD_QUAD_FIT = os.getenv("BOARD_QUAD_FIT", "mask")  # "mask" (fast) or "image" (full-resolution reference)
+BOARD_REFINE_CORNERS = os.getenv("BOARD_REFINE_CORNERS", "false").lower() in ("1", "true", "yes")
+SQUARES_MODEL_PATH = os.getenv("SQUARES_MODEL_PATH")  # optional square classifier for the "squares" engine
+PIECES_ENGINE = os.getenv("PIECES_ENGINE", "detect")  # default engine: "detect" or "squares"
+PIECES_IMGSZ = int(os.getenv("PIECES_IMGSZ")) if os.getenv("PIECES_IMGSZ") else None  # default: the model's training imgsz
+# Two-pass cascade for the "detect" engine: a low-resolution pass, then high-resolution
+# crops of the squares it is unsure about
+PIECES_CASCADE = os.getenv("PIECES_CASCADE", "false").lower() in ("1", "true", "yes")  # default for /infer's cascade
+PIECES_CASCADE_IMGSZ = int(os.getenv("PIECES_CASCADE_IMGSZ", 320))  # first-pass input size
+PIECES_CASCADE_CONF = float(os.getenv("PIECES_CASCADE_CONF", 0.6))  # refine squares whose best piece is below this
+PIECES_CASCADE_COMPETE = float(os.getenv("PIECES_CASCADE_COMPETE", 0.25))  # ... or with a second class at least this
+PIECES_CASCADE_MAX_SQUARES = int(os.getenv("PIECES_CASCADE_MAX_SQUARES", 16))  # above this, re-run the whole board
+PIECES_CASCADE_FLOOR = float(os.getenv("PIECES_CASCADE_FLOOR", 0.05))  # first-pass candidates kept down to this
+BATCH_MAX_SIZE = int(os.getenv("BATCH_MAX_SIZE", 8))
+BATCH_MAX_WAIT_MS = float(os.getenv("BATCH_MAX_WAIT_MS", 5))
+INFER_EXECUTOR = os.getenv("INFER_EXECUTOR", "thread")  # "thread" or "process"
+# Scale with INFER_WORKERS inside one uvicorn process rather than with uvicorn --workers:
+# process workers are forked from a parent that has already loaded the models
+INFER_WORKERS = os.getenv("INFER_WORKERS", "1")  # a count, or "auto" to size from cores and memory
+INFER_THREADS = int(os.getenv("INFER_THREADS", 0))  # intra-op threads per worker; 0 = split the cores evenly
+INFER_WORKER_MEMORY_MB = float(os.getenv("INFER_WORKER_MEMORY_MB", 1024))  # per-worker budget for "auto"
+INFER_QUEUE_SIZE = int(os.getenv("INFER_QUEUE_SIZE", 32))
+RETRY_AFTER_SECONDS = int(os.getenv("RETRY_AFTER_SECONDS", 1))
+TRACKER_SESSIONS = int(os.getenv("TRACKER_SESSIONS", 256))
+CACHE_MAX_MB = float(os.getenv("CACHE_MAX_MB", 128))  # 0 disables the result cache
+CACHE_TTL_SECONDS = float(os.getenv("CACHE_TTL_SECONDS", 3600))
+CACHE_DIR = os.getenv("CACHE_DIR")  # optional disk tier
+CACHE_DISK_MAX_MB = float(os.getenv("CACHE_DISK_MAX_MB", 1024))
+
+# Which images /infer renders for each value of its `images` parameter
+RENDER_CHOICES = {
+    "none": (),
+    "overlay": ("overlay",),
+    "debug": ("debug",),
+    "both": ("overlay", "debug"),
+}
+
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN")  # enables X-Profile on /infer for callers sending it as X-Admin-Token
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+PROFILE_MAX_PER_MINUTE = int(os.getenv("PROFILE_MAX_PER_MINUTE", 6))
+MAX_BOARDS = int(os.getenv("MAX_BOARDS", 8))  # upper limit for /infer's max_boards
+# What /infer renders for callers that do not send `images`; "both" is what it always did before
+INFER_DEFAULT_IMAGES = os.getenv("INFER_DEFAULT_IMAGES", "both")
+MAX_IMAGE_PIXELS = int(os.getenv("MAX_IMAGE_PIXELS", 50_000_000))  # checked from the header, before decoding; 0 = no limit
+MAX_UPLOAD_BYTES = int(float(os.getenv("MAX_UPLOAD_MB", 25)) * 1024 * 1024)  # per image, checked while streaming; 0 = no limit
+MAX_ARCHIVE_BYTES = int(float(os.getenv("MAX_ARCHIVE_MB", 1024)) * 1024 * 1024)  # whole /infer/archive body
+MAX_ARCHIVE_IMAGES = int(os.getenv("MAX_ARCHIVE_IMAGES", 1000))
+ARCHIVE_CONCURRENCY = int(os.getenv("ARCHIVE_CONCURRENCY", BATCH_MAX_SIZE))  # archive images in flight at once
+ENGINE_PATH = os.getenv("ENGINE_PATH")  # UCI engine command line (e.g. "stockfish"); unset disables /analyze
+ENGINE_POOL_SIZE = int(os.getenv("ENGINE_POOL_SIZE", 2))  # persistent engine processes
+ENGINE_THREADS = int(os.getenv("ENGINE_THREADS", 1))  # search threads per engine
+ENGINE_HASH_MB = int(os.getenv("ENGINE_HASH_MB", 64))  # hash table per engine
+ENGINE_QUEUE_SIZE = int(os.getenv("ENGINE_QUEUE_SIZE", 32))  # /analyze requests waiting for an engine before 503s
+ANALYSIS_CACHE_POSITIONS = int(os.getenv("ANALYSIS_CACHE_POSITIONS", 10000))  # 0 disables the analysis cache
+ANALYSIS_DEFAULT_DEPTH = int(os.getenv("ANALYSIS_DEFAULT_DEPTH", 15))
+ANALYSIS_MAX_DEPTH = int(os.getenv("ANALYSIS_MAX_DEPTH", 30))
+ANALYSIS_MAX_MULTIPV = int(os.getenv("ANALYSIS_MAX_MULTIPV", 5))
+ANALYSIS_TIMEOUT_SECONDS = float(os.getenv("ANALYSIS_TIMEOUT_SECONDS", 30))  # then the search is stopped early
 
 CORS_ORIGINS = [o.strip() for o in os.getenv("CORS_ORIGINS", "http://localhost:5173").split(",")]
 
-app = FastAPI(title="Chess Detector API", version="0.1.0")
+# Startup progress, reported by /ready
+STARTUP = {"ready": False, "error": None, "seconds": {}, "workers": None}
+
+def startup():
+    """
+    Import the model runtime, load both models and warm them up, then open the
+    worker pool. Runs in a background thread so /health answers meanwhile;
+    /ready and /infer only start accepting work once this has succeeded.
+    """
+    global DETECTOR, EXECUTOR, BATCHER
+    seconds = STARTUP["seconds"]
+    try:
+        start = time.perf_counter()
+        import ultralytics  # noqa: F401  (pulls in torch)
+        seconds["import"] = round(time.perf_counter() - start, 3)
+
+        start = time.perf_counter()
+        detector = Detector(**DETECTOR_KWARGS)
+        seconds["load"] = round(time.perf_counter() - start, 3)
+
+        start = time.perf_counter()
+        if INFER_EXECUTOR != "process":
+            # Process workers warm up after the fork instead: running the models
+            # here would start thread pools that do not survive it
+            detector.warmup()
+        seconds["warmup"] = round(time.perf_counter() - start, 3)
+
+        # Inference runs on a bounded worker pool; concurrent /infer requests are
+        # grouped into batched model calls in front of it
+        start = time.perf_counter()
+        workers, threads = plan_workers(INFER_WORKERS, INFER_THREADS, INFER_WORKER_MEMORY_MB)
+        STARTUP["workers"] = {"executor": INFER_EXECUTOR, "workers": workers, "threads_per_worker": threads}
+        executor = make_executor(INFER_EXECUTOR, workers, DETECTOR_KWARGS, detector=detector, threads=threads)
+        start_workers(executor, workers)
+        seconds["workers"] = round(time.perf_counter() - start, 3)
+
+        DETECTOR, EXECUTOR = detector, executor
+        BATCHER = MicroBatcher(
+            EXECUTOR,
+            workers=workers,
+            max_batch_size=BATCH_MAX_SIZE,
+            max_wait_ms=BATCH_MAX_WAIT_MS,
+            max_queue=INFER_QUEUE_SIZE,
+            on_batch=lambda size: BATCH_SIZES.observe(size),
+        )
+        STARTUP["ready"] = True
+        logger.info("Models ready in %.2fs (import %.2fs, load %.2fs, warmup %.2fs, workers %.2fs); "
+                    "%d %s workers with %d threads each",
+                    sum(seconds.values()), seconds["import"], seconds["load"], seconds["warmup"], seconds["workers"],
+                    workers, INFER_EXECUTOR, threads)
+    except Exception as e:
+        STARTUP["error"] = str(e)
+        logger.exception("Model startup failed")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    loading = asyncio.create_task(asyncio.to_thread(startup))
+    if ENGINES is not None:
+        await ENGINES.start()
+    yield
+    await loading
+    if ENGINES is not None:
+        await ENGINES.close()
+    if BATCHER is not None:
+        await BATCHER.stop()
+    if EXECUTOR is not None:
+        EXECUTOR.shutdown(wait=False, cancel_futures=True)
+
+app = FastAPI(title="Chess Detector API", version="0.1.0", lifespan=lifespan)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=CORS_ORIGINS,
@@ -26,51 +170,556 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Load models once at startup
-DETECTOR = Detector(
+# Models are loaded by startup() when the app starts
+DETECTOR_KWARGS = dict(
     board_model_path=BOARD_MODEL_PATH,
     pieces_model_path=PIECES_MODEL_PATH,
     board_conf=BOARD_CONF,
     pieces_conf=PIECES_CONF,
+    pieces_imgsz=PIECES_IMGSZ,
+    backend=MODEL_BACKEND,
+    int8=MODEL_INT8,
+    board_calibration_data=BOARD_CALIBRATION_DATA,
+    pieces_calibration_data=PIECES_CALIBRATION_DATA,
+    quad_fit=BOARD_QUAD_FIT,
+    refine_corners=BOARD_REFINE_CORNERS,
+    squares_model_path=SQUARES_MODEL_PATH,
+    pieces_engine=PIECES_ENGINE,
+    cascade=PIECES_CASCADE,
+    cascade_imgsz=PIECES_CASCADE_IMGSZ,
+    cascade_conf=PIECES_CASCADE_CONF,
+    cascade_compete=PIECES_CASCADE_COMPETE,
+    cascade_max_squares=PIECES_CASCADE_MAX_SQUARES,
+    cascade_floor=PIECES_CASCADE_FLOOR,
 )
+DETECTOR = None
+EXECUTOR = None
+BATCHER = None
+
+# Per-session board trackers for clients that send a stream of frames. They are
+# updated in place by the worker, so they only take effect with thread workers.
+TRACKERS = TrackerStore(TRACKER_SESSIONS) if INFER_EXECUTOR == "thread" else None
+
+# Results for identical uploads are served from cache; identical requests
+# already in flight share one computation
+CACHE = ResultCache(
+    max_bytes=int(CACHE_MAX_MB * 1024 * 1024),
+    ttl_seconds=CACHE_TTL_SECONDS,
+    disk_dir=CACHE_DIR,
+    disk_max_bytes=int(CACHE_DISK_MAX_MB * 1024 * 1024),
+) if CACHE_MAX_MB > 0 else None
+
+# Engine analysis for /analyze: a fixed pool of UCI processes, and a cache where
+# a deeper result for a position also answers shallower requests
+ENGINES = EnginePool(
+    ENGINE_PATH,
+    size=ENGINE_POOL_SIZE,
+    options={"Threads": ENGINE_THREADS, "Hash": ENGINE_HASH_MB},
+    max_queue=ENGINE_QUEUE_SIZE,
+    timeout=ANALYSIS_TIMEOUT_SECONDS,
+) if ENGINE_PATH else None
+ANALYSIS_CACHE = AnalysisCache(ANALYSIS_CACHE_POSITIONS) if ANALYSIS_CACHE_POSITIONS > 0 else None
+
+PROFILE_LIMITER = RateLimiter(PROFILE_MAX_PER_MINUTE, period=60.0)
+
+# Prometheus metrics, served by /metrics
+METRICS = Registry()
+REQUESTS = METRICS.register(Counter(
+    "chess_requests_total", "HTTP requests by path and status code.", ("path", "status")))
+ERRORS = METRICS.register(Counter(
+    "chess_inference_errors_total", "Failed inference requests by error type.", ("error",)))
+STAGE_SECONDS = METRICS.register(Histogram(
+    "chess_stage_duration_seconds", "Time per pipeline stage (queue = waiting for a worker).", ("stage",)))
+BATCH_SIZES = METRICS.register(Histogram(
+    "chess_batch_size", "Images per batch sent to the inference workers.", buckets=(1, 2, 4, 8, 16, 32, 64)))
+CACHE_LOOKUPS = METRICS.register(Counter(
+    "chess_cache_lookups_total", "Result cache lookups by outcome (hit, miss, coalesced).", ("status",)))
+ANALYSIS_LOOKUPS = METRICS.register(Counter(
+    "chess_analysis_lookups_total", "Analysis cache lookups by outcome (hit, miss, coalesced).", ("status",)))
+METRICS.register(Gauge(
+    "chess_analysis_queue_depth", "Analysis requests waiting for an engine.",
+    function=lambda: ENGINES.info()["waiting"] if ENGINES is not None and ENGINES.ready else 0))
+METRICS.register(Gauge(
+    "chess_queue_depth", "Requests waiting for an inference worker.",
+    function=lambda: BATCHER.queue_depth if BATCHER is not None else 0))
+
+def observe_stages(result: dict):
+    for stage, ms in result.get("timings", {}).items():
+        if stage != "total":
+            STAGE_SECONDS.observe(ms / 1000.0, stage=stage)
+    if "queue_wait_ms" in result:
+        STAGE_SECONDS.observe(result["queue_wait_ms"] / 1000.0, stage="queue")
+
+@app.middleware("http")
+async def count_requests(request, call_next):
+    response = await call_next(request)
+    route = request.scope.get("route")
+    REQUESTS.inc(path=route.path if route is not None else "other", status=response.status_code)
+    return response
+
+def not_ready_response():
+    error = STARTUP["error"] or "Models are still loading."
+    return JSONResponse({"ready": False, "error": error}, status_code=503,
+                        headers={"Retry-After": str(RETRY_AFTER_SECONDS)})
 
 @app.get("/health")
 def health():
     return {"ok": True}
 
+@app.get("/ready")
+def ready():
+    if not STARTUP["ready"]:
+        return not_ready_response()
+    return {"ready": True, "startup_seconds": STARTUP["seconds"], "workers": STARTUP["workers"]}
+
+@app.get("/metrics")
+def metrics():
+    return PlainTextResponse(METRICS.render(), media_type=METRICS_CONTENT_TYPE)
+
+@app.get("/cache/stats")
+def cache_stats():
+    stats = {"enabled": True, **CACHE.info()} if CACHE is not None else {"enabled": False}
+    stats["analysis"] = {"enabled": True, **ANALYSIS_CACHE.info()} if ANALYSIS_CACHE is not None else {"enabled": False}
+    return stats
+
+def infer_options(flip_ranks=False, corners=None, images="none", image_format="png", image_quality=90,
+                  image_max_size=None, square_probs=False, engine=None, max_boards=1, cascade=None):
+    """Validate /infer's parameters into the options BATCHER.submit takes (and the cache key uses)."""
+    if images not in RENDER_CHOICES:
+        raise ValueError(f"images must be one of {', '.join(RENDER_CHOICES)}")
+    if image_format not in IMAGE_FORMATS:
+        raise ValueError(f"image_format must be one of {', '.join(IMAGE_FORMATS)}")
+    if engine is not None and engine not in PIECES_ENGINES:
+        raise ValueError(f"engine must be one of {', '.join(PIECES_ENGINES)}")
+    if not 1 <= max_boards <= MAX_BOARDS:
+        raise ValueError(f"max_boards must be between 1 and {MAX_BOARDS}")
+
+    # Parse manual corners if provided
+    manual_corners = None
+    if corners:
+        try:
+            manual_corners = json.loads(corners)
+        except:
+            pass
+
+    return dict(
+        flip_ranks=flip_ranks,
+        manual_corners=manual_corners,
+        render=RENDER_CHOICES[images],
+        image_format=image_format,
+        image_quality=image_quality,
+        image_max_size=image_max_size,
+        square_probs=square_probs,
+        engine=engine or DETECTOR.pieces_engine,
+        max_boards=max_boards,
+        cascade=DETECTOR.cascade if cascade is None else cascade,
+    )
+
+def attach_images(result: dict, overlay_bytes, debug_bytes, image_format: str):
+    mime = IMAGE_MIME_TYPES[image_format]
+    # Encode overlay image (warped board with detections)
+    if overlay_bytes is not None:
+        overlay_b64 = base64.b64encode(overlay_bytes).decode("ascii")
+        result["overlay_base64"] = f"data:{mime};base64,{overlay_b64}"
+    
+    # Encode debug image (original image with detected corners)
+    if debug_bytes is not None:
+        debug_b64 = base64.b64encode(debug_bytes).decode("ascii")
+        result["debug_base64"] = f"data:{mime};base64,{debug_b64}"
+    return result
+
+async def infer_content(content: bytes, options: dict, tracker=None, deadline=None, timings=False):
+    """Run the pipeline on one encoded image, through the result cache when possible. Returns the result dict."""
+    # Only the header is read here; decoding happens in the worker
+    image = ImageSource(content, max_pixels=MAX_IMAGE_PIXELS)
+
+    async def compute():
+        # Stage timings are always collected for /metrics; the response only has them on request
+        out = await BATCHER.submit(image=image, tracker=tracker, deadline=deadline, timings=True, **options)
+        observe_stages(out[0])
+        return out
+
+    # Tracked sessions depend on earlier frames, so they bypass the cache
+    if CACHE is not None and tracker is None:
+        key = content_key(content, models=DETECTOR.version, **options)
+        # A deadline is this request's alone, so it must not leak into (or come from) a shared computation
+        (result, overlay_bytes, debug_bytes), status = await CACHE.get_or_compute(
+            key, compute, coalesce=deadline is None)
+        result["cache"] = status
+        CACHE_LOOKUPS.inc(status=status)
+        if status != "miss":
+            # Batch stats and timings belong to the request that computed the result
+            result.pop("batch_size", None)
+            result.pop("queue_wait_ms", None)
+            result.pop("timings", None)
+    else:
+        result, overlay_bytes, debug_bytes = await compute()
+
+    if not timings:
+        result.pop("timings", None)
+    return attach_images(result, overlay_bytes, debug_bytes, options["image_format"])
+
+def error_response(e: Exception):
+    if isinstance(e, Overloaded):
+        ERRORS.inc(error="overloaded")
+        return JSONResponse({"error": str(e)}, status_code=503,
+                            headers={"Retry-After": str(RETRY_AFTER_SECONDS)})
+    if isinstance(e, DeadlineExceeded):
+        ERRORS.inc(error="deadline")
+        return JSONResponse({"error": str(e)}, status_code=504)
+    if isinstance(e, ImageTooLarge):
+        ERRORS.inc(error="too_large")
+        return JSONResponse({"error": str(e)}, status_code=413)
+    ERRORS.inc(error="bad_request")
+    return JSONResponse({"error": str(e)}, status_code=400)
+
 @app.post("/infer")
 async def infer(
     file: UploadFile = File(...), 
     flip_ranks: bool = Form(False),
-    corners: str = Form(None)  # JSON string of corners [[x1,y1], [x2,y2], [x3,y3], [x4,y4]]
+    corners: str = Form(None),  # JSON string of corners [[x1,y1], [x2,y2], [x3,y3], [x4,y4]]
+    deadline_ms: float = Form(None),  # drop the request if inference has not started within this budget
+    images: str = Form(None),  # "none", "overlay", "debug" or "both"; default INFER_DEFAULT_IMAGES
+    image_format: str = Form("png"),  # "png", "jpeg" or "webp"
+    image_quality: int = Form(90),  # JPEG/WebP quality, 1-100
+    image_max_size: int = Form(None),  # downscale returned images so the longest side fits
+    square_probs: bool = Form(False),  # also return the 8x8x13 per-square class confidences
+    session_id: str = Form(None),  # reuse the board quad from this session's previous frames
+    engine: str = Form(None),  # pieces engine, "detect" or "squares"; default PIECES_ENGINE
+    timings: bool = Form(False),  # also return per-stage durations in ms
+    max_boards: int = Form(1),  # return a FEN for each of up to this many boards (in result["boards"])
+    cascade: bool = Form(None),  # two-pass "detect" engine, reported in result["cascade"]; default PIECES_CASCADE
+    x_profile: str = Header(None),  # "file" or "inline": cProfile this request (needs X-Admin-Token)
+    x_admin_token: str = Header(None),
+    x_request_id: str = Header(None)  # names the saved profile
 ):
+    received = time.monotonic()
+    if not STARTUP["ready"]:
+        return not_ready_response()
     try:
-        import json
+        # Callers that predate `images` get the old response shape
+        legacy = images is None
+        options = infer_options(flip_ranks, corners, INFER_DEFAULT_IMAGES if legacy else images, image_format,
+                                image_quality, image_max_size, square_probs, engine, max_boards, cascade)
+        if x_profile is not None:
+            if not PROFILE_TOKEN or not hmac.compare_digest((x_admin_token or "").encode(), PROFILE_TOKEN.encode()):
+                return JSONResponse({"error": "Profiling is not enabled for this caller."}, status_code=403)
+            if x_profile not in ("file", "inline"):
+                raise ValueError("X-Profile must be 'file' or 'inline'")
+            wait = PROFILE_LIMITER.acquire()
+            if wait:
+                return JSONResponse({"error": "Profiling rate limit reached."}, status_code=429,
+                                    headers={"Retry-After": str(max(1, round(wait)))})
+        # The multipart parser has already spooled the file; refuse it before reading it into memory
+        if MAX_UPLOAD_BYTES and file.size is not None and file.size > MAX_UPLOAD_BYTES:
+            raise UploadTooLarge(f"Upload is {file.size} bytes; the limit is {MAX_UPLOAD_BYTES}.")
         content = await file.read()
-        image = Image.open(BytesIO(content))
-        
-        # Parse manual corners if provided
-        manual_corners = None
-        if corners:
-            try:
-                manual_corners = json.loads(corners)
-            except:
-                pass
+        tracker = TRACKERS.get(session_id) if session_id and TRACKERS is not None else None
+        deadline = received + deadline_ms / 1000.0 if deadline_ms else None
         
-        result, overlay_png, debug_png = DETECTOR.run(
-            image, 
-            flip_ranks=flip_ranks,
-            manual_corners=manual_corners
-        )
-        
-        # Encode overlay image (warped board with detections)
-        overlay_b64 = base64.b64encode(overlay_png).decode("ascii")
-        result["overlay_png_base64"] = f"data:image/png;base64,{overlay_b64}"
-        
-        # Encode debug image (original image with detected corners)
-        debug_b64 = base64.b64encode(debug_png).decode("ascii")
-        result["debug_png_base64"] = f"data:image/png;base64,{debug_b64}"
+        headers = {}
+        if x_profile is not None:
+            # Run this request alone (no batching, no cache) under cProfile on a worker;
+            # it still queues behind other requests, with the same limit and deadline
+            image = ImageSource(content, max_pixels=MAX_IMAGE_PIXELS)
+            (result, overlay_bytes, debug_bytes), stats, report = await BATCHER.submit_profiled(
+                image=image, tracker=tracker, deadline=deadline, timings=True, **options)
+            observe_stages(result)
+            rid = request_id(x_request_id)
+            headers["X-Request-ID"] = rid
+            result["profile"] = {"request_id": rid}
+            if x_profile == "file":
+                result["profile"]["path"] = await asyncio.to_thread(write_profile, PROFILE_DIR, rid, stats)
+            else:
+                result["profile"]["report"] = report
+            if not timings:
+                result.pop("timings", None)
+            attach_images(result, overlay_bytes, debug_bytes, image_format)
+        else:
+            result = await infer_content(content, options, tracker, deadline, timings)
         
-        return JSONResponse(result)
+        if legacy and image_format == "png":
+            # Deprecated: the keys before image_format existed; new callers send `images` and read *_base64
+            for name in ("overlay", "debug"):
+                if f"{name}_base64" in result:
+                    result[f"{name}_png_base64"] = result[f"{name}_base64"]
+        return JSONResponse(result, headers=headers)
+    except Exception as e:
+        return error_response(e)
+
+
+@app.post("/infer/raw")
+async def infer_raw(
+    request: Request,  # the image itself is the body: Content-Type application/octet-stream or image/*
+    flip_ranks: bool = False,
+    corners: str = None,
+    deadline_ms: float = None,
+    images: str = "none",
+    image_format: str = "png",
+    image_quality: int = 90,
+    image_max_size: int = None,
+    square_probs: bool = False,
+    session_id: str = None,
+    engine: str = None,
+    timings: bool = False,
+    max_boards: int = 1,
+    cascade: bool = None,
+):
+    # /infer without multipart parsing; the form fields become query parameters
+    received = time.monotonic()
+    if not STARTUP["ready"]:
+        return not_ready_response()
+    content_type = request.headers.get("content-type", "application/octet-stream").split(";")[0].strip().lower()
+    if content_type != "application/octet-stream" and not content_type.startswith("image/"):
+        return JSONResponse({"error": "Send the image as application/octet-stream or image/*."}, status_code=415)
+    try:
+        options = infer_options(flip_ranks, corners, images, image_format, image_quality, image_max_size,
+                                square_probs, engine, max_boards, cascade)
+        check_content_length(request.headers, MAX_UPLOAD_BYTES)
+        content = await read_body(request.stream(), MAX_UPLOAD_BYTES)
+        if not content:
+            raise ValueError("Request body is empty")
+        tracker = TRACKERS.get(session_id) if session_id and TRACKERS is not None else None
+        deadline = received + deadline_ms / 1000.0 if deadline_ms else None
+        return JSONResponse(await infer_content(content, options, tracker, deadline, timings))
+    except Exception as e:
+        return error_response(e)
+
+
+@app.post("/infer/archive")
+async def infer_archive(
+    request: Request,  # a ZIP or tar (optionally gzip/bz2/xz) of images as the body
+    flip_ranks: bool = False,
+    images: str = "none",
+    image_format: str = "png",
+    image_quality: int = 90,
+    image_max_size: int = None,
+    square_probs: bool = False,
+    engine: str = None,
+    timings: bool = False,
+    max_boards: int = 1,
+    cascade: bool = None,
+):
+    # One NDJSON line per image as it finishes (any order; "index" is its position
+    # in the archive), then a summary line with "done": true
+    started = time.perf_counter()
+    if not STARTUP["ready"]:
+        return not_ready_response()
+    try:
+        options = infer_options(flip_ranks, None, images, image_format, image_quality, image_max_size,
+                                square_probs, engine, max_boards, cascade)
+        check_content_length(request.headers, MAX_ARCHIVE_BYTES)
+        # ZIPs keep their index at the end, so the archive is spooled (to disk past a few MB) first
+        spool = await spool_body(request.stream(), MAX_ARCHIVE_BYTES)
     except Exception as e:
-        return JSONResponse({"error": str(e)}, status_code=400)
\ No newline at end of file
+        return error_response(e)
+    members = archive_images(spool, MAX_UPLOAD_BYTES, MAX_ARCHIVE_IMAGES)
+    try:
+        first = await asyncio.to_thread(next, members, None)
+    except Exception as e:
+        spool.close()
+        return error_response(e)
+
+    # Bounded, so a slow reader holds back the archive instead of piling up results
+    lines = asyncio.Queue(maxsize=ARCHIVE_CONCURRENCY)
+    slots = asyncio.Semaphore(ARCHIVE_CONCURRENCY)
+    tasks = set()
+    counts = {"images": 0, "errors": 0}
+
+    async def run(index: int, name: str, content):
+        try:
+            if isinstance(content, Exception):
+                raise content
+            line = {"index": index, "name": name, "status": 200,
+                    **await infer_content(content, options, timings=timings)}
+        except Exception as e:
+            counts["errors"] += 1
+            line = {"index": index, "name": name, "status": error_response(e).status_code, "error": str(e)}
+        await lines.put(line)
+        slots.release()
+
+    async def feed():
+        item, index = first, 0
+        try:
+            while item is not None:
+                await slots.acquire()
+                tasks.add(asyncio.create_task(run(index, *item)))
+                index += 1
+                item = await asyncio.to_thread(next, members, None)
+        except Exception as e:
+            # A truncated or corrupt archive: report it after the images already read
+            counts["errors"] += 1
+            error = {"status": 400, "error": f"Archive could not be read past image {index}: {e}"}
+        else:
+            error = None
+        counts["images"] = index
+        await asyncio.gather(*tasks)
+        if error is not None:
+            await lines.put(error)
+        await lines.put(None)
+
+    async def stream():
+        feeder = asyncio.create_task(feed())
+        try:
+            while (line := await lines.get()) is not None:
+                yield json.dumps(line) + "\n"
+            yield json.dumps({"done": True, **counts,
+                              "total_ms": round((time.perf_counter() - started) * 1000.0, 3)}) + "\n"
+        finally:
+            # The client may have gone away mid-stream
+            feeder.cancel()
+            for task in tasks:
+                task.cancel()
+            spool.close()
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+
+@app.post("/analyze")
+async def analyze(
+    fen: str = Form(...),  # a full FEN, or the board-only FEN /infer returns
+    turn: str = Form("w"),  # side to move when fen has no side field
+    depth: int = Form(None),  # default ANALYSIS_DEFAULT_DEPTH
+    multipv: int = Form(1),  # number of best lines to return
+):
+    if ENGINES is None:
+        return JSONResponse({"error": "Analysis is not enabled (set ENGINE_PATH)."}, status_code=503)
+    if not ENGINES.ready:
+        return JSONResponse({"error": ENGINES.error or "Analysis engines are still starting."}, status_code=503,
+                            headers={"Retry-After": str(RETRY_AFTER_SECONDS)})
+    try:
+        depth = ANALYSIS_DEFAULT_DEPTH if depth is None else depth
+        if not 1 <= depth <= ANALYSIS_MAX_DEPTH:
+            raise ValueError(f"depth must be between 1 and {ANALYSIS_MAX_DEPTH}")
+        if not 1 <= multipv <= ANALYSIS_MAX_MULTIPV:
+            raise ValueError(f"multipv must be between 1 and {ANALYSIS_MAX_MULTIPV}")
+        position = normalize_fen(fen, turn)
+
+        async def compute():
+            result = await ENGINES.analyse(position, depth, multipv)
+            STAGE_SECONDS.observe(result["engine_ms"] / 1000.0, stage="analysis")
+            return result
+
+        if ANALYSIS_CACHE is not None:
+            result, status = await ANALYSIS_CACHE.get_or_compute(position, depth, multipv, compute)
+            ANALYSIS_LOOKUPS.inc(status=status)
+        else:
+            result, status = await compute(), None
+        result = {"fen": position, **result}
+        if status is not None:
+            result["cache"] = status
+            if status != "miss":
+                # Engine time belongs to the request that ran the search
+                result.pop("engine_ms", None)
+        return result
+    except Overloaded as e:
+        ERRORS.inc(error="overloaded")
+        return JSONResponse({"error": str(e)}, status_code=503,
+                            headers={"Retry-After": str(RETRY_AFTER_SECONDS)})
+    except EngineError as e:
+        ERRORS.inc(error="engine")
+        return JSONResponse({"error": str(e)}, status_code=502)
+    except ValueError as e:
+        ERRORS.inc(error="bad_request")
+        return JSONResponse({"error": str(e)}, status_code=400)
+
+
+@app.websocket("/stream")
+async def stream(ws: WebSocket, flip_ranks: bool = False):
+    """
+    Live board recognition. The client sends encoded frames as binary messages;
+    only the newest frame is processed and frames that arrive while one is being
+    processed replace each other (counted as dropped). A message is pushed only
+    when the FEN changes (or detection starts/stops failing), with timing data.
+    With thread workers the connection keeps its own BoardTracker so segmentation
+    is skipped while the board stays put (process workers would only update a copy).
+    """
+    await ws.accept()
+    if not STARTUP["ready"]:
+        await ws.close(code=1013, reason="Models are still loading.")
+        return
+    tracker = BoardTracker() if INFER_EXECUTOR == "thread" else None
+    state = {"frame": None, "seq": 0, "dropped": 0, "closed": False}
+    ready = asyncio.Event()
+
+    async def receive_frames():
+        try:
+            while True:
+                message = await ws.receive()
+                if message["type"] == "websocket.disconnect":
+                    break
+                data = message.get("bytes")
+                if not data:
+                    continue
+                if state["frame"] is not None:
+                    state["dropped"] += 1
+                state["seq"] += 1
+                state["frame"] = (state["seq"], data, time.perf_counter())
+                ready.set()
+        finally:
+            state["closed"] = True
+            ready.set()
+
+    reader = asyncio.create_task(receive_frames())
+    last_key = None
+    try:
+        while True:
+            await ready.wait()
+            ready.clear()
+            if state["closed"]:
+                break
+            if state["frame"] is None:
+                continue
+            seq, data, received = state["frame"]
+            state["frame"] = None
+
+            started = time.perf_counter()
+            try:
+                result, _, _ = await BATCHER.submit(
+                    image=ImageSource(data, max_pixels=MAX_IMAGE_PIXELS),
+                    flip_ranks=flip_ranks,
+                    render=(),
+                    tracker=tracker,
+                    timings=True,
+                )
+                observe_stages(result)
+                error = None
+            except Overloaded:
+                state["dropped"] += 1
+                continue
+            except Exception as e:
+                result, error = None, str(e)
+            finished = time.perf_counter()
+
+            fen = result["fen"] if result else None
+            if (fen, error) == last_key:
+                continue
+            last_key = (fen, error)
+            message = {
+                "frame": seq,
+                "fen": fen,
+                "dropped_frames": state["dropped"],
+                "timings": {
+                    "wait_ms": round((started - received) * 1000.0, 3),
+                    "inference_ms": round((finished - started) * 1000.0, 3),
+                    "total_ms": round((finished - received) * 1000.0, 3),
+                },
+            }
+            if result:
+                message["board_corners"] = result["board_corners"]
+                message["num_pieces"] = result["num_pieces"]
+                message["board_tracking"] = result.get("board_tracking")
+                message["timings"]["queue_wait_ms"] = result.get("queue_wait_ms")
+                message["timings"]["batch_size"] = result.get("batch_size")
+                message["timings"]["stages"] = result.get("timings")
+            else:
+                message["error"] = error
+            # The client may have left while this frame was processed
+            if state["closed"]:
+                break
+            try:
+                await ws.send_json(message)
+            except (WebSocketDisconnect, RuntimeError):
+                break
+    finally:
+        reader.cancel()
@@ -0,0 +1,88 @@
+from __future__ import annotations
+import os
+
+
+# Inference backends a Detector can run its models on. "onnx" needs onnxruntime
+# and "openvino" needs openvino; both are only imported when selected. ultralytics
+# (and torch) are imported on first load so importing this module stays cheap.
+BACKENDS = ("torch", "onnx", "openvino")
+
+
+def _exported_path(weights: str, backend: str, int8: bool) -> str:
+    stem, _ = os.path.splitext(weights)
+    suffix = "_int8" if int8 else ""
+    if backend == "onnx":
+        return f"{stem}{suffix}.onnx"
+    return f"{stem}{suffix}_openvino_model"
+
+
+def _is_exported(path: str) -> bool:
+    return path.endswith(".onnx") or path.rstrip("/\\").endswith("_openvino_model")
+
+
+def _up_to_date(target: str, source: str) -> bool:
+    return os.path.exists(target) and (not os.path.exists(source) or os.path.getmtime(target) >= os.path.getmtime(source))
+
+
+def export_model(weights: str, backend: str, int8: bool = False, imgsz: int = None, data: str = None) -> str:
+    """
+    Export PyTorch weights for backend (unless an up-to-date export already sits next to them).
+    Exports use dynamic shapes so batched and non-default-size predict() calls keep working.
+    INT8: OpenVINO is quantized by the ultralytics exporter (NNCF), calibrated on `data`
+    (a dataset yaml) if given; ONNX gets onnxruntime dynamic quantization of the FP32 export.
+    Returns the path of the exported model.
+    """
+    target = _exported_path(weights, backend, int8)
+    if _up_to_date(target, weights):
+        return target
+    from ultralytics import YOLO
+
+    model = YOLO(weights)
+    kwargs = {"dynamic": True}
+    if imgsz:
+        kwargs["imgsz"] = imgsz
+    if backend == "openvino":
+        if int8:
+            kwargs["int8"] = True
+            if data:
+                kwargs["data"] = data
+        exported = model.export(format="openvino", **kwargs)
+    elif backend == "onnx":
+        exported = model.export(format="onnx", **kwargs)
+        if int8:
+            from onnxruntime.quantization import QuantType, quantize_dynamic
+            quantize_dynamic(exported, target, weight_type=QuantType.QUInt8)
+            return target
+    else:
+        raise ValueError(f"Unknown backend: {backend}")
+
+    exported = str(exported)
+    if os.path.abspath(exported) != os.path.abspath(target):
+        if os.path.isdir(target):
+            import shutil
+            shutil.rmtree(target)
+        os.replace(exported, target)
+    return target
+
+
+def load_model(path: str, backend: str = "torch", int8: bool = False, task: str = None,
+               imgsz: int = None, data: str = None):
+    """
+    Load a YOLO model on the given backend.
+    path may be PyTorch weights (exported on first use, see export_model) or an
+    existing .onnx file / *_openvino_model directory. The returned object has the
+    usual YOLO predict() API, so Detector does not care which backend it runs on.
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend: {backend} (expected one of {', '.join(BACKENDS)})")
+    from ultralytics import YOLO
+    if backend == "torch":
+        return YOLO(path, task=task)
+    if not _is_exported(path):
+        imgsz = imgsz or YOLO(path).overrides.get("imgsz")
+        path = export_model(path, backend, int8=int8, imgsz=imgsz, data=data)
+    model = YOLO(path, task=task)
+    if imgsz:
+        # Exported models do not carry the training imgsz in overrides like .pt weights do
+        model.overrides["imgsz"] = imgsz
+    return model
@@ -0,0 +1,329 @@
+from __future__ import annotations
+import asyncio
+import gc
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import cv2
+from inference import Detector
+from profiling import profile_call
+
+
+class Overloaded(RuntimeError):
+    """Raised by MicroBatcher.submit when the request queue is full."""
+
+
+class DeadlineExceeded(RuntimeError):
+    """Set on a request whose deadline passed before it reached the models."""
+
+
+# Detector owned by the current pool worker (see make_executor)
+_LOCAL = threading.local()
+
+
+def available_cores() -> int:
+    # Cores this process may run on (respects taskset/cgroup CPU affinity where supported)
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def available_memory_mb():
+    try:
+        import psutil
+        return psutil.virtual_memory().available / (1024 * 1024)
+    except ImportError:
+        pass
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def plan_workers(workers, threads=None, worker_memory_mb: float = 1024):
+    """
+    Resolve the worker pool size. workers: a count, or "auto"/0 for as many
+    workers as the cores (at `threads` each) and the available memory (at
+    worker_memory_mb each) allow. threads: intra-op threads per worker; by
+    default the cores are split evenly between the workers (2 each when auto-sizing
+    on 8+ cores, else 1). Returns (workers, threads).
+    """
+    cores = available_cores()
+    auto = workers in (None, "", "auto", 0, "0")
+    threads = int(threads) if threads else 0
+    if not auto:
+        workers = max(1, int(workers))
+        return workers, threads or max(1, cores // workers)
+    threads = threads or (2 if cores >= 8 else 1)
+    workers = max(1, cores // threads)
+    memory = available_memory_mb()
+    if memory is not None and worker_memory_mb > 0:
+        workers = max(1, min(workers, int(memory // worker_memory_mb)))
+    return workers, threads
+
+
+def _set_worker_threads(threads: int, cores: list = None):
+    # Keep each worker's torch/OpenCV thread pools on its own share of the cores
+    if cores and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cores)
+    cv2.setNumThreads(threads)
+    try:
+        import torch
+        torch.set_num_threads(threads)
+    except ImportError:
+        pass
+
+
+def _init_worker(detector_kwargs: dict, detector: Detector = None, threads: int = None, slots=None):
+    if threads:
+        cores = None
+        if slots is not None and hasattr(os, "sched_getaffinity"):
+            with slots.get_lock():
+                index = slots.value
+                slots.value += 1
+            allowed = sorted(os.sched_getaffinity(0))
+            # Pin only when every worker can have cores of its own
+            if len(allowed) >= threads * (index + 1):
+                cores = allowed[index * threads:(index + 1) * threads]
+        _set_worker_threads(threads, cores)
+    _LOCAL.detector = detector if detector is not None else Detector(**detector_kwargs)
+    _LOCAL.detector.warmup()
+
+
+def _worker_run_batch(jobs: list):
+    return _LOCAL.detector.run_batch(jobs)
+
+
+def worker_detector() -> Detector:
+    """The Detector of the current pool worker, for other functions submitted to a make_executor pool."""
+    return _LOCAL.detector
+
+
+def worker_profile_run(job: dict):
+    """
+    Run one job on its own under cProfile, in a pool worker (submit this to the executor).
+    Returns (run_batch output for the job, marshalled stats, text report); see profile_call.
+    """
+    outputs, stats, report = profile_call(_LOCAL.detector.run_batch, [job])
+    return outputs[0], stats, report
+
+
+def _worker_ready():
+    return True
+
+
+def start_workers(executor, workers: int):
+    """
+    Start every pool worker now (loading and warming up its Detector) instead of on
+    the first requests. Blocks until all of them are up; raises if one failed.
+    """
+    futures = [executor.submit(_worker_ready) for _ in range(max(1, int(workers)))]
+    for future in futures:
+        future.result()
+
+
+def make_executor(kind: str, workers: int, detector_kwargs: dict, detector: Detector = None,
+                  threads: int = None):
+    """
+    Build the pool that runs Detector.run_batch off the event loop.
+    kind: "thread" or "process". Every worker owns a Detector, since YOLO predictors
+    are not safe to share between threads; a single thread worker reuses `detector`.
+    Process workers are forked where the platform allows it and then start from
+    `detector` (loaded but not yet warmed up), so the model weights are shared
+    copy-on-write instead of loaded once per worker. Each process worker is pinned
+    to its own `threads` cores; thread workers only cap the shared thread pools.
+    """
+    workers = max(1, int(workers))
+    if kind == "process":
+        if "fork" in multiprocessing.get_all_start_methods():
+            context = multiprocessing.get_context("fork")
+            # Keep the collector from touching (and so copying) the preloaded objects
+            gc.freeze()
+        else:
+            context, detector = multiprocessing.get_context(), None
+        return ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_init_worker,
+                                   initargs=(detector_kwargs, detector, threads, context.Value("i", 0)))
+    if kind == "thread":
+        shared = detector if workers == 1 else None
+        return ThreadPoolExecutor(max_workers=workers, thread_name_prefix="infer",
+                                  initializer=_init_worker, initargs=(detector_kwargs, shared, threads))
+    raise ValueError(f"Unknown executor kind: {kind}")
+
+
+class MicroBatcher:
+    """
+    Collects concurrent inference requests and runs them through Detector.run_batch.
+    A batch is closed max_wait_ms after its first request arrives, or as soon as
+    max_batch_size requests are queued, whichever comes first.
+    At most `workers` batches run at once on `executor` (from make_executor); up to
+    max_queue requests wait behind them (0 = unbounded) before submit() raises Overloaded.
+    submit_profiled() jobs share that queue and its limits but always run alone.
+    on_batch(batch_size) is called for every batch sent to the executor (e.g. for metrics).
+    """
+    def __init__(self, executor, workers: int = 1, max_batch_size: int = 8, max_wait_ms: float = 5.0,
+                 max_queue: int = 0, on_batch=None):
+        self.executor = executor
+        self.workers = max(1, int(workers))
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self.max_queue = max(0, int(max_queue))
+        self.on_batch = on_batch
+        self._queue = None
+        self._slots = None
+        self._task = None
+        self._held = None  # a profiled job that arrived while a batch was being collected
+        self._inflight = set()
+
+
+    def start(self):
+        if self._task is None:
+            self._queue = asyncio.Queue(maxsize=self.max_queue)
+            self._slots = asyncio.Semaphore(self.workers)
+            self._task = asyncio.get_running_loop().create_task(self._worker())
+
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._inflight:
+            await asyncio.gather(*self._inflight, return_exceptions=True)
+
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+
+    async def submit(self, deadline: float = None, **job):
+        """
+        Queue one job (Detector.run keyword arguments) and wait for its batch.
+        deadline: time.monotonic() value after which the job is dropped instead of run.
+        Returns the Detector.run tuple; the result dict also reports batch_size
+        and queue_wait_ms.
+        """
+        return await self._enqueue(job, deadline, profiled=False)
+
+
+    async def submit_profiled(self, deadline: float = None, **job):
+        """
+        Like submit(), but the job runs in a batch of its own under cProfile.
+        Returns worker_profile_run's (Detector.run tuple, marshalled stats, text report).
+        """
+        return await self._enqueue(job, deadline, profiled=True)
+
+
+    async def _enqueue(self, job: dict, deadline: float, profiled: bool):
+        self.start()
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self._queue.put_nowait((job, future, time.perf_counter(), deadline, profiled))
+        except asyncio.QueueFull:
+            raise Overloaded("Inference queue is full.")
+        return await future
+
+
+    async def _collect(self):
+        if self._held is not None:
+            batch, self._held = [self._held], None
+        else:
+            batch = [await self._queue.get()]
+        if batch[0][4]:
+            return batch
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                item = await asyncio.wait_for(self._queue.get(), remaining)
+            except asyncio.TimeoutError:
+                break
+            if item[4]:
+                # Profiled jobs are never batched with others; it goes next
+                self._held = item
+                break
+            batch.append(item)
+        return batch
+
+
+    @staticmethod
+    def _drop_stale(batch):
+        # Drop requests whose caller has gone away or whose deadline has passed
+        now = time.monotonic()
+        live = []
+        for item in batch:
+            future, deadline = item[1], item[3]
+            if future.done():
+                continue
+            if deadline is not None and now > deadline:
+                future.set_exception(DeadlineExceeded("Request deadline passed before inference started."))
+                continue
+            live.append(item)
+        return live
+
+
+    async def _worker(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            # Wait for a free worker first so requests queue up (and are bounded) meanwhile
+            await self._slots.acquire()
+            try:
+                batch = self._drop_stale(await self._collect())
+            except BaseException:
+                self._slots.release()
+                raise
+            if not batch:
+                self._slots.release()
+                continue
+            task = loop.create_task(self._dispatch(batch))
+            self._inflight.add(task)
+            task.add_done_callback(self._inflight.discard)
+
+
+    async def _dispatch(self, batch):
+        loop = asyncio.get_running_loop()
+        try:
+            started = time.perf_counter()
+            jobs = [item[0] for item in batch]
+            if self.on_batch is not None:
+                self.on_batch(len(jobs))
+            if batch[0][4]:
+                outputs = await self._run_profiled(jobs[0])
+            else:
+                try:
+                    outputs = await loop.run_in_executor(self.executor, _worker_run_batch, jobs)
+                except Exception as e:
+                    outputs = [e] * len(batch)
+
+            for (_, future, queued, _, profiled), out in zip(batch, outputs):
+                if future.done():
+                    continue
+                if isinstance(out, Exception):
+                    future.set_exception(out)
+                    continue
+                result = out[0][0] if profiled else out[0]
+                result["batch_size"] = len(batch)
+                result["queue_wait_ms"] = round((started - queued) * 1000.0, 3)
+                future.set_result(out)
+        finally:
+            self._slots.release()
+
+
+    async def _run_profiled(self, job: dict):
+        try:
+            out, stats, report = await asyncio.get_running_loop().run_in_executor(
+                self.executor, worker_profile_run, job)
+        except Exception as e:
+            return [e]
+        return [out if isinstance(out, Exception) else (out, stats, report)]
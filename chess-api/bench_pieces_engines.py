@@ -0,0 +1,136 @@
+"""
+Compare the "detect" and "squares" pieces engines on the pieces val set.
+Every val image is taken as a top-down board, resized to the pieces model's input
+size and run through both engines one board at a time. Ground truth comes from the
+YOLO labels (each box is assigned to the square under its center, like the
+pipeline does). Reports square and whole-board accuracy and latency per board.
+
+    python bench_pieces_engines.py --squares-model models/squares.pt
+    python bench_pieces_engines.py --squares-model models/squares.pt --limit 100
+    python bench_pieces_engines.py --squares-model models/squares.pt --shards ../data/pieces/shards/val-640
+
+--shards reads pre-decoded boards from shard_dataset.py output instead of decoding
+the images (they are used at the shards' size, letterboxed).
+"""
+
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+import cv2
+import numpy as np
+from dotenv import load_dotenv
+from inference import Detector, WARP_SIZE
+from labels import INDEX_TO_NAME
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
+
+def load_truth(label_path: Path):
+    # YOLO labels (class cx cy w h, normalized) -> detections in WARP_SIZE board coordinates
+    rows = []
+    if label_path.exists():
+        rows = [line.split()[:5] for line in label_path.read_text().splitlines() if len(line.split()) >= 5]
+    return rows_to_detections(rows)
+
+
+def rows_to_detections(rows):
+    detections = []
+    for row in rows:
+        cls = int(float(row[0]))
+        cx, cy, w, h = (float(v) * WARP_SIZE for v in row[1:5])
+        detections.append({
+            "class": INDEX_TO_NAME[cls] if cls < len(INDEX_TO_NAME) else f"class_{cls}",
+            "conf": 1.0,
+            "bbox": [cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2],
+            "center": [cx, cy],
+        })
+    return detections
+
+
+def bench_engine(detector: Detector, boards: list, engine: str):
+    squares_found, times = [], []
+    for warped in boards:
+        start = time.perf_counter()
+        if engine == "detect":
+            detections = detector.detect_pieces(warped)
+        else:
+            detections, _ = detector.classify_squares_batch([warped])[0]
+        times.append(time.perf_counter() - start)
+        squares_found.append(detector._assign_squares(detections)[0])
+    return squares_found, np.array(times) * 1000
+
+
+def main():
+    load_dotenv()
+    base_dir = Path(__file__).resolve().parent.parent
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--images", default=str(base_dir / "data" / "pieces" / "images" / "val"))
+    parser.add_argument("--labels", default=None, help="default: the matching labels/ folder")
+    parser.add_argument("--shards", default=None, help="shard directory from shard_dataset.py (replaces --images)")
+    parser.add_argument("--board-model", default=os.getenv("BOARD_MODEL_PATH"))
+    parser.add_argument("--pieces-model", default=os.getenv("PIECES_MODEL_PATH"))
+    parser.add_argument("--squares-model", default=os.getenv("SQUARES_MODEL_PATH"))
+    parser.add_argument("--limit", type=int, default=0, help="only use the first N images")
+    args = parser.parse_args()
+
+    if not args.squares_model:
+        print("No squares model given (--squares-model or SQUARES_MODEL_PATH)")
+        return 1
+    image_dir = Path(args.images)
+    label_dir = Path(args.labels) if args.labels else image_dir.parent.parent / "labels" / image_dir.name
+    images = sorted(p for p in image_dir.iterdir() if p.suffix.lower() in IMAGE_EXTENSIONS) if image_dir.is_dir() else []
+    shards = None
+    if args.shards:
+        sys.path.insert(0, str(base_dir))  # shard_dataset.py lives in the repo root
+        from shard_dataset import ImageShards
+        shards = ImageShards(args.shards)
+        images = shards.keys
+    if args.limit:
+        images = images[:args.limit]
+    if not images:
+        print(f"No images found in {args.shards or args.images}")
+        return 1
+
+    detector = Detector(
+        board_model_path=args.board_model,
+        pieces_model_path=args.pieces_model,
+        pieces_conf=float(os.getenv("PIECES_CONF", 0.25)),
+        squares_model_path=args.squares_model,
+    )
+    detector.warmup()
+
+    size = shards.imgsz if shards else detector.pieces_imgsz
+    boards, truth = [], []
+    for item in images:
+        if shards:
+            # Zero-copy view of the pre-decoded board
+            boards.append(shards[item])
+            truth.append(detector._assign_squares(rows_to_detections(shards.labels(item)))[0])
+            continue
+        bgr = cv2.imread(str(item))
+        if bgr is None:
+            continue
+        boards.append(cv2.resize(bgr, (size, size), interpolation=cv2.INTER_AREA))
+        truth.append(detector._assign_squares(load_truth(label_dir / f"{item.stem}.txt"))[0])
+    truth = np.array(truth)
+
+    print(f"Benchmarking pieces engines on {len(boards)} boards ({size}x{size})...")
+    print("\n" + "="*60)
+    print("PIECES ENGINE SUMMARY")
+    print("="*60)
+    for engine in ("detect", "squares"):
+        found, ms = bench_engine(detector, boards, engine)
+        correct = np.array(found) == truth
+        print(f"{engine}:")
+        print(f"   square accuracy: {correct.mean() * 100:.2f}%")
+        print(f"   board accuracy:  {correct.all(axis=(1, 2)).mean() * 100:.2f}%")
+        print(f"   latency:         p50 {np.percentile(ms, 50):.1f} ms, p95 {np.percentile(ms, 95):.1f} ms, "
+              f"mean {ms.mean():.1f} ms/board")
+    print("="*60)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
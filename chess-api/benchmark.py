@@ -0,0 +1,372 @@
+"""
+Stage-level benchmark for the Detector pipeline.
+Times Detector.run and each stage (decode, find_and_warp_board, detect_pieces,
+_detections_to_fen, _draw_overlay, PNG encode) on sample-images and on synthetic
+boards of a few camera resolutions, and reports p50/p95/p99 latency, images per
+second and peak RSS. Piece detection is also timed from the full-resolution image
+both single-pass and as the two-pass cascade (PIECES_CASCADE_* settings), and the
+latency the cascade saves is printed. Results are written as JSON; `compare` flags
+regressions against a saved baseline.
+
+    python benchmark.py run --output baseline.json
+    python benchmark.py run --stub --repeat 20 --output current.json
+    python benchmark.py compare baseline.json current.json --threshold 0.10
+
+--stub replaces both models with stand-ins that return fixed masks and boxes, so
+the suite runs without trained weights (and without ultralytics). Stub timings
+cover everything except the model forward passes, so there the cascade shows only
+its overhead; its savings need the real models.
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+import cv2
+import numpy as np
+from dotenv import load_dotenv
+import inference
+from decode import ImageSource
+from inference import Detector, WARP_SIZE, encode_image
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+SYNTHETIC_SIZES = ((640, 480), (1920, 1080), (4032, 3024))
+STAGES = ("decode", "find_and_warp_board", "detect_pieces", "detections_to_fen",
+          "draw_overlay", "png_encode", "pieces_single_pass", "pieces_cascade", "run")
+
+
+class _StubArray:
+    # The slice of the torch.Tensor API Detector uses on model results
+    def __init__(self, a):
+        self.a = np.asarray(a)
+
+    def cpu(self):
+        return self
+
+    def numpy(self):
+        return self.a
+
+    def sum(self, dim=None):
+        return _StubArray(self.a.sum(axis=dim))
+
+    def argmax(self):
+        return int(self.a.argmax())
+
+    def __getitem__(self, i):
+        return _StubArray(self.a[i])
+
+    def __len__(self):
+        return len(self.a)
+
+
+class _StubMasks:
+    def __init__(self, data):
+        self.data = _StubArray(data)
+
+    def __len__(self):
+        return len(self.data)
+
+
+class _StubBoxes:
+    def __init__(self, xyxy, conf, cls):
+        self.xyxy, self.conf, self.cls = _StubArray(xyxy), _StubArray(conf), _StubArray(cls)
+
+    def __len__(self):
+        return len(self.xyxy)
+
+
+class _StubProbs:
+    def __init__(self, data):
+        self.data = _StubArray(data)
+
+
+class _StubResult:
+    def __init__(self, masks=None, boxes=None, probs=None):
+        self.masks, self.boxes, self.probs = masks, boxes, probs
+
+
+class _StubModel:
+    """
+    Stand-in for a YOLO model. The board model returns one mask covering a fixed
+    quad in the middle of the (letterboxed) input; the pieces model returns the
+    32 boxes of the starting position; the squares model calls every square empty.
+    """
+    def __init__(self, task: str):
+        self.task = task
+        self.overrides = {"imgsz": 640}
+        names = inference.SQUARE_CLASSES if task == "classify" else inference.INDEX_TO_NAME
+        self.names = dict(enumerate(names))
+
+    def predict(self, source, **kwargs):
+        sources = source if isinstance(source, list) else [source]
+        return [getattr(self, f"_{self.task}")(img) for img in sources]
+
+    def _segment(self, img):
+        h, w = img.shape[:2]
+        gain = 640 / max(h, w)
+        mh, mw = -(-int(round(h * gain)) // 32) * 32, -(-int(round(w * gain)) // 32) * 32
+        mask = np.zeros((1, mh, mw), dtype=np.float32)
+        quad = np.array([[0.3, 0.15], [0.7, 0.18], [0.75, 0.85], [0.25, 0.82]]) * (mw, mh)
+        cv2.fillConvexPoly(mask[0], quad.astype(np.int32), 1.0)
+        return _StubResult(masks=_StubMasks(mask))
+
+    def _detect(self, img):
+        sq = img.shape[1] / 8
+        back = ["wR", "wN", "wB", "wQ", "wK", "wB", "wN", "wR"]
+        pieces = [(b.replace("w", "b"), f, 0) for f, b in enumerate(back)] + [("bP", f, 1) for f in range(8)]
+        pieces += [("wP", f, 6) for f in range(8)] + [(b, f, 7) for f, b in enumerate(back)]
+        index = {name: i for i, name in enumerate(inference.INDEX_TO_NAME)}
+        xyxy = np.array([[f * sq + 2, r * sq + 2, (f + 1) * sq - 2, (r + 1) * sq - 2] for _, f, r in pieces],
+                        dtype=np.float32)
+        conf = np.full(len(pieces), 0.9, dtype=np.float32)
+        cls = np.array([index[name] for name, _, _ in pieces], dtype=np.float32)
+        # An unsure square (a weak queen with a competing king) for the cascade to refine
+        conf[3] = 0.5
+        xyxy = np.vstack([xyxy, xyxy[3] + 1])
+        conf = np.append(conf, 0.3).astype(np.float32)
+        cls = np.append(cls, index["bK"]).astype(np.float32)
+        return _StubResult(boxes=_StubBoxes(xyxy, conf, cls))
+
+    def _classify(self, img):
+        probs = np.zeros(len(self.names), dtype=np.float32)
+        probs[-1] = 1.0
+        return _StubResult(probs=_StubProbs(probs))
+
+
+def _stub_load_model(path, backend="torch", int8=False, task=None, **kwargs):
+    return _StubModel(task)
+
+
+def make_synthetic(width: int, height: int) -> bytes:
+    # A checkerboard warped into a noisy scene, encoded as JPEG
+    rng = np.random.default_rng(width * height)
+    scene = rng.integers(60, 120, (height, width, 3), dtype=np.uint8)
+    board = np.kron((np.indices((8, 8)).sum(axis=0) % 2) * 160 + 60, np.ones((64, 64))).astype(np.uint8)
+    board = cv2.cvtColor(board, cv2.COLOR_GRAY2BGR)
+    dst = (np.array([[0.3, 0.15], [0.7, 0.18], [0.75, 0.85], [0.25, 0.82]]) * (width, height)).astype(np.float32)
+    M = cv2.getPerspectiveTransform(np.array([[0, 0], [511, 0], [511, 511], [0, 511]], dtype=np.float32), dst)
+    cv2.warpPerspective(board, M, (width, height), scene, borderMode=cv2.BORDER_TRANSPARENT)
+    ok, buffer = cv2.imencode(".jpg", scene, [cv2.IMWRITE_JPEG_QUALITY, 90])
+    return buffer.tobytes()
+
+
+def peak_rss_mb():
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux reports kilobytes, macOS bytes
+        return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+    except ImportError:
+        try:
+            import psutil
+            return round(psutil.Process().memory_info().peak_wset / (1024 * 1024), 1)
+        except (ImportError, AttributeError):
+            return None
+
+
+def _timed(samples: list, fn, *args):
+    start = time.perf_counter()
+    out = fn(*args)
+    samples.append((time.perf_counter() - start) * 1000)
+    return out
+
+
+def summarize(samples: list):
+    ms = np.array(samples, dtype=np.float64)
+    if not len(ms):
+        return {"count": 0}
+    return {
+        "count": len(ms),
+        "mean_ms": round(float(ms.mean()), 3),
+        "p50_ms": round(float(np.percentile(ms, 50)), 3),
+        "p95_ms": round(float(np.percentile(ms, 95)), 3),
+        "p99_ms": round(float(np.percentile(ms, 99)), 3),
+        "per_second": round(1000.0 / float(ms.mean()), 2) if ms.mean() > 0 else None,
+    }
+
+
+def run_suite(detector: Detector, inputs: list, repeat: int):
+    """Time every stage on every input `repeat` times. inputs: list of (name, encoded bytes)."""
+    samples = {stage: [] for stage in STAGES}
+    refined = []
+    failures = []
+    for name, content in inputs:
+        # One untimed pass so per-input lazy work (allocations, caches) is not measured
+        try:
+            detector.run(content, render=("overlay",))
+        except Exception as e:
+            failures.append({"input": name, "error": str(e)})
+            continue
+        for _ in range(repeat):
+            seg, _ = _timed(samples["decode"], lambda: ImageSource(content).for_size(detector.board_imgsz))
+            warped, quad, _ = _timed(samples["find_and_warp_board"], detector.find_and_warp_board, seg)
+            detections = _timed(samples["detect_pieces"], detector.detect_pieces, warped)
+            _timed(samples["detections_to_fen"], detector._detections_to_fen, detections)
+            board, _, _ = detector._warp(seg, quad, WARP_SIZE)
+            overlay = _timed(samples["draw_overlay"], detector._draw_overlay, board, detections)
+            _timed(samples["png_encode"], encode_image, overlay, "png")
+            # Both piece passes start from the same (already decoded) full-resolution image
+            src = ImageSource(content)
+            full_quad = quad / np.array(src.for_size(detector.board_imgsz)[1], dtype=np.float32)
+            for size in (detector.pieces_imgsz, detector.cascade_imgsz):
+                detector._warp_source(src, full_quad, size)
+            _timed(samples["pieces_single_pass"], lambda: detector.detect_pieces_batch(
+                [detector._warp_source(src, full_quad, detector.pieces_imgsz)]))
+            (_, info), = _timed(samples["pieces_cascade"], lambda: detector.detect_pieces_cascade_batch(
+                [detector._warp_source(src, full_quad, detector.cascade_imgsz)], [(src, full_quad)]))
+            refined.append(len(info["refined_squares"]))
+            _timed(samples["run"], lambda: detector.run(content, render=("overlay",)))
+    return {
+        "inputs": len(inputs),
+        "failures": failures,
+        "stages": {stage: summarize(values) for stage, values in samples.items()},
+        "cascade_refined_squares": round(float(np.mean(refined)), 2) if refined else None,
+    }
+
+
+def print_suite(name: str, suite: dict):
+    print(f"\n{name} ({suite['inputs']} inputs, {len(suite['failures'])} failed)")
+    print(f"   {'stage':<22}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'per sec':>10}")
+    for stage, s in suite["stages"].items():
+        if s["count"]:
+            print(f"   {stage:<22}{s['p50_ms']:>10.2f}{s['p95_ms']:>10.2f}{s['p99_ms']:>10.2f}{s['per_second']:>10.1f}")
+    single, cascade = suite["stages"]["pieces_single_pass"], suite["stages"]["pieces_cascade"]
+    if single["count"] and cascade["count"]:
+        saved = single["p50_ms"] - cascade["p50_ms"]
+        print(f"   cascade saves {saved:.2f} ms p50 ({saved / single['p50_ms'] * 100:.1f}%) against "
+              f"single pass, refining {suite['cascade_refined_squares']} squares per board on average")
+
+
+def cmd_run(args):
+    if args.stub:
+        inference.load_model = _stub_load_model
+    detector = Detector(
+        board_model_path=args.board_model,
+        pieces_model_path=args.pieces_model,
+        board_conf=float(os.getenv("BOARD_CONF", 0.25)),
+        pieces_conf=float(os.getenv("PIECES_CONF", 0.25)),
+        backend=args.backend,
+        cascade_imgsz=int(os.getenv("PIECES_CASCADE_IMGSZ", 320)),
+        cascade_conf=float(os.getenv("PIECES_CASCADE_CONF", 0.6)),
+        cascade_compete=float(os.getenv("PIECES_CASCADE_COMPETE", 0.25)),
+        cascade_max_squares=int(os.getenv("PIECES_CASCADE_MAX_SQUARES", 16)),
+        cascade_floor=float(os.getenv("PIECES_CASCADE_FLOOR", 0.05)),
+    )
+    detector.warmup()
+
+    suites = {}
+    if not args.no_samples:
+        paths = sorted(p for p in Path(args.images).iterdir() if p.suffix.lower() in IMAGE_EXTENSIONS)
+        if args.limit:
+            paths = paths[:args.limit]
+        inputs = [(p.name, p.read_bytes()) for p in paths]
+        print(f"Benchmarking {len(inputs)} sample images...")
+        suites["sample-images"] = run_suite(detector, inputs, args.repeat)
+    if not args.no_synthetic:
+        inputs = [(f"{w}x{h}", make_synthetic(w, h)) for w, h in SYNTHETIC_SIZES]
+        print(f"Benchmarking {len(inputs)} synthetic boards...")
+        suites["synthetic"] = run_suite(detector, inputs, args.repeat)
+
+    results = {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "mode": "stub" if args.stub else "models",
+        "repeat": args.repeat,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "models": detector.version,
+        "peak_rss_mb": peak_rss_mb(),
+        "suites": suites,
+    }
+
+    print("\n" + "="*60)
+    print("BENCHMARK SUMMARY")
+    print("="*60)
+    for name, suite in suites.items():
+        print_suite(name, suite)
+    print(f"\nPeak RSS: {results['peak_rss_mb']} MB")
+    print("="*60)
+
+    output = Path(args.output or f"benchmark-{datetime.now():%Y%m%d-%H%M%S}.json")
+    output.write_text(json.dumps(results, indent=2))
+    print(f"Results written to {output}")
+    return 0
+
+
+def cmd_compare(args):
+    baseline = json.loads(Path(args.baseline).read_text())
+    current = json.loads(Path(args.current).read_text())
+    if baseline.get("mode") != current.get("mode"):
+        print(f"Warning: comparing a {baseline.get('mode')} run with a {current.get('mode')} run")
+    metric = f"{args.metric}_ms"
+
+    regressions = []
+    print(f"{'suite/stage':<40}{'baseline':>10}{'current':>10}{'change':>10}")
+    for suite_name, suite in current["suites"].items():
+        base_suite = baseline["suites"].get(suite_name)
+        if base_suite is None:
+            continue
+        for stage, s in suite["stages"].items():
+            b = base_suite["stages"].get(stage, {})
+            if not s.get("count") or not b.get("count"):
+                continue
+            change = (s[metric] - b[metric]) / b[metric] if b[metric] else 0.0
+            # Tiny stages jitter by whole percentages; also require an absolute slowdown
+            regressed = change > args.threshold and s[metric] - b[metric] > args.min_ms
+            flag = "  REGRESSION" if regressed else ""
+            print(f"{suite_name + '/' + stage:<40}{b[metric]:>10.2f}{s[metric]:>10.2f}{change * 100:>9.1f}%{flag}")
+            if regressed:
+                regressions.append(f"{suite_name}/{stage}")
+
+    base_rss, rss = baseline.get("peak_rss_mb"), current.get("peak_rss_mb")
+    if base_rss and rss:
+        change = (rss - base_rss) / base_rss
+        regressed = change > args.threshold
+        print(f"{'peak_rss_mb':<40}{base_rss:>10.1f}{rss:>10.1f}{change * 100:>9.1f}%{'  REGRESSION' if regressed else ''}")
+        if regressed:
+            regressions.append("peak_rss_mb")
+
+    print("\n" + "="*60)
+    print(f"Regressions ({args.metric}, threshold {args.threshold * 100:.0f}%): {len(regressions)}")
+    for name in regressions:
+        print(f"   {name}")
+    print("="*60)
+    return 1 if regressions else 0
+
+
+def main():
+    load_dotenv()
+    base_dir = Path(__file__).resolve().parent.parent
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run = sub.add_parser("run", help="run the benchmark and write JSON results")
+    run.add_argument("--images", default=str(base_dir / "sample-images"))
+    run.add_argument("--board-model", default=os.getenv("BOARD_MODEL_PATH"))
+    run.add_argument("--pieces-model", default=os.getenv("PIECES_MODEL_PATH"))
+    run.add_argument("--backend", default=os.getenv("MODEL_BACKEND", "torch"))
+    run.add_argument("--stub", action="store_true", help="use stand-in models instead of trained weights")
+    run.add_argument("--repeat", type=int, default=5, help="timed passes per input")
+    run.add_argument("--limit", type=int, default=0, help="only use the first N sample images")
+    run.add_argument("--no-samples", action="store_true", help="skip sample-images")
+    run.add_argument("--no-synthetic", action="store_true", help="skip the synthetic boards")
+    run.add_argument("--output", help="JSON results path (default: benchmark-<timestamp>.json)")
+    run.set_defaults(func=cmd_run)
+
+    compare = sub.add_parser("compare", help="flag regressions against a baseline")
+    compare.add_argument("baseline")
+    compare.add_argument("current")
+    compare.add_argument("--metric", choices=["p50", "p95", "p99", "mean"], default="p50")
+    compare.add_argument("--threshold", type=float, default=0.10, help="allowed slowdown, as a fraction")
+    compare.add_argument("--min-ms", type=float, default=0.1, help="ignore slowdowns smaller than this")
+    compare.set_defaults(func=cmd_compare)
+
+    args = parser.parse_args()
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,167 @@
+from __future__ import annotations
+import asyncio
+import hashlib
+import json
+import os
+import pickle
+import time
+from collections import OrderedDict
+
+
+def content_key(content: bytes, **params) -> str:
+    """
+    Cache key for an uploaded image: a hash of its bytes plus every parameter
+    that changes the result (JSON-encoded, so values must be JSON-serializable).
+    """
+    h = hashlib.blake2b(content, digest_size=20)
+    h.update(json.dumps(params, sort_keys=True, default=str).encode("utf-8"))
+    return h.hexdigest()
+
+
+class ResultCache:
+    """
+    Content-addressed LRU + TTL cache for inference results, with single-flight.
+    Values are stored pickled, which bounds memory by max_bytes, hands every
+    caller its own copy, and doubles as the format of the optional disk tier.
+    Concurrent get_or_compute calls for a key that is being computed wait on
+    that computation instead of starting another one.
+    """
+    def __init__(self, max_bytes: int, ttl_seconds: float = 3600.0, disk_dir: str = None,
+                 disk_max_bytes: int = 0):
+        self.max_bytes = max(0, int(max_bytes))
+        self.ttl = float(ttl_seconds)
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = max(0, int(disk_max_bytes))
+        self._entries = OrderedDict()  # key -> (expires_at, blob)
+        self._bytes = 0
+        self._inflight = {}
+        self._disk_writes = 0
+        self.stats = {"hits": 0, "disk_hits": 0, "misses": 0, "coalesced": 0, "evictions": 0}
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+
+    def info(self) -> dict:
+        return {**self.stats, "entries": len(self._entries), "bytes": self._bytes, "max_bytes": self.max_bytes}
+
+
+    def _get_memory(self, key: str):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, blob = entry
+        if time.time() > expires_at:
+            self._drop(key)
+            return None
+        self._entries.move_to_end(key)
+        return blob
+
+
+    def _drop(self, key: str):
+        _, blob = self._entries.pop(key)
+        self._bytes -= len(blob)
+
+
+    def _put_memory(self, key: str, blob: bytes, expires_at: float):
+        if len(blob) > self.max_bytes:
+            return
+        if key in self._entries:
+            self._drop(key)
+        self._entries[key] = (expires_at, blob)
+        self._bytes += len(blob)
+        while self._bytes > self.max_bytes:
+            self._drop(next(iter(self._entries)))
+            self.stats["evictions"] += 1
+
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, key[:2], f"{key}.pkl")
+
+
+    def _read_disk(self, key: str):
+        path = self._disk_path(key)
+        try:
+            if time.time() > os.path.getmtime(path) + self.ttl:
+                os.remove(path)
+                return None
+            with open(path, "rb") as f:
+                return f.read()
+        except OSError:
+            return None
+
+
+    def _write_disk(self, key: str, blob: bytes):
+        path = self._disk_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(blob)
+        os.replace(tmp, path)
+        self._disk_writes += 1
+        if self.disk_max_bytes and self._disk_writes % 64 == 0:
+            self._prune_disk()
+
+
+    def _prune_disk(self):
+        # Remove the oldest files until the disk tier fits in disk_max_bytes
+        files = []
+        for root, _, names in os.walk(self.disk_dir):
+            for name in names:
+                if name.endswith(".pkl"):
+                    path = os.path.join(root, name)
+                    st = os.stat(path)
+                    files.append((st.st_mtime, st.st_size, path))
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.disk_max_bytes:
+                break
+            os.remove(path)
+            total -= size
+
+
+    async def get_or_compute(self, key: str, compute, coalesce: bool = True):
+        """
+        Return (value, status) for key, where status is "hit", "miss" or "coalesced".
+        compute: zero-argument coroutine function producing the value on a miss.
+        Exceptions are not cached; they reach every caller waiting on that computation.
+        coalesce=False: for a compute that can fail for this caller alone (its own
+        deadline, say). It neither joins nor leads a shared computation, but still
+        reads and fills the cache.
+        """
+        blob = self._get_memory(key)
+        if blob is not None:
+            self.stats["hits"] += 1
+            return pickle.loads(blob), "hit"
+
+        if not coalesce:
+            blob, status = await self._fill(key, compute)
+            self.stats[status] += 1
+            return pickle.loads(blob), "hit" if status == "disk_hits" else "miss"
+
+        task = self._inflight.get(key)
+        if task is not None:
+            self.stats["coalesced"] += 1
+            blob, _ = await asyncio.shield(task)
+            return pickle.loads(blob), "coalesced"
+
+        # The computation runs as its own task so a caller that goes away does
+        # not cancel it for everyone else waiting on the same key.
+        task = asyncio.get_running_loop().create_task(self._fill(key, compute))
+        self._inflight[key] = task
+        task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        blob, status = await asyncio.shield(task)
+        self.stats[status] += 1
+        return pickle.loads(blob), "hit" if status == "disk_hits" else "miss"
+
+
+    async def _fill(self, key: str, compute):
+        if self.disk_dir:
+            blob = await asyncio.to_thread(self._read_disk, key)
+            if blob is not None:
+                self._put_memory(key, blob, time.time() + self.ttl)
+                return blob, "disk_hits"
+        blob = pickle.dumps(await compute(), protocol=pickle.HIGHEST_PROTOCOL)
+        self._put_memory(key, blob, time.time() + self.ttl)
+        if self.disk_dir:
+            await asyncio.to_thread(self._write_disk, key, blob)
+        return blob, "misses"
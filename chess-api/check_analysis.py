@@ -0,0 +1,174 @@
+"""
+Check the /analyze engine pool and analysis cache against a UCI engine.
+Uses uci_standin.py by default, so no engine install is needed; --engine runs
+the same checks on a real one. Exits non-zero if any check fails.
+
+    python check_analysis.py
+    python check_analysis.py --engine stockfish
+"""
+
+import argparse
+import asyncio
+import shlex
+import sys
+import time
+from pathlib import Path
+from analysis import AnalysisCache, EnginePool, normalize_fen
+from batching import Overloaded
+
+START = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR"
+POSITIONS = [
+    "r1bqkbnr/pppp1ppp/2n5/4p3/4P3/5N2/PPPP1PPP/RNBQKB1R",
+    "r1bqkb1r/pppp1ppp/2n2n2/4p3/2B1P3/5N2/PPPP1PPP/RNBQK2R",
+    "rnbqkb1r/pp2pppp/3p1n2/8/3NP3/8/PPP2PPP/RNBQKB1R",
+    "r1bq1rk1/ppp2ppp/2np1n2/2b1p3/2B1P3/2NP1N2/PPP2PPP/R1BQ1RK1",
+]
+
+
+def check_normalize(check):
+    check("board-only FEN gets turn and no castling",
+          normalize_fen(START, "b") == f"{START} b - -")
+    check("move clocks are dropped",
+          normalize_fen(f"{START} w KQkq - 12 40") == f"{START} w KQkq -")
+    check("castling without king or rook at home is removed",
+          normalize_fen("r3k3/8/8/8/8/8/8/4K2R w KQkq -") == "r3k3/8/8/8/8/8/8/4K2R w Kq -")
+    for bad in ("", "8/8/8/8/8/8/8/8", f"{START}/8", "rnbqkbnr/pppppppp/9/8/8/8/PPPPPPPP/RNBQKBNR",
+                "4k3/8/8/8/8/8/8/P3K3", f"{START} x", f"{START} w KQkq e5"):
+        try:
+            normalize_fen(bad)
+            check(f"rejects {bad!r}", False)
+        except ValueError:
+            check(f"rejects {bad!r}", True)
+
+
+async def check_pool(command: str, check):
+    pool = EnginePool(command, size=2, max_queue=2, timeout=30.0)
+    await pool.start()
+    check(f"engine pool starts ({pool.name})", pool.ready)
+    if not pool.ready:
+        print(f"   {pool.error}")
+        return
+    cache = AnalysisCache(100)
+    searches = []
+
+    async def lookup(fen, depth, multipv=1):
+        async def compute():
+            searches.append((fen, depth, multipv))
+            return await pool.analyse(fen, depth, multipv)
+        return await cache.get_or_compute(fen, depth, multipv, compute)
+
+    try:
+        fen = normalize_fen(POSITIONS[0])
+        deep, status = await lookup(fen, 12, multipv=2)
+        check("first request searches", status == "miss" and deep["depth"] == 12 and deep["complete"])
+        check("MultiPV 2 returns two lines", len(deep["lines"]) == 2)
+        shallow, status = await lookup(fen, 6)
+        check("deeper cached result answers a shallower request", status == "hit" and len(searches) == 1)
+        check("... with the deeper lines, truncated to the MultiPV asked for",
+              shallow["lines"] == deep["lines"][:1] and shallow["depth"] == 12)
+        _, status = await lookup(fen, 14)
+        check("a deeper request searches again", status == "miss" and len(searches) == 2)
+        _, status = await lookup(fen, 12, multipv=2)
+        check("... and its result still keeps the earlier MultiPV 2 lines", status == "hit")
+        _, status = await lookup(normalize_fen(POSITIONS[0] + " w - - 5 30"), 6)
+        check("move clocks do not change the cache key", status == "hit")
+
+        fen = normalize_fen(POSITIONS[1])
+        results = await asyncio.gather(lookup(fen, 10), lookup(fen, 8), lookup(fen, 10))
+        check("concurrent requests covered by one search share it",
+              sorted(status for _, status in results) == ["coalesced", "coalesced", "miss"])
+
+        # Two engines, two waiting: a fifth concurrent request is turned away
+        fens = [normalize_fen(p, turn) for p in POSITIONS[2:] for turn in "wb"] + [normalize_fen(START)]
+        outcomes = await asyncio.gather(*(pool.analyse(f, 10) for f in fens), return_exceptions=True)
+        overloaded = [o for o in outcomes if isinstance(o, Overloaded)]
+        check("requests queue for a free engine", sum(isinstance(o, dict) for o in outcomes) == 4)
+        check("a full queue raises Overloaded", len(overloaded) == 1)
+
+        engine = pool._idle.get_nowait()
+        engine.process.kill()
+        engine.process.wait()
+        pool._idle.put_nowait(engine)
+        results = await asyncio.gather(*(pool.analyse(normalize_fen(START), 4) for _ in range(2)))
+        check("a dead engine is replaced", all(r["depth"] == 4 for r in results))
+    finally:
+        await pool.close()
+
+
+async def check_timeout(command: str, check):
+    pool = EnginePool(command, size=1, timeout=0.2)
+    await pool.start()
+    if not pool.ready:
+        return
+    try:
+        start = time.perf_counter()
+        result = await pool.analyse(normalize_fen(START), 60)
+        elapsed = time.perf_counter() - start
+        check(f"a search past the timeout is stopped ({elapsed:.2f}s, depth {result['depth']})",
+              not result["complete"] and result["depth"] < 60 and result["bestmove"] and elapsed < 3.0)
+        cache = AnalysisCache(10)
+        cache.put(normalize_fen(START), result)
+        check("... and cached only for the depth it reached",
+              cache.get(normalize_fen(START), result["depth"], 1) is not None
+              and cache.get(normalize_fen(START), result["depth"] + 1, 1) is None)
+        result = await pool.analyse(normalize_fen(POSITIONS[0]), 3)
+        check("the engine is usable after a stopped search", result["complete"] and result["depth"] == 3)
+    finally:
+        await pool.close()
+
+
+async def check_cancel(command: str, check):
+    pool = EnginePool(command, size=1, timeout=30.0)
+    await pool.start()
+    if not pool.ready:
+        return
+    try:
+        first, other = normalize_fen(POSITIONS[0]), normalize_fen(POSITIONS[1])
+        reference = await pool.analyse(other, 3)
+        # A caller that goes away mid-search (client disconnect, shutdown)
+        task = asyncio.ensure_future(pool.analyse(first, 60))
+        await asyncio.sleep(0.2)
+        task.cancel()
+        start = time.perf_counter()
+        result = await pool.analyse(other, 3)
+        elapsed = time.perf_counter() - start
+        check(f"a cancelled search is stopped before the engine is reused ({elapsed:.2f}s)", elapsed < 2.0)
+        check("... and the next request gets its own position's lines, not the old search's",
+              result["complete"] and result["bestmove"] == reference["bestmove"]
+              and result["lines"] == reference["lines"])
+    finally:
+        await pool.close()
+
+
+def main():
+    standin = Path(__file__).resolve().parent / "uci_standin.py"
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--engine", help="UCI engine command line (default: the stand-in engine)")
+    args = parser.parse_args()
+    command = args.engine or shlex.join([sys.executable, str(standin), "--delay-ms", "2"])
+    # The timeout check needs a search that is still running after 0.2s
+    slow = args.engine or shlex.join([sys.executable, str(standin), "--delay-ms", "50"])
+
+    failures = []
+
+    def check(name: str, ok: bool):
+        print(f"{'ok  ' if ok else 'FAIL'} {name}")
+        if not ok:
+            failures.append(name)
+
+    check_normalize(check)
+    asyncio.run(check_pool(command, check))
+    asyncio.run(check_timeout(slow, check))
+    asyncio.run(check_cancel(slow, check))
+
+    print("\n" + "="*60)
+    print("ANALYSIS CHECKS")
+    print("="*60)
+    print(f"Engine: {command}")
+    print(f"Failed: {len(failures)}")
+    print("="*60)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,89 @@
+"""
+Check that an exported inference backend gives the same FENs as the PyTorch backend.
+Runs both Detectors over every image in a folder (sample-images by default) and
+exits non-zero if more FENs differ than --max-mismatches allows.
+
+    python check_backend_parity.py --backend onnx
+    python check_backend_parity.py --backend openvino --int8 --max-mismatches 2
+"""
+
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+from dotenv import load_dotenv
+from PIL import Image
+from backends import BACKENDS
+from inference import Detector
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
+
+def run_all(detector: Detector, images: list):
+    fens = {}
+    elapsed = 0.0
+    for path in images:
+        start = time.perf_counter()
+        try:
+            result, _, _ = detector.run(Image.open(path), render=())
+            fens[path.name] = result["fen"]
+        except Exception as e:
+            fens[path.name] = f"error: {e}"
+        elapsed += time.perf_counter() - start
+    return fens, elapsed
+
+
+def main():
+    load_dotenv()
+    base_dir = Path(__file__).resolve().parent.parent
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--backend", choices=[b for b in BACKENDS if b != "torch"], required=True)
+    parser.add_argument("--int8", action="store_true", help="compare the INT8-quantized variant")
+    parser.add_argument("--images", default=str(base_dir / "sample-images"))
+    parser.add_argument("--board-model", default=os.getenv("BOARD_MODEL_PATH"))
+    parser.add_argument("--pieces-model", default=os.getenv("PIECES_MODEL_PATH"))
+    parser.add_argument("--board-data", default=os.getenv("BOARD_CALIBRATION_DATA"))
+    parser.add_argument("--pieces-data", default=os.getenv("PIECES_CALIBRATION_DATA"))
+    parser.add_argument("--max-mismatches", type=int, default=0)
+    args = parser.parse_args()
+
+    images = sorted(p for p in Path(args.images).iterdir() if p.suffix.lower() in IMAGE_EXTENSIONS)
+    if not images:
+        print(f"No images found in {args.images}")
+        return 1
+
+    common = dict(
+        board_model_path=args.board_model,
+        pieces_model_path=args.pieces_model,
+        board_conf=float(os.getenv("BOARD_CONF", 0.25)),
+        pieces_conf=float(os.getenv("PIECES_CONF", 0.25)),
+    )
+    reference = Detector(**common)
+    candidate = Detector(**common, backend=args.backend, int8=args.int8,
+                         board_calibration_data=args.board_data, pieces_calibration_data=args.pieces_data)
+
+    print(f"Comparing torch vs {args.backend}{' int8' if args.int8 else ''} on {len(images)} images...")
+    ref_fens, ref_time = run_all(reference, images)
+    cand_fens, cand_time = run_all(candidate, images)
+
+    mismatches = [name for name in ref_fens if ref_fens[name] != cand_fens[name]]
+    for name in mismatches:
+        print(f"MISMATCH {name}")
+        print(f"   torch:          {ref_fens[name]}")
+        print(f"   {args.backend:<15} {cand_fens[name]}")
+
+    print("\n" + "="*60)
+    print("BACKEND PARITY SUMMARY")
+    print("="*60)
+    print(f"Images: {len(images)}")
+    print(f"Matching FENs: {len(images) - len(mismatches)}")
+    print(f"Mismatches: {len(mismatches)} (allowed: {args.max_mismatches})")
+    print(f"torch: {ref_time / len(images) * 1000:.1f} ms/image")
+    print(f"{args.backend}: {cand_time / len(images) * 1000:.1f} ms/image")
+    print("="*60)
+    return 1 if len(mismatches) > args.max_mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
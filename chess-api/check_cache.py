@@ -0,0 +1,85 @@
+"""
+Check the /infer result cache's single-flight rules with stand-in computations.
+Identical requests share one computation, but a request with its own deadline
+never joins or leads one: its DeadlineExceeded must not reach callers without a
+deadline, and theirs must not be cut short by it. Exits non-zero on a failure.
+
+    python check_cache.py
+"""
+
+import asyncio
+import sys
+from batching import DeadlineExceeded
+from cache import ResultCache
+
+
+async def check_coalescing(check):
+    cache = ResultCache(max_bytes=1 << 20)
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return {"fen": "8/8/8/8/8/8/8/8"}
+
+    results = await asyncio.gather(*(cache.get_or_compute("a", compute) for _ in range(3)))
+    check("identical requests share one computation",
+          len(calls) == 1 and sorted(status for _, status in results) == ["coalesced", "coalesced", "miss"])
+    _, status = await cache.get_or_compute("a", compute, coalesce=False)
+    check("a request with a deadline still gets cache hits", status == "hit" and len(calls) == 1)
+
+
+async def check_mixed_deadlines(check):
+    cache = ResultCache(max_bytes=1 << 20)
+
+    async def expired():
+        # What BATCHER.submit raises when the deadline passes before inference starts
+        await asyncio.sleep(0.02)
+        raise DeadlineExceeded("Request deadline passed before inference started.")
+
+    async def slow():
+        await asyncio.sleep(0.05)
+        return {"fen": "8/8/8/8/8/8/8/8"}
+
+    async def later(delay, *args, **kwargs):
+        await asyncio.sleep(delay)
+        return await cache.get_or_compute(*args, **kwargs)
+
+    # The request with a deadline arrives first; the one without must not inherit its 504
+    first, second = await asyncio.gather(
+        cache.get_or_compute("b", expired, coalesce=False), later(0.005, "b", slow), return_exceptions=True)
+    check("a deadline request's DeadlineExceeded stays with it", isinstance(first, DeadlineExceeded))
+    check("... and a later identical request without one still succeeds",
+          not isinstance(second, Exception) and second[1] == "miss")
+
+    # The other way round: a deadline request arriving during a shared computation runs its own
+    first, second = await asyncio.gather(
+        cache.get_or_compute("c", slow), later(0.005, "c", expired, coalesce=False), return_exceptions=True)
+    check("a deadline request does not join a shared computation", isinstance(second, DeadlineExceeded))
+    check("... which completes for its own callers", not isinstance(first, Exception) and first[1] == "miss")
+
+    _, status = await cache.get_or_compute("c", slow)
+    check("the shared result is cached", status == "hit")
+
+
+def main():
+    failures = []
+
+    def check(name: str, ok: bool):
+        print(f"{'ok  ' if ok else 'FAIL'} {name}")
+        if not ok:
+            failures.append(name)
+
+    asyncio.run(check_coalescing(check))
+    asyncio.run(check_mixed_deadlines(check))
+
+    print("\n" + "="*60)
+    print("RESULT CACHE CHECKS")
+    print("="*60)
+    print(f"Failed: {len(failures)}")
+    print("="*60)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
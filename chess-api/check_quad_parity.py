@@ -0,0 +1,100 @@
+"""
+Check that mask-resolution board quad fitting matches the full-resolution fit.
+Runs find_and_warp_board with quad_fit="image" (reference) and quad_fit="mask"
+over every image in a folder (sample-images by default) and exits non-zero if a
+corner moves by more than --tolerance of the board diagonal.
+
+    python check_quad_parity.py
+    python check_quad_parity.py --refine-corners --tolerance 0.005
+"""
+
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+import numpy as np
+from dotenv import load_dotenv
+from PIL import Image
+from inference import Detector
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
+
+def fit_all(detector: Detector, images: list):
+    quads = {}
+    elapsed = 0.0
+    for path in images:
+        bgr = detector._pil_to_bgr(Image.open(path))
+        start = time.perf_counter()
+        try:
+            _, quad, _ = detector.find_and_warp_board(bgr)
+            quads[path.name] = quad
+        except Exception as e:
+            quads[path.name] = e
+        elapsed += time.perf_counter() - start
+    return quads, elapsed
+
+
+def main():
+    load_dotenv()
+    base_dir = Path(__file__).resolve().parent.parent
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--images", default=str(base_dir / "sample-images"))
+    parser.add_argument("--board-model", default=os.getenv("BOARD_MODEL_PATH"))
+    parser.add_argument("--pieces-model", default=os.getenv("PIECES_MODEL_PATH"))
+    parser.add_argument("--refine-corners", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.01,
+                        help="max corner distance as a fraction of the board diagonal")
+    args = parser.parse_args()
+
+    images = sorted(p for p in Path(args.images).iterdir() if p.suffix.lower() in IMAGE_EXTENSIONS)
+    if not images:
+        print(f"No images found in {args.images}")
+        return 1
+
+    common = dict(
+        board_model_path=args.board_model,
+        pieces_model_path=args.pieces_model,
+        board_conf=float(os.getenv("BOARD_CONF", 0.25)),
+    )
+    reference = Detector(**common, quad_fit="image")
+    candidate = Detector(**common, quad_fit="mask", refine_corners=args.refine_corners)
+    # Same weights: share them instead of loading twice
+    candidate.board_model, candidate.pieces_model = reference.board_model, reference.pieces_model
+
+    print(f"Comparing board quads on {len(images)} images...")
+    ref_quads, ref_time = fit_all(reference, images)
+    cand_quads, cand_time = fit_all(candidate, images)
+
+    failures = []
+    worst = 0.0
+    for name, ref in ref_quads.items():
+        cand = cand_quads[name]
+        if isinstance(ref, Exception) or isinstance(cand, Exception):
+            if type(ref) is not type(cand):
+                failures.append(name)
+                print(f"MISMATCH {name}: image={ref if isinstance(ref, Exception) else 'quad'}, "
+                      f"mask={cand if isinstance(cand, Exception) else 'quad'}")
+            continue
+        diagonal = float(np.linalg.norm(ref[2] - ref[0]))
+        error = float(np.linalg.norm(ref - cand, axis=1).max()) / max(diagonal, 1.0)
+        worst = max(worst, error)
+        if error > args.tolerance:
+            failures.append(name)
+            print(f"MISMATCH {name}: max corner error {error:.4f} of the diagonal")
+
+    print("\n" + "="*60)
+    print("QUAD PARITY SUMMARY")
+    print("="*60)
+    print(f"Images: {len(images)}")
+    print(f"Within tolerance ({args.tolerance}): {len(images) - len(failures)}")
+    print(f"Worst corner error: {worst:.4f} of the diagonal")
+    print(f"image fit: {ref_time / len(images) * 1000:.1f} ms/image")
+    print(f"mask fit: {cand_time / len(images) * 1000:.1f} ms/image")
+    print("="*60)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,124 @@
+from __future__ import annotations
+from io import BytesIO
+import cv2
+import numpy as np
+from PIL import Image, ImageOps
+
+# cv2.imdecode flags for each DCT-domain downscale factor
+_REDUCED_FLAGS = {
+    1: cv2.IMREAD_COLOR,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+
+
+class ImageTooLarge(ValueError):
+    """Raised when an upload has more pixels than the configured maximum."""
+
+
+class ImageSource:
+    """
+    One input image, decoded at the resolutions the pipeline asks for.
+    Only the header is read up front (size, EXIF orientation, pixel limit).
+    JPEGs are decoded with libjpeg DCT scaling (1/2, 1/4, 1/8 of the size), so a
+    stage that needs fewer pixels, like board segmentation, never pays for a
+    full-resolution decode. Other formats are decoded once and resized.
+    cv2.imdecode applies the EXIF orientation, so every version is upright.
+    Formats OpenCV cannot read (GIF, for one) are decoded with PIL instead.
+    """
+    def __init__(self, content: bytes = None, bgr: np.ndarray = None, max_pixels: int = None):
+        self.content = content
+        self._cache = {}  # downscale factor -> BGR image
+        if bgr is not None:
+            self.width, self.height = bgr.shape[1], bgr.shape[0]
+            self.is_jpeg = False
+            self._cache[1] = bgr
+        else:
+            with Image.open(BytesIO(content)) as img:
+                width, height = img.size
+                self.is_jpeg = img.format == "JPEG"
+                orientation = img.getexif().get(0x0112, 1)
+            # EXIF orientations 5-8 rotate by 90 degrees
+            self.width, self.height = (height, width) if orientation in (5, 6, 7, 8) else (width, height)
+        if max_pixels and self.width * self.height > max_pixels:
+            raise ImageTooLarge(f"Image has {self.width * self.height} pixels; the limit is {max_pixels}.")
+
+
+    @classmethod
+    def from_image(cls, image, max_pixels: int = None) -> "ImageSource":
+        """Wrap an ImageSource, encoded bytes, a PIL image or a BGR array."""
+        if isinstance(image, ImageSource):
+            return image
+        if isinstance(image, (bytes, bytearray)):
+            return cls(content=bytes(image), max_pixels=max_pixels)
+        if isinstance(image, np.ndarray):
+            return cls(bgr=image, max_pixels=max_pixels)
+        return cls(bgr=cv2.cvtColor(np.array(image.convert('RGB')), cv2.COLOR_RGB2BGR), max_pixels=max_pixels)
+
+
+    def __getstate__(self):
+        # Ship only the encoded bytes to worker processes, not decoded copies
+        state = self.__dict__.copy()
+        if self.content is not None:
+            state["_cache"] = {}
+        return state
+
+
+    def full(self) -> np.ndarray:
+        return self.get(1.0)[0]
+
+
+    def get(self, min_scale: float):
+        """
+        Return (bgr, (sx, sy)): the smallest available decode that is at least
+        min_scale of the full size, and its actual per-axis scale.
+        """
+        factor = 1
+        for f in (8, 4, 2):
+            if 1.0 / f >= min_scale:
+                factor = f
+                break
+        bgr = self._decode(factor)
+        return bgr, (bgr.shape[1] / self.width, bgr.shape[0] / self.height)
+
+
+    def for_size(self, longest_side: int):
+        """get() for a version whose longest side is at least longest_side pixels."""
+        return self.get(longest_side / max(self.width, self.height))
+
+
+    def _decode(self, factor: int) -> np.ndarray:
+        if factor in self._cache:
+            return self._cache[factor]
+        if self.content is None or not self.is_jpeg:
+            # Not DCT-scalable: decode (or reuse) the full image and resize it
+            full = self._cache.get(1)
+            if full is None:
+                full = self._imdecode(cv2.IMREAD_COLOR)
+                self._cache[1] = full
+            if factor == 1:
+                return full
+            size = (-(-self.width // factor), -(-self.height // factor))
+            bgr = cv2.resize(full, size, interpolation=cv2.INTER_AREA)
+        else:
+            bgr = self._imdecode(_REDUCED_FLAGS[factor])
+        self._cache[factor] = bgr
+        return bgr
+
+
+    def _imdecode(self, flags: int) -> np.ndarray:
+        bgr = cv2.imdecode(np.frombuffer(self.content, dtype=np.uint8), flags)
+        if bgr is None:
+            # Full size whatever the flags; get() reports the scale it actually has
+            bgr = self._pil_decode()
+        return bgr
+
+
+    def _pil_decode(self) -> np.ndarray:
+        try:
+            with Image.open(BytesIO(self.content)) as img:
+                rgb = np.asarray(ImageOps.exif_transpose(img).convert("RGB"))
+        except Exception:
+            raise ValueError("Could not decode image.")
+        return cv2.cvtColor(rgb, cv2.COLOR_RGB2BGR)
@@ -0,0 +1,288 @@
+"""
+End-to-end FEN accuracy of the Detector pipeline on a labelled image set.
+Ground truth is a CSV next to the images (image,fen[,flip_ranks]; only the board
+field of the FEN is compared). Images are spread over a pool of Detector workers
+(see batching.make_executor) and the report has exact-FEN accuracy, per-square
+accuracy, a confusion matrix over SQUARE_CLASSES and throughput.
+
+Board-stage outputs (quad and warped board) are cached on disk, keyed by the
+image's hash and only the settings they depend on, so re-running with another
+pieces model, engine or PIECES_CONF skips segmentation entirely.
+
+    python evaluate.py --images ../data/test
+    python evaluate.py --images ../data/test --pieces-model models/pieces_v3.pt --pieces-conf 0.4
+    python evaluate.py --images ../data/test --engine squares --workers 4 --output eval.json
+"""
+
+import argparse
+import csv
+import hashlib
+import json
+import os
+import sys
+import time
+from pathlib import Path
+import numpy as np
+from dotenv import load_dotenv
+from batching import make_executor, plan_workers, start_workers, worker_detector
+from decode import ImageSource
+from inference import Detector, PIECES_ENGINES
+from labels import LABEL_TO_FEN, SQUARE_CLASSES
+
+# Detector.version fields the board stage (segmentation, quad fit, warp) depends on
+BOARD_STAGE_KEYS = ("board_model", "board_conf", "backend", "int8", "quad_fit", "refine_corners", "pieces_imgsz")
+FEN_TO_CLASS = {fen: SQUARE_CLASSES.index(name) for name, fen in LABEL_TO_FEN.items()}
+EMPTY = SQUARE_CLASSES.index("empty")
+CHUNK_SIZE = 8  # images per worker task; their boards share the pieces model call
+
+
+def fen_to_classes(fen: str) -> np.ndarray:
+    """Board field of a FEN -> 8x8 SQUARE_CLASSES indices, rank 8 first."""
+    ranks = fen.split()[0].split("/")
+    if len(ranks) != 8:
+        raise ValueError(f"Not a FEN board: {fen}")
+    board = np.full((8, 8), EMPTY, dtype=np.int64)
+    for r, rank in enumerate(ranks):
+        f = 0
+        for ch in rank:
+            if ch.isdigit():
+                f += int(ch)
+            else:
+                board[r, min(f, 7)] = FEN_TO_CLASS[ch]
+                f += 1
+        if f != 8:
+            raise ValueError(f"Rank {8 - r} of {fen} does not have 8 squares")
+    return board
+
+
+def load_truth(path: Path):
+    """Rows of the ground-truth CSV as (image name, fen, flip_ranks)."""
+    rows = []
+    with open(path, newline="") as f:
+        for row in csv.reader(f):
+            if not row or row[0].strip().lower() in ("image", "") or row[0].startswith("#"):
+                continue
+            flip = len(row) > 2 and row[2].strip().lower() in ("1", "true", "yes")
+            rows.append((row[0].strip(), row[1].strip(), flip))
+    return rows
+
+
+def board_stage_key(detector: Detector) -> str:
+    settings = {key: detector.version[key] for key in BOARD_STAGE_KEYS}
+    return hashlib.sha256(json.dumps(settings, sort_keys=True).encode()).hexdigest()[:16]
+
+
+def _board_stage(detector: Detector, content: bytes, cache_path: Path):
+    """(quad, warped board) for an image, from the cache when possible. Raises if no board is found."""
+    if cache_path is not None and cache_path.exists():
+        cached = np.load(cache_path)
+        if not cached["quad"].size:
+            raise RuntimeError(str(cached["error"]))
+        return cached["quad"], cached["warp"], True
+    src = ImageSource(content)
+    seg, scale = src.for_size(detector.board_imgsz)
+    found = detector.find_boards([seg])[0]
+    if isinstance(found, Exception):
+        if cache_path is not None:
+            # Failures are cached too, so a bad image does not cost a segmentation every run
+            cache_path.parent.mkdir(parents=True, exist_ok=True)
+            np.savez(cache_path, quad=np.zeros(0), warp=np.zeros(0), error=str(found))
+        raise found
+    quad = found[0] / np.array(scale, dtype=np.float32)
+    warp = detector._warp_source(src, quad, detector.pieces_imgsz)
+    if cache_path is not None:
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = cache_path.with_name(cache_path.stem + ".tmp.npz")
+        np.savez(tmp, quad=quad, warp=warp, error="")
+        os.replace(tmp, cache_path)
+    return quad, warp, False
+
+
+def evaluate_chunk(items: list, cache_dir: str, engine: str):
+    """
+    Run one chunk of (path, flip_ranks) items on the pool worker's Detector.
+    Returns one dict per item: predicted SQUARE_CLASSES board (rank 8 first) and
+    fen, or error, plus whether the board stage came from the cache and stage times.
+    """
+    detector = worker_detector()
+    stage_dir = Path(cache_dir) / board_stage_key(detector) if cache_dir else None
+    out, warps = [], []
+    for path, flip_ranks in items:
+        result = {"image": Path(path).name, "times": {}}
+        out.append(result)
+        try:
+            start = time.perf_counter()
+            content = Path(path).read_bytes()
+            digest = hashlib.sha256(content).hexdigest()
+            cache_path = stage_dir / digest[:2] / f"{digest}.npz" if stage_dir else None
+            _, warp, cached = _board_stage(detector, content, cache_path)
+            result["board_cached"] = cached
+            result["times"]["board"] = time.perf_counter() - start
+            warps.append((result, warp, flip_ranks))
+        except Exception as e:
+            result["error"] = str(e)
+
+    start = time.perf_counter()
+    if engine == "squares":
+        found = [detections for detections, _ in detector.classify_squares_batch([w for _, w, _ in warps])]
+    else:
+        found = detector.detect_pieces_batch([w for _, w, _ in warps])
+    elapsed = time.perf_counter() - start
+    for (result, _, flip_ranks), detections in zip(warps, found):
+        board, _ = detector._assign_squares(detections)
+        result["fen"] = detector._board_to_fen(board, flip_ranks)
+        result["classes"] = fen_to_classes(result["fen"]).tolist()
+        # The pieces model call is shared by the chunk
+        result["times"]["pieces"] = elapsed / len(warps)
+    return out
+
+
+def summarize(results: list, truth: dict):
+    """Accuracy metrics over results, given {image name: 8x8 true classes}."""
+    n = len(SQUARE_CLASSES)
+    confusion = np.zeros((n, n), dtype=np.int64)  # [true, predicted]
+    exact = evaluated = failed = 0
+    for result in results:
+        expected = truth[result["image"]]
+        if "error" in result:
+            failed += 1
+            continue
+        predicted = np.array(result["classes"])
+        np.add.at(confusion, (expected.ravel(), predicted.ravel()), 1)
+        result["correct"] = bool((predicted == expected).all())
+        exact += result["correct"]
+        evaluated += 1
+    squares = confusion.sum()
+    per_class = {
+        name: {
+            "precision": round(float(confusion[i, i] / confusion[:, i].sum()), 4) if confusion[:, i].sum() else None,
+            "recall": round(float(confusion[i, i] / confusion[i].sum()), 4) if confusion[i].sum() else None,
+            "support": int(confusion[i].sum()),
+        }
+        for i, name in enumerate(SQUARE_CLASSES)
+    }
+    return {
+        "images": len(results),
+        "failed": failed,
+        # Images without a detected board count as wrong
+        "exact_fen_accuracy": round(exact / len(results), 4) if results else None,
+        "exact_fen_accuracy_detected": round(exact / evaluated, 4) if evaluated else None,
+        "square_accuracy": round(float(np.trace(confusion) / squares), 4) if squares else None,
+        "per_class": per_class,
+        "confusion": confusion.tolist(),
+    }
+
+
+def print_confusion(confusion: np.ndarray):
+    names = [name if name != "empty" else "." for name in SQUARE_CLASSES]
+    print("   true \\ pred " + "".join(f"{name:>7}" for name in names))
+    for name, row in zip(names, confusion):
+        print(f"   {name:<12} " + "".join(f"{v:>7}" for v in row))
+
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--images", required=True, help="folder of labelled images")
+    parser.add_argument("--truth", default=None, help="ground-truth CSV (default: <images>/fens.csv)")
+    parser.add_argument("--board-model", default=os.getenv("BOARD_MODEL_PATH"))
+    parser.add_argument("--pieces-model", default=os.getenv("PIECES_MODEL_PATH"))
+    parser.add_argument("--squares-model", default=os.getenv("SQUARES_MODEL_PATH"))
+    parser.add_argument("--backend", default=os.getenv("MODEL_BACKEND", "torch"))
+    parser.add_argument("--board-conf", type=float, default=float(os.getenv("BOARD_CONF", 0.25)))
+    parser.add_argument("--pieces-conf", type=float, default=float(os.getenv("PIECES_CONF", 0.25)))
+    parser.add_argument("--engine", choices=PIECES_ENGINES, default=os.getenv("PIECES_ENGINE", "detect"))
+    parser.add_argument("--workers", default="auto", help="process workers, or auto")
+    parser.add_argument("--executor", choices=["process", "thread"], default="process")
+    parser.add_argument("--cache-dir", default=".eval-cache", help="board-stage cache")
+    parser.add_argument("--no-cache", action="store_true")
+    parser.add_argument("--limit", type=int, default=0, help="only use the first N images")
+    parser.add_argument("--output", help="write metrics and per-image results as JSON")
+    args = parser.parse_args()
+
+    image_dir = Path(args.images)
+    truth_path = Path(args.truth) if args.truth else image_dir / "fens.csv"
+    if not truth_path.exists():
+        print(f"No ground truth at {truth_path} (CSV: image,fen[,flip_ranks])")
+        return 1
+    rows = [row for row in load_truth(truth_path) if (image_dir / row[0]).exists()]
+    if args.limit:
+        rows = rows[:args.limit]
+    if not rows:
+        print(f"No labelled images found in {image_dir}")
+        return 1
+    truth = {name: fen_to_classes(fen) for name, fen, _ in rows}
+
+    detector_kwargs = dict(
+        board_model_path=args.board_model,
+        pieces_model_path=args.pieces_model,
+        board_conf=args.board_conf,
+        pieces_conf=args.pieces_conf,
+        backend=args.backend,
+        squares_model_path=args.squares_model,
+        pieces_engine=args.engine,
+    )
+    detector = Detector(**detector_kwargs)
+    workers, threads = plan_workers(args.workers)
+    workers = min(workers, -(-len(rows) // CHUNK_SIZE))
+    executor = make_executor(args.executor, workers, detector_kwargs, detector=detector, threads=threads)
+    cache_dir = None if args.no_cache else str(Path(args.cache_dir).resolve())
+
+    print(f"Evaluating {len(rows)} images on {workers} {args.executor} workers ({threads} threads each)...")
+    items = [(str(image_dir / name), flip) for name, _, flip in rows]
+    chunks = [items[i:i + CHUNK_SIZE] for i in range(0, len(items), CHUNK_SIZE)]
+    with executor:
+        # Load and warm up every worker before the clock starts
+        start_workers(executor, workers)
+        start = time.perf_counter()
+        results = [r for out in executor.map(evaluate_chunk, chunks, [cache_dir] * len(chunks),
+                                              [args.engine] * len(chunks)) for r in out]
+        wall = time.perf_counter() - start
+
+    metrics = summarize(results, truth)
+    cached = sum(1 for r in results if r.get("board_cached"))
+    board_ms = [r["times"]["board"] * 1000 for r in results if "board" in r["times"] and not r.get("board_cached")]
+    pieces_ms = [r["times"]["pieces"] * 1000 for r in results if "pieces" in r["times"]]
+    metrics.update(
+        wall_seconds=round(wall, 3),
+        images_per_second=round(len(results) / wall, 2) if wall > 0 else None,
+        board_cache_hits=cached,
+        board_stage_key=board_stage_key(detector),
+        models=detector.version,
+    )
+
+    print("\n" + "="*60)
+    print("EVALUATION SUMMARY")
+    print("="*60)
+    print(f"Images:               {metrics['images']} ({metrics['failed']} without a board)")
+    print(f"Exact FEN accuracy:   {metrics['exact_fen_accuracy'] * 100:.2f}%"
+          + (f" ({metrics['exact_fen_accuracy_detected'] * 100:.2f}% of detected boards)"
+             if metrics["exact_fen_accuracy_detected"] is not None else ""))
+    if metrics["square_accuracy"] is not None:
+        print(f"Square accuracy:      {metrics['square_accuracy'] * 100:.2f}%")
+    print(f"Throughput:           {metrics['images_per_second']} images/s ({metrics['wall_seconds']} s)")
+    print(f"Board stage:          {cached} cached"
+          + (f", {len(board_ms)} computed at {np.mean(board_ms):.1f} ms mean" if board_ms else ""))
+    if pieces_ms:
+        print(f"Pieces stage:         {np.mean(pieces_ms):.1f} ms mean per board ({args.engine})")
+    print("\nPer class (precision / recall / support):")
+    for name, stats in metrics["per_class"].items():
+        if stats["support"] or stats["precision"] is not None:
+            p = f"{stats['precision'] * 100:.1f}%" if stats["precision"] is not None else "-"
+            r = f"{stats['recall'] * 100:.1f}%" if stats["recall"] is not None else "-"
+            print(f"   {name:<6} {p:>7} {r:>7} {stats['support']:>7}")
+    print("\nConfusion matrix (squares):")
+    print_confusion(np.array(metrics["confusion"]))
+    print("="*60)
+
+    if args.output:
+        for r in results:
+            r.pop("classes", None)
+            r["times"] = {k: round(v * 1000, 3) for k, v in r["times"].items()}
+        Path(args.output).write_text(json.dumps({"metrics": metrics, "results": results}, indent=2))
+        print(f"Results written to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
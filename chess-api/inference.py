@@ -1,23 +1,163 @@
 from __future__ import annotations
+import hashlib
 import io
 import os
+import re
 import math
+import time
 import cv2
 import numpy as np
 from PIL import Image
-from ultralytics import YOLO
-from labels import LABEL_TO_FEN, INDEX_TO_NAME
+from backends import load_model
+from decode import ImageSource
+from tracking import BoardTracker
+from labels import LABEL_TO_FEN, INDEX_TO_NAME, SQUARE_CLASSES
 
 
-WARP_SIZE = 2048 # square warp size - larger for better visualization
+WARP_SIZE = 2048 # board coordinate space for detections, and the full overlay resolution
+
+# Lookup tables for vectorized square assignment (see Detector._assign_squares)
+_PIECE_INDEX = {name: i for i, name in enumerate(INDEX_TO_NAME) if name in LABEL_TO_FEN}
+_FEN_CHARS = np.array([LABEL_TO_FEN.get(name, "") for name in INDEX_TO_NAME])
+_EMPTY = SQUARE_CLASSES.index("empty")
+
+# Images Detector.run can render on request, and how they can be encoded
+RENDER_ALL = ("overlay", "debug")
+IMAGE_FORMATS = {"png": ".png", "jpeg": ".jpg", "webp": ".webp"}
+IMAGE_MIME_TYPES = {"png": "image/png", "jpeg": "image/jpeg", "webp": "image/webp"}
+
+# With max_boards > 1, masks smaller than this fraction of the largest one are
+# ignored, as are masks mostly covered by a larger board already kept
+MIN_BOARD_AREA_RATIO = 0.05
+MAX_BOARD_OVERLAP = 0.5
+
+# Pipeline stages Detector.run times (in the order they run)
+STAGES = ("decode", "track", "segment", "warp", "pieces", "fen", "debug", "overlay", "encode")
+
+# How pieces are found on the warped board: "detect" runs the YOLO piece detector,
+# "squares" classifies the 64 square crops with a small classifier
+PIECES_ENGINES = ("detect", "squares")
+
+
+def encode_image(img: np.ndarray, fmt: str = "png", quality: int = 90) -> bytes:
+    """
+    Encode a BGR image as PNG, JPEG or WebP bytes.
+    quality (1-100) applies to JPEG and WebP; PNG is always lossless.
+    """
+    if fmt not in IMAGE_FORMATS:
+        raise ValueError(f"Unsupported image format: {fmt}")
+    quality = max(1, min(100, int(quality)))
+    params = []
+    if fmt == "jpeg":
+        params = [cv2.IMWRITE_JPEG_QUALITY, quality]
+    elif fmt == "webp":
+        params = [cv2.IMWRITE_WEBP_QUALITY, quality]
+    ok, buffer = cv2.imencode(IMAGE_FORMATS[fmt], img, params)
+    if not ok:
+        raise RuntimeError(f"Failed to encode {fmt} image.")
+    return buffer.tobytes()
+
+
+def _file_digest(path: str) -> str:
+    # Content hash of a weights file; falls back to the name for hub models that are not local files
+    if not path or not os.path.isfile(path):
+        return str(path)
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
 
 
 class Detector:
-    def __init__(self, board_model_path: str, pieces_model_path: str, board_conf: float=0.25, pieces_conf: float=0.25):
-        self.board_model = YOLO(board_model_path)
-        self.pieces_model = YOLO(pieces_model_path)
+    def __init__(self, board_model_path: str, pieces_model_path: str, board_conf: float=0.25, pieces_conf: float=0.25,
+                 pieces_imgsz: int = None, backend: str = "torch", int8: bool = False,
+                 board_calibration_data: str = None, pieces_calibration_data: str = None,
+                 quad_fit: str = "mask", refine_corners: bool = False,
+                 squares_model_path: str = None, pieces_engine: str = "detect",
+                 cascade: bool = False, cascade_imgsz: int = 320, cascade_conf: float = 0.6,
+                 cascade_compete: float = 0.25, cascade_max_squares: int = 16, cascade_floor: float = 0.05):
+        # backend/int8 pick how both models run (see backends.load_model); the
+        # calibration data (dataset yamls) is only used for OpenVINO INT8 exports
+        self.board_model = load_model(board_model_path, backend, int8, task="segment",
+                                      data=board_calibration_data)
+        self.pieces_model = load_model(pieces_model_path, backend, int8, task="detect",
+                                       imgsz=pieces_imgsz, data=pieces_calibration_data)
+        # Optional square classifier for the "squares" engine: an ultralytics
+        # classification model whose class names are SQUARE_CLASSES (pieces + "empty")
+        self.squares_model = None
+        if squares_model_path:
+            self.squares_model = load_model(squares_model_path, backend, int8, task="classify")
+            index = {name: i for i, name in self.squares_model.names.items()}
+            missing = [name for name in SQUARE_CLASSES if name not in index]
+            if missing:
+                raise ValueError(f"Squares model is missing classes: {', '.join(missing)}")
+            self._squares_order = np.array([index[name] for name in SQUARE_CLASSES])
+        if pieces_engine not in PIECES_ENGINES:
+            raise ValueError(f"Unknown pieces_engine: {pieces_engine}")
+        if pieces_engine == "squares" and self.squares_model is None:
+            raise ValueError("pieces_engine 'squares' needs squares_model_path.")
+        self.pieces_engine = pieces_engine
         self.board_conf = float(board_conf)
         self.pieces_conf = float(pieces_conf)
+        # Boards are warped straight to the piece model's input size so predict() never resamples
+        if pieces_imgsz is None:
+            pieces_imgsz = self.pieces_model.overrides.get("imgsz") or 640
+        if isinstance(pieces_imgsz, (list, tuple)):
+            pieces_imgsz = max(pieces_imgsz)
+        self.pieces_imgsz = int(pieces_imgsz)
+        # Images are decoded at (at least) this size for segmentation
+        board_imgsz = self.board_model.overrides.get("imgsz") or 640
+        if isinstance(board_imgsz, (list, tuple)):
+            board_imgsz = max(board_imgsz)
+        self.board_imgsz = int(board_imgsz)
+        # quad_fit: "mask" fits the board quad at mask resolution, "image" on the
+        # mask resized to the full image (slower; kept as the reference)
+        if quad_fit not in ("mask", "image"):
+            raise ValueError(f"Unknown quad_fit: {quad_fit}")
+        self.quad_fit = quad_fit
+        self.refine_corners = bool(refine_corners)
+        # Two-pass cascade for the "detect" engine (see detect_pieces_cascade_batch);
+        # cascade is the default, jobs can turn it on or off
+        self.cascade = bool(cascade)
+        self.cascade_imgsz = int(cascade_imgsz)
+        self.cascade_conf = float(cascade_conf)
+        self.cascade_compete = float(cascade_compete)
+        self.cascade_max_squares = int(cascade_max_squares)
+        self.cascade_floor = float(cascade_floor)
+        self.warmed_up = False
+        # Identifies the weights and settings results depend on (e.g. for result caching)
+        self.version = {
+            "board_model": _file_digest(board_model_path),
+            "pieces_model": _file_digest(pieces_model_path),
+            "board_conf": self.board_conf,
+            "pieces_conf": self.pieces_conf,
+            "pieces_imgsz": self.pieces_imgsz,
+            "backend": backend,
+            "int8": bool(int8),
+            "quad_fit": quad_fit,
+            "refine_corners": self.refine_corners,
+            "squares_model": _file_digest(squares_model_path) if squares_model_path else None,
+            "pieces_engine": pieces_engine,
+            "cascade": [self.cascade, self.cascade_imgsz, self.cascade_conf, self.cascade_compete,
+                        self.cascade_max_squares, self.cascade_floor],
+        }
+
+
+    def warmup(self):
+        """
+        Run one synthetic inference through both models so lazy graph and runtime
+        initialization happens now rather than on the first real request.
+        """
+        if self.warmed_up:
+            return
+        blank = np.zeros((self.board_imgsz, self.board_imgsz, 3), dtype=np.uint8)
+        self.board_model.predict(source=blank, conf=self.board_conf, verbose=False)
+        blank = np.zeros((self.pieces_imgsz, self.pieces_imgsz, 3), dtype=np.uint8)
+        self.detect_pieces(blank)
+        if self.squares_model is not None:
+            self.classify_squares_batch([blank])
+        self.warmed_up = True
 
 
     @staticmethod
@@ -40,20 +180,86 @@ class Detector:
     def find_and_warp_board(self, bgr: np.ndarray):
         # Run segmentation; take best mask for class 'board'
         res = self.board_model.predict(source=bgr, conf=self.board_conf, verbose=False)[0]
+        return self._warp(bgr, self._quad_from_result(bgr, res), self.pieces_imgsz)
+
+
+    def find_boards(self, bgrs: list, max_boards: list = None):
+        """
+        Batched board segmentation: all images go through board_model in one call.
+        max_boards: per image, how many boards to return (default 1 each).
+        Returns, per image, a list of quads (TL, TR, BR, BL in that image's pixels),
+        largest board first, or the exception raised for it.
+        """
+        if not bgrs:
+            return []
+        max_boards = max_boards or [1] * len(bgrs)
+        results = self.board_model.predict(source=list(bgrs), conf=self.board_conf, verbose=False)
+        out = []
+        for bgr, res, limit in zip(bgrs, results, max_boards):
+            try:
+                out.append(self._quads_from_result(bgr, res, limit))
+            except Exception as e:
+                out.append(e)
+        return out
+
+
+    def _quad_from_result(self, bgr: np.ndarray, res):
+        return self._quads_from_result(bgr, res)[0]
+
+
+    def _quads_from_result(self, bgr: np.ndarray, res, max_boards: int = 1):
         if res.masks is None or len(res.masks) == 0:
             raise RuntimeError("No board mask detected.")
-        # choose largest-area mask
-        areas = [mask_data.cpu().numpy().sum() for mask_data in res.masks.data]
-        idx = int(np.argmax(areas))
-        mask = res.masks.data[idx].cpu().numpy() # (H_mask, W_mask) 0/1
+        areas = res.masks.data.sum(dim=(1, 2))
+        if max_boards <= 1:
+            # choose largest-area mask (on the tensor; only that mask is copied to the CPU)
+            return [self._fit_quad(bgr, res.masks.data[int(areas.argmax())].cpu().numpy())]
         
-        # Resize mask to original image dimensions
+        # Largest masks first, skipping small ones and duplicates of boards already kept
+        areas = areas.cpu().numpy()
+        kept = []
+        for idx in np.argsort(-areas, kind="stable"):
+            if len(kept) == max_boards or areas[idx] < MIN_BOARD_AREA_RATIO * areas.max():
+                break
+            mask = res.masks.data[int(idx)].cpu().numpy() > 0.5
+            if any((mask & other).sum() > MAX_BOARD_OVERLAP * mask.sum() for other in kept):
+                continue
+            kept.append(mask)
+        return [self._fit_quad(bgr, mask.astype(np.float32)) for mask in kept]
+
+
+    def _fit_quad(self, bgr: np.ndarray, mask: np.ndarray):
+        # mask: (H_mask, W_mask) 0/1 at model resolution, letterboxed like the input
         h, w = bgr.shape[:2]
-        mask = cv2.resize(mask, (w, h), interpolation=cv2.INTER_NEAREST)
-        mask = (mask > 0.5).astype(np.uint8) * 255  # Binarize and scale to 0-255
+        if self.quad_fit == "image":
+            # Reference path: fit the quad on the mask resized to the full image
+            mask = self._unletterbox(mask, (h, w))
+            mask = (mask > 0.5).astype(np.uint8) * 255  # Binarize and scale to 0-255
+            box = self._quad_from_mask(mask, kernel_size=5)
+        else:
+            # Fit at mask resolution (dropping the letterbox padding, which batched
+            # inputs always have) and only map the four corners back to the image
+            gain, pad_x, pad_y, (top, bottom, left, right) = self._letterbox_geometry(mask.shape, (h, w))
+            mask = (mask[top:bottom, left:right] > 0.5).astype(np.uint8) * 255
+            box = self._quad_from_mask(mask, kernel_size=3).astype(np.float32)
+            box[:, 0] = (box[:, 0] + left + 0.5 - pad_x) / gain - 0.5
+            box[:, 1] = (box[:, 1] + top + 0.5 - pad_y) / gain - 0.5
+            box[:, 0] = np.clip(box[:, 0], 0, w - 1)
+            box[:, 1] = np.clip(box[:, 1], 0, h - 1)
+            if self.refine_corners:
+                box = self._refine_corners(bgr, box, window=int(np.clip(round(1 / gain), 2, 15)))
         
+        return self._order_quad(box.astype(np.float32))
+
+
+    @staticmethod
+    def _quad_from_mask(mask: np.ndarray, kernel_size: int):
+        """
+        Fit a quadrilateral to a binary (0/255) board mask.
+        Returns four unordered (x, y) corner points in mask pixel coordinates.
+        """
         # Clean up mask with morphological operations
-        kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (5, 5))
+        kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (kernel_size, kernel_size))
         mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, kernel)
         mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, kernel)
 
@@ -94,163 +300,369 @@ class Detector:
             n = len(sorted_points)
             indices = [int(i * n / 4) for i in range(4)]
             box = sorted_points[indices]
-        
-        box = self._order_quad(box.astype(np.float32))
+        return box
+
+
+    @staticmethod
+    def _refine_corners(bgr: np.ndarray, box: np.ndarray, window: int):
+        """
+        Sub-pixel corner refinement on the original image. Each corner is refined
+        inside a small grayscale crop around it, so the full image is never converted.
+        window: half-size of the search window, about one mask pixel in image pixels.
+        """
+        h, w = bgr.shape[:2]
+        r = window * 3
+        criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 20, 0.05)
+        refined = box.copy()
+        for i, (x, y) in enumerate(box):
+            x0, y0 = max(0, int(x) - r), max(0, int(y) - r)
+            x1, y1 = min(w, int(x) + r + 1), min(h, int(y) + r + 1)
+            if x1 - x0 <= 2 * window + 1 or y1 - y0 <= 2 * window + 1:
+                continue
+            roi = cv2.cvtColor(bgr[y0:y1, x0:x1], cv2.COLOR_BGR2GRAY)
+            pt = np.array([[[x - x0, y - y0]]], dtype=np.float32)
+            cv2.cornerSubPix(roi, pt, (window, window), (-1, -1), criteria)
+            nx, ny = pt[0, 0] + (x0, y0)
+            # Keep the refinement only if it stayed within the search window
+            if abs(nx - x) <= window and abs(ny - y) <= window:
+                refined[i] = (nx, ny)
+        return refined
+
+
+    @staticmethod
+    def _letterbox_geometry(mask_shape: tuple, shape: tuple):
+        """
+        Geometry of the centered letterbox that maps an image of shape (h, w) onto a mask.
+        Returns (gain, pad_x, pad_y, (top, bottom, left, right)) where the last tuple is
+        the mask region covering the image.
+        """
+        mh, mw = mask_shape[:2]
+        h, w = shape
+        gain = min(mh / h, mw / w)
+        pad_x, pad_y = (mw - w * gain) / 2, (mh - h * gain) / 2
+        top, left = int(round(pad_y - 0.1)), int(round(pad_x - 0.1))
+        bottom, right = int(round(mh - pad_y + 0.1)), int(round(mw - pad_x + 0.1))
+        return gain, pad_x, pad_y, (top, bottom, left, right)
+
+
+    def _unletterbox(self, mask: np.ndarray, shape: tuple):
+        # Crop the letterbox padding off a model-resolution mask and resize it to shape (h, w)
+        _, _, _, (top, bottom, left, right) = self._letterbox_geometry(mask.shape, shape)
+        return cv2.resize(mask[top:bottom, left:right], (shape[1], shape[0]), interpolation=cv2.INTER_LINEAR)
 
 
-        dst = np.array([[0,0],[WARP_SIZE-1,0],[WARP_SIZE-1,WARP_SIZE-1],[0,WARP_SIZE-1]], dtype=np.float32)
+    @staticmethod
+    def _warp(bgr: np.ndarray, box: np.ndarray, size: int):
+        dst = np.array([[0,0],[size-1,0],[size-1,size-1],[0,size-1]], dtype=np.float32)
         M = cv2.getPerspectiveTransform(box, dst)
-        warped = cv2.warpPerspective(bgr, M, (WARP_SIZE, WARP_SIZE))
+        warped = cv2.warpPerspective(bgr, M, (size, size))
         return warped, box, M
 
 
+    def _warp_source(self, src: ImageSource, quad: np.ndarray, size: int):
+        """
+        Warp the board under quad (full-resolution coordinates) to size x size, from
+        the smallest decode of src that still has size pixels across the board.
+        """
+        side = float(np.linalg.norm(quad - np.roll(quad, -1, axis=0), axis=1).min())
+        bgr, scale = src.get(size / max(side, 1.0))
+        return self._warp(bgr, quad * np.array(scale, dtype=np.float32), size)[0]
+
+
     def detect_pieces(self, warped_bgr: np.ndarray):
         """
         Detect pieces on the warped board image.
-        Returns list of detections with class names and bounding boxes.
-        """
-        res = self.pieces_model.predict(source=warped_bgr, conf=self.pieces_conf, verbose=False)[0]
-        detections = []
-        if res.boxes is not None and len(res.boxes) > 0:
-            for box in res.boxes:
-                cls_idx = int(box.cls[0])
-                conf = float(box.conf[0])
-                xyxy = box.xyxy[0].cpu().numpy()
-                x1, y1, x2, y2 = xyxy
-                cx = (x1 + x2) / 2
-                cy = (y1 + y2) / 2
-                
-                # Get class name
-                if cls_idx < len(INDEX_TO_NAME):
-                    cls_name = INDEX_TO_NAME[cls_idx]
-                else:
-                    cls_name = f"class_{cls_idx}"
-                
-                detections.append({
-                    "class": cls_name,
-                    "conf": conf,
-                    "bbox": [float(x1), float(y1), float(x2), float(y2)],
-                    "center": [float(cx), float(cy)]
-                })
-        return detections
+        Returns list of detections with class names and bounding boxes,
+        in WARP_SIZE board coordinates whatever the size of warped_bgr.
+        """
+        return self.detect_pieces_batch([warped_bgr])[0]
 
 
-    def _detections_to_fen(self, detections, flip_ranks: bool = False):
+    def detect_pieces_batch(self, warped_bgrs: list, imgsz: int = None, conf: float = None):
         """
-        Convert piece detections to FEN notation.
-        Assumes board is warped to WARP_SIZE x WARP_SIZE.
+        Batched detect_pieces: all warped boards go through pieces_model in one call.
+        imgsz/conf default to pieces_imgsz/pieces_conf.
+        Returns one detections list per board.
+        """
+        if not warped_bgrs:
+            return []
+        results = self.pieces_model.predict(source=list(warped_bgrs),
+                                            conf=self.pieces_conf if conf is None else conf,
+                                            imgsz=imgsz or self.pieces_imgsz, verbose=False)
+        return [self._result_to_detections(res, WARP_SIZE / warped.shape[0])
+                for res, warped in zip(results, warped_bgrs)]
+
+
+    def detect_pieces_cascade_batch(self, warps: list, boards: list):
+        """
+        Two-pass piece detection.
+        warps: the boards warped to cascade_imgsz; boards: matching (ImageSource, quad)
+        pairs, used to warp at pieces_imgsz for the second pass.
+        The first pass runs pieces_model on the small warps, keeping candidates down to
+        cascade_floor, so a piece the small input only half sees still flags its square.
+        Squares whose best candidate is below cascade_conf (faint ones included), or that
+        also have another class at cascade_compete or more, get a second pass on
+        3x3-square crops of a full-resolution warp (all crops of all boards in one
+        call); boards with more than cascade_max_squares such squares are re-run
+        whole. Returns one (detections, info) pair per board; info describes both passes.
+        """
+        if not warps:
+            return []
+        first = self.detect_pieces_batch(warps, imgsz=self.cascade_imgsz,
+                                         conf=min(self.cascade_floor, self.cascade_compete, self.pieces_conf))
+        out, crops, owners, whole = [], [], [], []
+        for b, ((src, quad), detections) in enumerate(zip(boards, first)):
+            squares = self._uncertain_squares(detections)
+            info = {
+                "first_pass_imgsz": self.cascade_imgsz,
+                "first_pass_pieces": len(detections),
+                "refined_squares": ["abcdefgh"[f] + str(8 - r) for r, f in squares],
+                "second_pass": "none",
+            }
+            files, ranks = self._square_indices([d["center"] for d in detections])
+            keep = [d for d, f, r in zip(detections, files, ranks)
+                    if d["conf"] >= self.pieces_conf and (r, f) not in squares]
+            out.append((keep, info))
+            if not squares:
+                continue
+            high = self._warp_source(src, quad, self.pieces_imgsz)
+            if len(squares) > self.cascade_max_squares:
+                info["second_pass"] = "board"
+                whole.append((b, high))
+                continue
+            info["second_pass"] = "crops"
+            for square in squares:
+                crop, origin = self._square_crop(high, square)
+                crops.append(crop)
+                owners.append((b, square, origin, WARP_SIZE / high.shape[0]))
+        
+        # Second pass: one call for every crop, one for boards that are re-run whole
+        if crops:
+            crop_imgsz = int(math.ceil(3 * self.pieces_imgsz / 8 / 32) * 32)
+            results = self.pieces_model.predict(source=crops, conf=self.pieces_conf, imgsz=crop_imgsz, verbose=False)
+            for (b, square, origin, scale), res in zip(owners, results):
+                found = self._result_to_detections(res, scale)
+                for det in found:
+                    det["bbox"] = [v + origin[k % 2] * scale for k, v in enumerate(det["bbox"])]
+                    det["center"] = [v + origin[k] * scale for k, v in enumerate(det["center"])]
+                # Neighbouring squares in the crop were settled by the first pass
+                files, ranks = self._square_indices([d["center"] for d in found])
+                found = [d for d, f, r in zip(found, files, ranks) if (r, f) == square]
+                out[b][0].extend(found)
+                out[b][1]["second_pass_pieces"] = out[b][1].get("second_pass_pieces", 0) + len(found)
+        if whole:
+            for (b, _), detections in zip(whole, self.detect_pieces_batch([high for _, high in whole])):
+                out[b][1]["second_pass_pieces"] = len(detections)
+                out[b] = (detections, out[b][1])
+        for detections, info in out:
+            info.setdefault("second_pass_pieces", 0)
+            info["num_pieces"] = len(detections)
+        return out
+
+
+    def _uncertain_squares(self, detections):
+        """
+        Squares (rank_idx, file_idx) the cascade's first pass is unsure about: the most
+        confident piece is below cascade_conf, or a second class reaches cascade_compete.
+        A square that looks empty at pieces_conf but has any candidate (the first pass
+        keeps them down to cascade_floor) counts too, so missed pieces can be recovered.
+        """
+        if not detections:
+            return []
+        piece_probs = self._assign_squares(detections)[1][..., :_EMPTY]
+        ranked = np.sort(piece_probs, axis=-1)
+        best, runner_up = ranked[..., -1], ranked[..., -2]
+        unsure = (best > 0) & ((best < self.cascade_conf) | (runner_up >= self.cascade_compete))
+        return [(int(r), int(f)) for r, f in zip(*np.nonzero(unsure))]
+
+
+    @staticmethod
+    def _square_crop(warped: np.ndarray, square: tuple):
         """
-        square_size = WARP_SIZE / 8
-        board = [["" for _ in range(8)] for _ in range(8)]
-        board_conf = [[0.0 for _ in range(8)] for _ in range(8)]  # Track confidence per square
+        Cut the 3x3-square window around square (rank_idx, file_idx) out of a warped
+        board, shifted inwards at the edges so pieces leaning over a border stay whole.
+        Returns (crop, (x, y) origin of the crop in warped pixels).
+        """
+        s = warped.shape[0] / 8
+        r0, f0 = (min(max(v - 1, 0), 5) for v in square)
+        y, x = round(r0 * s), round(f0 * s)
+        size = round(3 * s)
+        return warped[y:y + size, x:x + size], (x, y)
+
+
+    @staticmethod
+    def _result_to_detections(res, scale: float = 1.0):
+        # scale maps warped-board pixels to WARP_SIZE board coordinates
+        if res.boxes is None or len(res.boxes) == 0:
+            return []
+        xyxy = res.boxes.xyxy.cpu().numpy() * scale
+        centers = (xyxy[:, :2] + xyxy[:, 2:]) / 2
+        confs = res.boxes.conf.cpu().numpy().tolist()
+        classes = res.boxes.cls.cpu().numpy().astype(int).tolist()
         
-        # Sort detections by confidence (highest first)
-        sorted_dets = sorted(detections, key=lambda d: d["conf"], reverse=True)
+        # Get class names
+        names = [INDEX_TO_NAME[c] if c < len(INDEX_TO_NAME) else f"class_{c}" for c in classes]
         
-        for det in sorted_dets:
-            cx, cy = det["center"]
-            file_idx = int(cx / square_size)
-            rank_idx = int(cy / square_size)
-            
-            # Clamp to valid range
-            file_idx = max(0, min(7, file_idx))
-            rank_idx = max(0, min(7, rank_idx))
-            
-            # Get FEN character
-            cls_name = det["class"]
-            fen_char = LABEL_TO_FEN.get(cls_name, "?")
-            
-            # Only place piece if this square is empty or current detection has higher confidence
-            if fen_char != "?" and det["conf"] > board_conf[rank_idx][file_idx]:
-                board[rank_idx][file_idx] = fen_char
-                board_conf[rank_idx][file_idx] = det["conf"]
+        return [
+            {"class": name, "conf": conf, "bbox": bbox, "center": center}
+            for name, conf, bbox, center in zip(names, confs, xyxy.tolist(), centers.tolist())
+        ]
+
+
+    def classify_squares_batch(self, warped_bgrs: list):
+        """
+        The "squares" pieces engine: crop the 64 squares of every warped board into
+        one batch and classify them all in a single squares_model call.
+        Returns one (detections, probs) pair per board: a detection per occupied
+        square (its bbox is the square, in WARP_SIZE board coordinates) and the
+        8x8x13 SQUARE_CLASSES probabilities, top row first.
+        """
+        if not warped_bgrs:
+            return []
+        if self.squares_model is None:
+            raise RuntimeError("No squares model loaded.")
+        crops = []
+        for warped in warped_bgrs:
+            s = warped.shape[0] // 8
+            # (8s, 8s, 3) -> (64, s, s, 3), row by row from the top-left square
+            crops.extend(warped[:8 * s, :8 * s].reshape(8, s, 8, s, 3).swapaxes(1, 2).reshape(64, s, s, 3))
+        results = self.squares_model.predict(source=crops, verbose=False)
+        probs = np.stack([res.probs.data.cpu().numpy() for res in results])[:, self._squares_order]
+        probs = probs.astype(np.float32).reshape(len(warped_bgrs), 8, 8, len(SQUARE_CLASSES))
+        return [(self._squares_to_detections(p), p) for p in probs]
+
+
+    @staticmethod
+    def _squares_to_detections(probs: np.ndarray):
+        # One detection per square whose most likely class is a piece
+        best = probs.argmax(axis=-1)
+        ranks, files = np.nonzero(best != _EMPTY)
+        sq = WARP_SIZE / 8
+        return [
+            {
+                "class": SQUARE_CLASSES[best[r, f]],
+                "conf": float(probs[r, f, best[r, f]]),
+                "bbox": [f * sq, r * sq, (f + 1) * sq, (r + 1) * sq],
+                "center": [(f + 0.5) * sq, (r + 0.5) * sq],
+            }
+            for r, f in zip(ranks.tolist(), files.tolist())
+        ]
+
+
+    @staticmethod
+    def _square_indices(centers: np.ndarray):
+        """
+        Map (N,2) centers in WARP_SIZE board coordinates to (file_idx, rank_idx) arrays,
+        counted from the top-left of the warped board and clamped to 0-7.
+        """
+        idx = np.clip((np.asarray(centers, dtype=np.float32).reshape(-1, 2) // (WARP_SIZE / 8)).astype(np.int64), 0, 7)
+        return idx[:, 0], idx[:, 1]
+
+
+    def _assign_squares(self, detections):
+        """
+        Assign detections to squares.
+        Returns (board, probs) in warped-board row order (top row first):
+        board is an 8x8 array of FEN chars ('' = empty) holding the most confident
+        piece per square; probs is 8x8x13, the best confidence per SQUARE_CLASSES
+        class, with the empty channel set to 1 - best piece confidence.
+        """
+        probs = np.zeros((8, 8, len(SQUARE_CLASSES)), dtype=np.float32)
+        if detections:
+            centers = np.array([d["center"] for d in detections], dtype=np.float32)
+            confs = np.array([d["conf"] for d in detections], dtype=np.float32)
+            classes = np.array([_PIECE_INDEX.get(d["class"], -1) for d in detections], dtype=np.int64)
+            files, ranks = self._square_indices(centers)
+            known = classes >= 0
+            np.maximum.at(probs, (ranks[known], files[known], classes[known]), confs[known])
         
-        # Convert board to FEN
+        # Per-square argmax over confidence
+        piece_probs = probs[..., :_EMPTY]
+        best = piece_probs.argmax(axis=-1)
+        best_conf = piece_probs.max(axis=-1)
+        probs[..., _EMPTY] = 1.0 - best_conf
+        board = np.where(best_conf > 0, _FEN_CHARS[best], "")
+        return board, probs
+
+
+    @staticmethod
+    def _board_to_fen(board: np.ndarray, flip_ranks: bool = False):
         # FEN starts from rank 8 (top) to rank 1 (bottom)
         # board[0] = top of image, board[7] = bottom of image
         # If flip_ranks=True, white is at top (board reversed)
+        rows = board[::-1] if flip_ranks else board
         fen_rows = []
-        for rank_idx in range(8):
-            if flip_ranks:
-                # White at top: reverse the board order
-                rank = board[7 - rank_idx]
-            else:
-                # Normal: white at bottom (standard orientation)
-                rank = board[rank_idx]
-            
-            fen_row = ""
-            empty_count = 0
-            for square in rank:
-                if square == "":
-                    empty_count += 1
-                else:
-                    if empty_count > 0:
-                        fen_row += str(empty_count)
-                        empty_count = 0
-                    fen_row += square
-            if empty_count > 0:
-                fen_row += str(empty_count)
-            fen_rows.append(fen_row)
-        
+        for rank in rows:
+            fen_row = "".join(square or "1" for square in rank)
+            fen_rows.append(re.sub(r"1+", lambda m: str(len(m.group())), fen_row))
         return "/".join(fen_rows)
 
 
-    def _draw_overlay(self, warped_bgr: np.ndarray, detections):
+    def _detections_to_fen(self, detections, flip_ranks: bool = False):
         """
-        Draw bounding boxes and grid on the warped board image.
-        Returns PNG bytes.
+        Convert piece detections to FEN notation.
+        Assumes detections are in WARP_SIZE x WARP_SIZE board coordinates.
         """
-        overlay = warped_bgr.copy()
+        board, _ = self._assign_squares(detections)
+        return self._board_to_fen(board, flip_ranks)
+
+
+    def _draw_overlay(self, board_bgr: np.ndarray, detections):
+        """
+        Draw bounding boxes and grid onto a warped board image (in place).
+        board_bgr can be any square size; detections are in WARP_SIZE board coordinates.
+        Returns the overlay image.
+        """
+        overlay = board_bgr
+        size = overlay.shape[0]
+        k = size / WARP_SIZE  # board coordinates -> overlay pixels; line/font sizes were tuned at WARP_SIZE
+        thick = max(1, round(3 * k))
         
         # Draw 8x8 grid for reference
-        square_size = WARP_SIZE / 8
+        square_size = size / 8
         grid_color = (200, 200, 200)  # Light gray
         for i in range(9):
             pos = int(i * square_size)
-            cv2.line(overlay, (pos, 0), (pos, WARP_SIZE), grid_color, 1)
-            cv2.line(overlay, (0, pos), (WARP_SIZE, pos), grid_color, 1)
+            cv2.line(overlay, (pos, 0), (pos, size), grid_color, 1)
+            cv2.line(overlay, (0, pos), (size, pos), grid_color, 1)
         
         # Draw file labels (a-h) at the bottom
         files = 'abcdefgh'
-        for i, f in enumerate(files):
+        for i, file_name in enumerate(files):
             x = int((i + 0.5) * square_size)
-            cv2.putText(overlay, f, (x - 15, WARP_SIZE - 20),
-                       cv2.FONT_HERSHEY_SIMPLEX, 1.5, (255, 255, 0), 3)
+            cv2.putText(overlay, file_name, (x - int(15 * k), size - int(20 * k)),
+                       cv2.FONT_HERSHEY_SIMPLEX, 1.5 * k, (255, 255, 0), thick)
         
         # Draw rank labels (8-1) on the left
         for i in range(8):
             rank = 8 - i
             y = int((i + 0.5) * square_size)
-            cv2.putText(overlay, str(rank), (20, y + 15),
-                       cv2.FONT_HERSHEY_SIMPLEX, 1.5, (255, 255, 0), 3)
+            cv2.putText(overlay, str(rank), (int(20 * k), y + int(15 * k)),
+                       cv2.FONT_HERSHEY_SIMPLEX, 1.5 * k, (255, 255, 0), thick)
+        
+        # Calculate which square each piece is in
+        file_idxs, rank_idxs = self._square_indices([det["center"] for det in detections])
         
         # Draw detections
-        for det in detections:
-            x1, y1, x2, y2 = det["bbox"]
+        for det, file_idx, rank_idx in zip(detections, file_idxs, rank_idxs):
+            x1, y1, x2, y2 = (v * k for v in det["bbox"])
             cls_name = det["class"]
             conf = det["conf"]
-            cx, cy = det["center"]
-            
-            # Calculate which square this piece is in
-            file_idx = int(cx / square_size)
-            rank_idx = int(cy / square_size)
-            file_idx = max(0, min(7, file_idx))
-            rank_idx = max(0, min(7, rank_idx))
-            files = 'abcdefgh'
+            cx, cy = (v * k for v in det["center"])
             square_name = f"{files[file_idx]}{8-rank_idx}"
             
             # Draw rectangle
             color = (0, 255, 0)  # Green
-            cv2.rectangle(overlay, (int(x1), int(y1)), (int(x2), int(y2)), color, 3)
+            cv2.rectangle(overlay, (int(x1), int(y1)), (int(x2), int(y2)), color, thick)
             
             # Draw center point
-            cv2.circle(overlay, (int(cx), int(cy)), 5, (255, 0, 0), -1)
+            cv2.circle(overlay, (int(cx), int(cy)), max(1, round(5 * k)), (255, 0, 0), -1)
             
             # Draw label with square info
             label = f"{cls_name}@{square_name} {conf:.2f}"
             font = cv2.FONT_HERSHEY_SIMPLEX
-            font_scale = 0.8
-            thickness = 2
+            font_scale = 0.8 * k
+            thickness = max(1, round(2 * k))
             (text_w, text_h), baseline = cv2.getTextSize(label, font, font_scale, thickness)
             
             # Background for text
@@ -259,9 +671,30 @@ class Detector:
             cv2.putText(overlay, label, (int(x1) + 2, int(y1) - baseline - 2), 
                        font, font_scale, (0, 0, 0), thickness)
         
-        # Convert to PNG bytes
-        _, buffer = cv2.imencode('.png', overlay)
-        return buffer.tobytes()
+        return overlay
+
+
+    @staticmethod
+    def _draw_debug(bgr: np.ndarray, quad: np.ndarray, max_size: int = None):
+        """
+        Draw detected corners on the original image, downscaled to max_size (longest side) first.
+        quad may also be an (n, 4, 2) stack to draw several boards.
+        Returns the debug image.
+        """
+        h, w = bgr.shape[:2]
+        k = 1.0
+        if max_size and max_size < max(h, w):
+            k = max_size / max(h, w)
+            debug_img = cv2.resize(bgr, (max(1, round(w * k)), max(1, round(h * k))), interpolation=cv2.INTER_AREA)
+        else:
+            debug_img = bgr.copy()
+        for pts in np.asarray(quad).reshape(-1, 4, 2) * k:
+            for i, pt in enumerate(pts):
+                cv2.circle(debug_img, (int(pt[0]), int(pt[1])), max(2, round(15 * k)), (0, 0, 255), -1)
+                cv2.putText(debug_img, str(i), (int(pt[0] + 20 * k), int(pt[1] + 20 * k)),
+                           cv2.FONT_HERSHEY_SIMPLEX, max(0.3, k), (0, 0, 255), max(1, round(2 * k)))
+            cv2.polylines(debug_img, [pts.astype(np.int32)], True, (0, 255, 0), max(1, round(3 * k)))
+        return debug_img
 
 
     def warp_board_with_corners(self, bgr: np.ndarray, corners: list):
@@ -270,46 +703,236 @@ class Detector:
         corners: [[x1,y1], [x2,y2], [x3,y3], [x4,y4]] as TL, TR, BR, BL
         """
         box = np.array(corners, dtype=np.float32)
-        dst = np.array([[0,0],[WARP_SIZE-1,0],[WARP_SIZE-1,WARP_SIZE-1],[0,WARP_SIZE-1]], dtype=np.float32)
-        M = cv2.getPerspectiveTransform(box, dst)
-        warped = cv2.warpPerspective(bgr, M, (WARP_SIZE, WARP_SIZE))
-        return warped, box, M
+        return self._warp(bgr, box, self.pieces_imgsz)
 
 
-    def run(self, image: Image.Image, flip_ranks: bool = False, manual_corners: list = None):
+    def run(self, image, flip_ranks: bool = False, manual_corners: list = None,
+            render=RENDER_ALL, image_format: str = "png", image_quality: int = 90, image_max_size: int = None,
+            square_probs: bool = False, tracker: BoardTracker = None, engine: str = None,
+            timings: bool = False, max_boards: int = 1, cascade: bool = None):
         """
         Main inference pipeline.
+        image: encoded bytes, an ImageSource, a PIL image or a BGR array.
         If manual_corners is provided, uses them instead of auto-detection.
         manual_corners: [[x1,y1], [x2,y2], [x3,y3], [x4,y4]] as TL, TR, BR, BL
-        Returns (result_dict, overlay_png_bytes, debug_png_bytes).
+        render: which of "overlay" and "debug" to draw; the others are never rendered.
+        image_format/image_quality/image_max_size: see encode_image and the _draw_* helpers.
+        square_probs: also return the 8x8x13 per-square class confidences (see _assign_squares).
+        tracker: session BoardTracker; reuses the last board quad while the board has not moved.
+        engine: pieces engine for this image (see PIECES_ENGINES); defaults to pieces_engine.
+        timings: also return per-stage durations in ms (see STAGES); batched model calls
+        count in full for every image in the batch.
+        max_boards: find up to this many boards (largest first). With more than one,
+        result["boards"] holds fen, board_corners, detections (and square_probs) for
+        each; the top-level fields, the overlay and the tracker use the largest board,
+        and the debug image outlines all of them.
+        cascade: run the "detect" engine as a two-pass cascade (see
+        detect_pieces_cascade_batch); defaults to self.cascade. result["cascade"]
+        then reports both passes.
+        Returns (result_dict, overlay_bytes, debug_bytes); unrendered images are None.
         """
-        # Convert PIL to BGR
-        bgr = self._pil_to_bgr(image)
+        out = self.run_batch([{
+            "image": image,
+            "flip_ranks": flip_ranks,
+            "manual_corners": manual_corners,
+            "render": render,
+            "image_format": image_format,
+            "image_quality": image_quality,
+            "image_max_size": image_max_size,
+            "square_probs": square_probs,
+            "tracker": tracker,
+            "engine": engine,
+            "timings": timings,
+            "max_boards": max_boards,
+            "cascade": self.cascade if cascade is None else cascade,
+        }])[0]
+        if isinstance(out, Exception):
+            raise out
+        return out
+
+
+    def run_batch(self, jobs: list):
+        """
+        Batched inference pipeline.
+        jobs: list of dicts holding run() keyword arguments (image, flip_ranks, manual_corners, ...).
+        image may be encoded bytes, an ImageSource, a PIL image or a BGR array; encoded
+        images are decoded at the resolution each stage needs (see ImageSource).
+        Auto-detected boards share one board_model call and all warped boards share
+        one pieces_model call. Returns one entry per job: the run() tuple, or the
+        exception raised for that job so one bad image does not fail the batch.
+        """
+        outputs = [None] * len(jobs)
+        sources = [None] * len(jobs)
+        segs = [None] * len(jobs)  # (bgr, scale) decodes used for segmentation
+        quads = [None] * len(jobs)  # per job, a list of quads in full-resolution image coordinates
+        tracking = [None] * len(jobs)
+        times = [{} for _ in jobs]  # stage -> seconds
+        max_boards = [max(1, int(job.get("max_boards") or 1)) for job in jobs]
+        start = time.perf_counter()
+        for i, job in enumerate(jobs):
+            try:
+                sources[i] = ImageSource.from_image(job["image"])
+                if job.get("manual_corners"):
+                    quads[i] = [np.array(job["manual_corners"], dtype=np.float32).reshape(4, 2)]
+                    tracking[i] = "manual"
+                    continue
+                # Segmentation only needs the board model's input resolution
+                t = time.perf_counter()
+                segs[i] = sources[i].for_size(self.board_imgsz)
+                times[i]["decode"] = time.perf_counter() - t
+                tracker = job.get("tracker")
+                if tracker is not None and max_boards[i] == 1:
+                    # Reuse the session's last quad if the board has not moved
+                    t = time.perf_counter()
+                    reused = tracker.match(segs[i][0])
+                    times[i]["track"] = time.perf_counter() - t
+                    if reused is not None:
+                        quads[i] = [reused / np.array(segs[i][1], dtype=np.float32)]
+                        tracking[i] = "reused"
+            except Exception as e:
+                outputs[i] = e
         
-        # Find and warp board
-        if manual_corners:
-            warped, quad, transform = self.warp_board_with_corners(bgr, manual_corners)
-        else:
-            warped, quad, transform = self.find_and_warp_board(bgr)
+        # Find the remaining boards in one segmentation call
+        auto = [i for i in range(len(jobs)) if outputs[i] is None and quads[i] is None]
+        t = time.perf_counter()
+        found_quads = self.find_boards([segs[i][0] for i in auto], [max_boards[i] for i in auto])
+        elapsed = time.perf_counter() - t
+        for i, found in zip(auto, found_quads):
+            times[i]["segment"] = elapsed
+            if isinstance(found, Exception):
+                outputs[i] = found
+                continue
+            if jobs[i].get("tracker") is not None and max_boards[i] == 1:
+                jobs[i]["tracker"].update(segs[i][0], found[0])
+                tracking[i] = "detected"
+            quads[i] = [quad / np.array(segs[i][1], dtype=np.float32) for quad in found]
         
-        # Draw detected corners on original image for debugging
-        debug_img = bgr.copy()
-        for i, pt in enumerate(quad):
-            cv2.circle(debug_img, (int(pt[0]), int(pt[1])), 15, (0, 0, 255), -1)
-            cv2.putText(debug_img, str(i), (int(pt[0])+20, int(pt[1])+20),
-                       cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 2)
-        cv2.polylines(debug_img, [quad.astype(np.int32)], True, (0, 255, 0), 3)
-        _, debug_buffer = cv2.imencode('.png', debug_img)
-        debug_png = debug_buffer.tobytes()
+        # Warp each board from a decode with just enough resolution for the pieces model;
+        # boards are keyed (job, board) so every board of every job shares the model calls below
+        warps = {}
+        engines = {}
+        cascade = set()  # jobs whose first pass runs at cascade_imgsz
+        for i in range(len(jobs)):
+            if outputs[i] is None:
+                engines[i] = jobs[i].get("engine") or self.pieces_engine
+                cascaded = engines[i] == "detect" and jobs[i].get("cascade", self.cascade)
+                if cascaded:
+                    cascade.add(i)
+                size = self.cascade_imgsz if cascaded else self.pieces_imgsz
+                try:
+                    t = time.perf_counter()
+                    for b, quad in enumerate(quads[i]):
+                        warps[i, b] = self._warp_source(sources[i], quad, size)
+                    times[i]["warp"] = time.perf_counter() - t
+                except Exception as e:
+                    outputs[i] = e
+        warps = {key: warp for key, warp in warps.items() if outputs[key[0]] is None}
         
-        # Detect pieces
-        detections = self.detect_pieces(warped)
+        # Find pieces on every warped board with one call per engine
+        found = {}
+        engines = {i: engines[i] for i, _ in warps}
+        detect = [key for key in warps if engines[key[0]] == "detect" and key[0] not in cascade]
+        t = time.perf_counter()
+        for key, detections in zip(detect, self.detect_pieces_batch([warps[key] for key in detect])):
+            found[key] = (detections, None)
+        elapsed = time.perf_counter() - t
+        for i, _ in detect:
+            times[i]["pieces"] = elapsed
+        cascaded = [key for key in warps if key[0] in cascade]
+        cascade_info = {}
+        t = time.perf_counter()
+        try:
+            boards = [(sources[i], quads[i][b]) for i, b in cascaded]
+            for key, (detections, info) in zip(cascaded, self.detect_pieces_cascade_batch(
+                    [warps[key] for key in cascaded], boards)):
+                found[key] = (detections, None)
+                cascade_info[key] = info
+        except Exception as e:
+            for i, _ in cascaded:
+                outputs[i] = e
+        elapsed = time.perf_counter() - t
+        for i, _ in cascaded:
+            times[i]["pieces"] = elapsed
+        squares = [key for key in warps if engines[key[0]] == "squares"]
+        t = time.perf_counter()
+        try:
+            found.update(zip(squares, self.classify_squares_batch([warps[key] for key in squares])))
+        except Exception as e:
+            for i, _ in squares:
+                outputs[i] = e
+        elapsed = time.perf_counter() - t
+        for i, _ in squares:
+            times[i]["pieces"] = elapsed
+        for i in engines:
+            if engines[i] not in PIECES_ENGINES:
+                outputs[i] = ValueError(f"Unknown pieces engine: {engines[i]}")
+        
+        for i in sorted(engines):
+            if outputs[i] is not None:
+                continue
+            try:
+                boards = []
+                for b, quad in enumerate(quads[i]):
+                    detections, probs = found[i, b]
+                    # Only the largest board is rendered; the debug image outlines every board
+                    boards.append(self._finish(sources[i], quad, detections, jobs[i], probs, times[i],
+                                               render=() if b else None, debug_quads=quads[i]))
+                    if (i, b) in cascade_info:
+                        boards[-1][0]["cascade"] = cascade_info[i, b]
+                result, overlay_bytes, debug_bytes = boards[0]
+                if max_boards[i] > 1:
+                    result["boards"] = [board[0].copy() for board in boards]
+                    result["num_boards"] = len(boards)
+                result["pieces_engine"] = engines[i]
+                if tracking[i] is not None:
+                    result["board_tracking"] = tracking[i]
+                if jobs[i].get("timings"):
+                    times[i]["total"] = time.perf_counter() - start
+                    result["timings"] = {stage: round(seconds * 1000.0, 3) for stage, seconds in times[i].items()}
+                outputs[i] = (result, overlay_bytes, debug_bytes)
+            except Exception as e:
+                outputs[i] = e
+        return outputs
+
+
+    def _finish(self, src: ImageSource, quad: np.ndarray, detections, job: dict, probs: np.ndarray = None,
+                times: dict = None, render=None, debug_quads: list = None):
+        times = {} if times is None else times
+        render = job.get("render", RENDER_ALL) if render is None else render
+        fmt = job.get("image_format", "png")
+        quality = job.get("image_quality", 90)
+        max_size = job.get("image_max_size")
         
         # Convert to FEN
-        fen = self._detections_to_fen(detections, flip_ranks=flip_ranks)
+        t = time.perf_counter()
+        flip_ranks = job.get("flip_ranks", False)
+        board, assigned = self._assign_squares(detections)
+        if probs is None:
+            probs = assigned
+        fen = self._board_to_fen(board, flip_ranks)
+        times["fen"] = times.get("fen", 0.0) + time.perf_counter() - t
         
-        # Draw overlay
-        overlay_png = self._draw_overlay(warped, detections)
+        # Only render the images that were asked for
+        debug_bytes = None
+        if "debug" in render:
+            t = time.perf_counter()
+            bgr, scale = src.for_size(max_size) if max_size else src.get(1.0)
+            outlined = np.stack(debug_quads) if debug_quads else quad
+            debug = self._draw_debug(bgr, outlined * np.array(scale, dtype=np.float32), max_size)
+            times["debug"] = time.perf_counter() - t
+            t = time.perf_counter()
+            debug_bytes = encode_image(debug, fmt, quality)
+            times["encode"] = time.perf_counter() - t
+        overlay_bytes = None
+        if "overlay" in render:
+            # Separate high-resolution warp, made straight at the output size
+            t = time.perf_counter()
+            size = min(max_size, WARP_SIZE) if max_size else WARP_SIZE
+            overlay = self._draw_overlay(self._warp_source(src, quad, size), detections)
+            times["overlay"] = time.perf_counter() - t
+            t = time.perf_counter()
+            overlay_bytes = encode_image(overlay, fmt, quality)
+            times["encode"] = times.get("encode", 0.0) + time.perf_counter() - t
         
         result = {
             "fen": fen,
@@ -317,5 +940,9 @@ class Detector:
             "detections": detections,
             "board_corners": quad.tolist()  # Add detected corners to result
         }
+        if job.get("square_probs"):
+            # Same row order as the FEN (rank 8 first)
+            result["square_probs"] = np.round(probs[::-1] if flip_ranks else probs, 4).tolist()
+            result["square_classes"] = SQUARE_CLASSES
         
-        return result, overlay_png, debug_png
+        return result, overlay_bytes, debug_bytes
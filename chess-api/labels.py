@@ -9,4 +9,8 @@ LABEL_TO_FEN = {
 # in the exact order used during training (from data/pieces/dataset.yaml)
 INDEX_TO_NAME = [
 "bB","bK","bN","bP","bQ","bR","wB","wK","wN","wP","wQ","wR"
-]
\ No newline at end of file
+]
+
+
+# Channels of the per-square confidence grid: the piece classes above, then empty
+SQUARE_CLASSES = INDEX_TO_NAME + ["empty"]
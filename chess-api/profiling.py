@@ -0,0 +1,76 @@
+from __future__ import annotations
+import collections
+import cProfile
+import io
+import marshal
+import os
+import pstats
+import re
+import threading
+import time
+import uuid
+
+
+_REQUEST_ID = re.compile(r"[A-Za-z0-9._-]{1,64}")
+
+
+class RateLimiter:
+    """
+    Allows at most `limit` events per `period` seconds (sliding window), so an
+    expensive admin feature cannot be used to load the server.
+    """
+    def __init__(self, limit: int, period: float = 60.0):
+        self.limit = max(0, int(limit))
+        self.period = float(period)
+        self._events = collections.deque()
+        self._lock = threading.Lock()
+
+
+    def acquire(self) -> float:
+        """Take a slot. Returns 0 if allowed, else the seconds until the next slot frees up."""
+        now = time.monotonic()
+        with self._lock:
+            while self._events and now - self._events[0] >= self.period:
+                self._events.popleft()
+            if len(self._events) < self.limit:
+                self._events.append(now)
+                return 0.0
+            if not self._events:
+                return self.period
+            return self._events[0] + self.period - now
+
+
+def request_id(requested: str = None) -> str:
+    # Use the caller's id if it is safe as a file name, otherwise make one up
+    if requested and _REQUEST_ID.fullmatch(requested):
+        return requested
+    return uuid.uuid4().hex
+
+
+def profile_call(fn, *args, limit: int = 40):
+    """
+    Run fn(*args) under cProfile.
+    Returns (fn's return value, marshalled stats in the .prof format that pstats
+    and snakeviz load, text report of the `limit` slowest functions by cumulative time).
+    """
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        out = fn(*args)
+    finally:
+        profiler.disable()
+    profiler.create_stats()
+    # Marshal first: pstats.Stats takes the stats over from the profiler
+    stats = marshal.dumps(profiler.stats)
+    report = io.StringIO()
+    pstats.Stats(profiler, stream=report).sort_stats("cumulative").print_stats(limit)
+    return out, stats, report.getvalue()
+
+
+def write_profile(directory: str, name: str, stats: bytes) -> str:
+    """Save marshalled stats (see profile_call) as <directory>/<name>.prof. Returns the path."""
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{name}.prof")
+    with open(path, "wb") as f:
+        f.write(stats)
+    return path
@@ -0,0 +1,133 @@
+from __future__ import annotations
+import threading
+from collections import OrderedDict
+import cv2
+import numpy as np
+
+
+class BoardTracker:
+    """
+    Remembers the last detected board quad for one session
+    (a live camera or screen capture) so segmentation can be skipped while the
+    board has not moved.
+    A frame reuses the quad when, on a small grayscale thumbnail,
+    - the mean absolute difference from the frame the quad was detected on is
+      at most diff_threshold (piece moves barely register; camera moves do), and
+    - the edge strength along the quad border is at least edge_ratio times what
+      it was at detection time (the board outline is still where we think it is).
+    Segmentation is re-run anyway after max_reuse consecutive reuses.
+    Thread-safe: frames of one session may run on different workers at once.
+    """
+    def __init__(self, diff_threshold: float = 8.0, edge_ratio: float = 0.6, max_reuse: int = 30,
+                 thumb_size: int = 256):
+        self.diff_threshold = float(diff_threshold)
+        self.edge_ratio = float(edge_ratio)
+        self.max_reuse = int(max_reuse)
+        self.thumb_size = int(thumb_size)
+        self._lock = threading.Lock()
+        self.reset()
+
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["_lock"]
+        state["_candidate"] = None  # a whole frame
+        return state
+
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+
+    def reset(self):
+        with self._lock:
+            self.quad = None
+            self.reuse_count = 0
+            self._shape = None
+            self._thumb = None
+            self._edge_score = 0.0
+            self._candidate = None
+
+
+    def _thumbnail(self, bgr: np.ndarray):
+        h, w = bgr.shape[:2]
+        scale = min(1.0, self.thumb_size / max(h, w))
+        small = cv2.resize(bgr, (max(1, round(w * scale)), max(1, round(h * scale))), interpolation=cv2.INTER_AREA)
+        return cv2.cvtColor(small, cv2.COLOR_BGR2GRAY).astype(np.float32), scale
+
+
+    @staticmethod
+    def _border_edge_score(gray: np.ndarray, quad: np.ndarray, samples: int = 32):
+        # Mean gradient magnitude sampled along the four sides of the quad
+        gx = cv2.Sobel(gray, cv2.CV_32F, 1, 0, ksize=3)
+        gy = cv2.Sobel(gray, cv2.CV_32F, 0, 1, ksize=3)
+        mag = cv2.magnitude(gx, gy)
+        t = np.linspace(0.0, 1.0, samples, dtype=np.float32)[:, None]
+        pts = np.concatenate([quad[i] + t * (quad[(i + 1) % 4] - quad[i]) for i in range(4)])
+        xs = np.clip(np.rint(pts[:, 0]).astype(np.int64), 0, gray.shape[1] - 1)
+        ys = np.clip(np.rint(pts[:, 1]).astype(np.int64), 0, gray.shape[0] - 1)
+        return float(mag[ys, xs].mean())
+
+
+    def match(self, bgr: np.ndarray):
+        """
+        Cheap check whether the board is where it was.
+        Returns the quad to reuse, or None if segmentation has to run.
+        """
+        with self._lock:
+            if self.quad is None or bgr.shape != self._shape or self.reuse_count >= self.max_reuse:
+                return None
+            quad, thumb, edge_score = self.quad, self._thumb, self._edge_score
+        # The thumbnail work runs unlocked; update() reuses it for this same frame
+        gray, scale = self._thumbnail(bgr)
+        with self._lock:
+            self._candidate = (bgr, gray, scale)
+        if float(np.abs(gray - thumb).mean()) > self.diff_threshold:
+            return None
+        if self._border_edge_score(gray, quad * scale) < self.edge_ratio * edge_score:
+            return None
+        with self._lock:
+            self.reuse_count += 1
+        return quad
+
+
+    def update(self, bgr: np.ndarray, quad: np.ndarray):
+        """Store a freshly detected quad and the frame it was detected on."""
+        with self._lock:
+            candidate, self._candidate = self._candidate, None
+        # Only the thumbnail match() made of this very frame, not of a concurrent one
+        if candidate is not None and candidate[0] is bgr:
+            _, gray, scale = candidate
+        else:
+            gray, scale = self._thumbnail(bgr)
+        quad = np.asarray(quad, dtype=np.float32)
+        edge_score = self._border_edge_score(gray, quad * scale)
+        with self._lock:
+            self.quad = quad
+            self.reuse_count = 0
+            self._shape = bgr.shape
+            self._thumb = gray
+            self._edge_score = edge_score
+
+
+class TrackerStore:
+    """
+    Session id -> BoardTracker, keeping the max_sessions most recently used.
+    """
+    def __init__(self, max_sessions: int = 256, **tracker_kwargs):
+        self.max_sessions = max(1, int(max_sessions))
+        self.tracker_kwargs = tracker_kwargs
+        self._trackers = OrderedDict()
+        self._lock = threading.Lock()
+
+
+    def get(self, session_id: str) -> BoardTracker:
+        with self._lock:
+            tracker = self._trackers.pop(session_id, None)
+            if tracker is None:
+                tracker = BoardTracker(**self.tracker_kwargs)
+            self._trackers[session_id] = tracker
+            while len(self._trackers) > self.max_sessions:
+                self._trackers.popitem(last=False)
+            return tracker
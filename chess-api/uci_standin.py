@@ -0,0 +1,85 @@
+"""
+Minimal stand-in UCI engine for exercising /analyze without a real engine.
+It knows no chess: for a position it makes up deterministic lines (a move list
+and score derived from the FEN), reporting one 'info' line per depth per
+MultiPV line, so results are reproducible and depth/MultiPV handling is real.
+
+    ENGINE_PATH="python uci_standin.py --delay-ms 5" uvicorn app:app
+"""
+
+import argparse
+import hashlib
+import sys
+import threading
+
+FILES = "abcdefgh"
+
+
+def made_up_move(seed: bytes, k: int):
+    digest = hashlib.sha256(seed + bytes([k])).digest()
+    return "".join((FILES[digest[0] % 8], str(digest[1] % 8 + 1), FILES[digest[2] % 8], str(digest[3] % 8 + 1)))
+
+
+def search(fen: str, depth: int, multipv: int, delay: float, stop: threading.Event, say):
+    seed = fen.encode()
+    best = None
+    for d in range(1, depth + 1):
+        if stop.wait(delay):
+            break
+        for line in range(1, multipv + 1):
+            pv = [made_up_move(seed, line * 64 + ply) for ply in range(min(d, 8))]
+            score = int.from_bytes(hashlib.sha256(seed + bytes([line])).digest()[:2], "big") % 200 - 100 - 10 * line
+            say(f"info depth {d} seldepth {d} multipv {line} score cp {score} nodes {d * 1000} pv {' '.join(pv)}")
+            if line == 1:
+                best = pv[0]
+    say(f"bestmove {best or '(none)'}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--delay-ms", type=float, default=0.0, help="time spent per depth")
+    args = parser.parse_args()
+
+    lock = threading.Lock()
+
+    def say(line: str):
+        with lock:
+            sys.stdout.write(line + "\n")
+            sys.stdout.flush()
+
+    fen = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+    multipv = 1
+    stop = threading.Event()
+    searching = None
+    for line in sys.stdin:
+        tokens = line.split()
+        if not tokens:
+            continue
+        command = tokens[0]
+        if command == "uci":
+            say("id name uci-standin")
+            say("option name MultiPV type spin default 1 min 1 max 256")
+            say("uciok")
+        elif command == "isready":
+            say("readyok")
+        elif command == "setoption" and len(tokens) >= 5 and tokens[2] == "MultiPV":
+            multipv = max(1, int(tokens[4]))
+        elif command == "position" and len(tokens) > 2 and tokens[1] == "fen":
+            fen = " ".join(tokens[2:tokens.index("moves")] if "moves" in tokens else tokens[2:])
+        elif command == "go":
+            depth = int(tokens[tokens.index("depth") + 1]) if "depth" in tokens else 20
+            stop = threading.Event()
+            searching = threading.Thread(target=search, args=(fen, depth, multipv, args.delay_ms / 1000.0, stop, say))
+            searching.start()
+        elif command == "stop":
+            stop.set()
+            if searching is not None:
+                searching.join()
+        elif command == "quit":
+            break
+    stop.set()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
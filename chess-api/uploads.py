@@ -0,0 +1,119 @@
+from __future__ import annotations
+import tarfile
+import tempfile
+import zipfile
+from pathlib import PurePosixPath
+from decode import ImageTooLarge
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp', '.bmp')
+ARCHIVE_TYPES = ("zip", "tar")
+
+
+class UploadTooLarge(ImageTooLarge):
+    """Raised when a request body or archive member has more bytes than allowed."""
+
+
+def check_content_length(headers, max_bytes: int):
+    """Reject a body whose declared Content-Length is over max_bytes before reading any of it."""
+    length = headers.get("content-length")
+    if max_bytes and length is not None and length.isdigit() and int(length) > max_bytes:
+        raise UploadTooLarge(f"Upload is {int(length)} bytes; the limit is {max_bytes}.")
+
+
+async def read_body(chunks, max_bytes: int) -> bytes:
+    """
+    Collect a request body from its chunk stream (Request.stream()), stopping as
+    soon as it passes max_bytes (0 = no limit), so an oversized or unannounced
+    (chunked) upload is never held in memory whole.
+    """
+    parts = []
+    size = 0
+    async for chunk in chunks:
+        size += len(chunk)
+        if max_bytes and size > max_bytes:
+            raise UploadTooLarge(f"Upload is over the {max_bytes} byte limit.")
+        parts.append(chunk)
+    return b"".join(parts)
+
+
+async def spool_body(chunks, max_bytes: int, memory_bytes: int = 8 * 1024 * 1024):
+    """
+    Like read_body, but into a temporary file that moves to disk past
+    memory_bytes. Returns the file, rewound; the caller closes it.
+    """
+    spool = tempfile.SpooledTemporaryFile(max_size=memory_bytes)
+    try:
+        size = 0
+        async for chunk in chunks:
+            size += len(chunk)
+            if max_bytes and size > max_bytes:
+                raise UploadTooLarge(f"Archive is over the {max_bytes} byte limit.")
+            spool.write(chunk)
+        spool.seek(0)
+        return spool
+    except BaseException:
+        spool.close()
+        raise
+
+
+def _is_image(name: str) -> bool:
+    path = PurePosixPath(name)
+    # Skip macOS resource forks and other hidden entries
+    if any(part.startswith(".") or part == "__MACOSX" for part in path.parts):
+        return False
+    return path.suffix.lower() in IMAGE_EXTENSIONS
+
+
+def _read_limited(f, size: int, max_bytes: int, name: str) -> bytes:
+    # The declared size can lie (or be a decompression bomb): read at most one byte past the limit
+    if max_bytes and size > max_bytes:
+        raise UploadTooLarge(f"{name} is {size} bytes; the limit is {max_bytes}.")
+    data = f.read(max_bytes + 1 if max_bytes else -1)
+    if max_bytes and len(data) > max_bytes:
+        raise UploadTooLarge(f"{name} is over the {max_bytes} byte limit.")
+    return data
+
+
+def archive_images(fileobj, max_image_bytes: int, max_images: int):
+    """
+    Yield (name, bytes or exception) for each image in a ZIP or tar (optionally
+    compressed) archive, in archive order, one member in memory at a time.
+    Members over max_image_bytes are yielded as UploadTooLarge; past max_images
+    images a final UploadTooLarge ends the iteration. Non-image entries are skipped.
+    Raises ValueError if fileobj is neither format.
+    """
+    count = 0
+    if zipfile.is_zipfile(fileobj):
+        fileobj.seek(0)
+        with zipfile.ZipFile(fileobj) as archive:
+            for info in archive.infolist():
+                if info.is_dir() or not _is_image(info.filename):
+                    continue
+                count += 1
+                if count > max_images:
+                    yield info.filename, UploadTooLarge(f"Archive has more than {max_images} images.")
+                    return
+                try:
+                    with archive.open(info) as f:
+                        yield info.filename, _read_limited(f, info.file_size, max_image_bytes, info.filename)
+                except (UploadTooLarge, zipfile.BadZipFile, NotImplementedError, RuntimeError) as e:
+                    yield info.filename, e
+        return
+    fileobj.seek(0)
+    try:
+        # Stream mode: members are read in order, without seeking back
+        archive = tarfile.open(fileobj=fileobj, mode="r|*")
+    except tarfile.TarError:
+        raise ValueError(f"Archive must be one of: {', '.join(ARCHIVE_TYPES)}")
+    with archive:
+        for member in archive:
+            if not member.isfile() or not _is_image(member.name):
+                continue
+            count += 1
+            if count > max_images:
+                yield member.name, UploadTooLarge(f"Archive has more than {max_images} images.")
+                return
+            try:
+                yield member.name, _read_limited(archive.extractfile(member), member.size, max_image_bytes, member.name)
+            except UploadTooLarge as e:
+                yield member.name, e
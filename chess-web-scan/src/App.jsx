@@ -77,6 +77,7 @@ export default function App(){
       fd.append('file', file)
       fd.append('flip_ranks', String(flipRanks))
       fd.append('corners', JSON.stringify(adjustedCorners))
+      fd.append('images', 'overlay')
       
       const res = await fetch(`${API_BASE}/infer`, { method:'POST', body: fd })
       const json = await res.json()
@@ -84,7 +85,7 @@ export default function App(){
       
       setFEN(json.fen)
       setNumPieces(json.num_pieces || 0)
-      setOverlayURL(json.overlay_png_base64)
+      setOverlayURL(json.overlay_base64)
       setStage('result')
       console.log('Detection result:', json)
     } catch(err){
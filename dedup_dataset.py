@@ -0,0 +1,154 @@
+"""
+Find near-duplicate images that leak between the train and val splits.
+Hashes every image in the datasets' train and val folders (see near_duplicates.py),
+clusters near-duplicates and reports every cluster with images in both splits.
+--fix moves each leaking cluster (images and labels) into the split most of its
+images are already in (train on a tie) and updates the ingest manifest.
+
+    python dedup_dataset.py
+    python dedup_dataset.py pieces --max-distance 4 --report leakage.json
+    python dedup_dataset.py board --fix
+"""
+
+import argparse
+import collections
+import json
+import os
+import sys
+from pathlib import Path
+import numpy as np
+from ingest_dataset import IMAGE_EXTENSIONS, MANIFEST_NAME, load_dataset, load_manifest, save_manifest
+from near_duplicates import DEFAULT_MAX_DISTANCE, cluster_labels, hash_files, near_duplicate_pairs
+
+# Fix encoding for Windows console
+if sys.platform == 'win32':
+    sys.stdout.reconfigure(encoding='utf-8')
+
+
+def list_images(splits: dict):
+    """(split, image path, label path) for every image in the dataset's split folders."""
+    out = []
+    for split, (images_dir, labels_dir) in splits.items():
+        if not images_dir.is_dir():
+            continue
+        for path in sorted(images_dir.rglob("*")):
+            if path.suffix.lower() in IMAGE_EXTENSIONS:
+                out.append((split, path, labels_dir / path.relative_to(images_dir).with_suffix(".txt")))
+    return out
+
+
+def find_clusters(images: list, max_distance: int, jobs: int):
+    """
+    Cluster near-duplicates. Returns (clusters, unreadable): clusters is a list of
+    lists of indices into images (only clusters of two or more).
+    """
+    hashes = hash_files([path for _, path, _ in images], jobs)
+    hashed = np.array([k for k, value in enumerate(hashes) if value is not None], dtype=np.int64)
+    unreadable = [images[k][1] for k, value in enumerate(hashes) if value is None]
+    pairs = near_duplicate_pairs(np.array([hashes[k] for k in hashed], dtype=np.uint64), max_distance)
+    labels = cluster_labels(len(hashed), pairs)
+    groups = collections.defaultdict(list)
+    for k, label in zip(hashed.tolist(), labels.tolist()):
+        groups[label].append(k)
+    return [members for members in groups.values() if len(members) > 1], unreadable
+
+
+def fix_cluster(root: Path, splits: dict, images: list, members: list, moved: dict):
+    """Move a leaking cluster into its majority split. Returns the number of images moved."""
+    votes = collections.Counter(images[k][0] for k in members)
+    target = max(sorted(votes), key=lambda split: (votes[split], split == "train"))
+    images_dir, labels_dir = splits[target]
+    count = 0
+    for k in members:
+        split, path, label = images[k]
+        if split == target:
+            continue
+        dest = images_dir / path.name
+        if dest.exists():
+            print(f"   Skipped {path} ({dest} already exists)")
+            continue
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(path, dest)
+        if label.exists():
+            labels_dir.mkdir(parents=True, exist_ok=True)
+            os.replace(label, labels_dir / label.name)
+        moved[path.relative_to(root).as_posix()] = (target, dest, labels_dir / label.name)
+        count += 1
+    return count
+
+
+def update_manifest(root: Path, moved: dict):
+    path = root / MANIFEST_NAME
+    if not moved or not path.exists():
+        return
+    manifest = load_manifest(path)
+    for entry in manifest["files"].values():
+        if entry["image"] in moved:
+            split, image, label = moved[entry["image"]]
+            entry.update(split=split, image=image.relative_to(root).as_posix(),
+                         label=label.relative_to(root).as_posix())
+    save_manifest(path, manifest)
+
+
+def main():
+    base_dir = Path(__file__).resolve().parent
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("datasets", nargs="*", default=["board", "pieces"], help="names or dataset.yaml paths")
+    parser.add_argument("--max-distance", type=int, default=DEFAULT_MAX_DISTANCE,
+                        help="pHash bits two images may differ by and still count as near-duplicates")
+    parser.add_argument("--jobs", type=int, default=min(32, (os.cpu_count() or 1) * 4))
+    parser.add_argument("--show", type=int, default=10, help="leaking clusters to list per dataset")
+    parser.add_argument("--report", help="write every cluster to this JSON file")
+    parser.add_argument("--fix", action="store_true", help="move leaking clusters into one split")
+    args = parser.parse_args()
+
+    report = {}
+    total_leaks = 0
+    for dataset in args.datasets:
+        root, splits, _ = load_dataset(dataset, base_dir)
+        images = list_images(splits)
+        print(f"\nHashing {len(images)} images in {root}...")
+        clusters, unreadable = find_clusters(images, args.max_distance, args.jobs)
+        leaks = [len({images[k][0] for k in members}) > 1 for members in clusters]
+        leaking = [members for members, leak in zip(clusters, leaks) if leak]
+        leaked_val = sum(1 for members in leaking for k in members if images[k][0] == "val")
+        val_count = sum(1 for split, _, _ in images if split == "val")
+
+        print("\n" + "="*60)
+        print(f"NEAR-DUPLICATES: {dataset}")
+        print("="*60)
+        print(f"Images:             {len(images)} ({len(unreadable)} unreadable)")
+        print(f"Clusters (2+):      {len(clusters)} holding {sum(map(len, clusters))} images")
+        print(f"Leaking clusters:   {len(leaking)}")
+        print(f"Val images leaked:  {leaked_val} of {val_count}")
+        for members in sorted(leaking, key=len, reverse=True)[:args.show]:
+            print(f"   {len(members)} images: " + ", ".join(
+                f"{images[k][0]}/{images[k][1].name}" for k in members[:6]) + (" ..." if len(members) > 6 else ""))
+        if args.fix and leaking:
+            moved = {}
+            count = sum(fix_cluster(root, splits, images, members, moved) for members in leaking)
+            update_manifest(root, moved)
+            print(f"Moved {count} images (with their labels) to their cluster's split")
+        print("="*60)
+
+        total_leaks += len(leaking)
+        report[dataset] = {
+            "root": str(root),
+            "images": len(images),
+            "unreadable": [str(p) for p in unreadable],
+            "clusters": [
+                {"leaking": leak,
+                 "images": [{"split": images[k][0], "path": str(images[k][1])} for k in members]}
+                for members, leak in zip(clusters, leaks)
+            ],
+        }
+
+    if args.report:
+        Path(args.report).write_text(json.dumps(report, indent=2))
+        print(f"Report written to {args.report}")
+    # Non-zero while leakage remains, so this can gate training
+    return 1 if total_leaks and not args.fix else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
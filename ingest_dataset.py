@@ -0,0 +1,301 @@
+"""
+Ingest new images (and YOLO labels) into the board or pieces dataset.
+Replaces organize_dataset.py, organize_new_images.py and organize_pieces.py.
+
+Files are named and tracked by content hash (data/<dataset>/manifest.json), so
+running it again on the same or a growing source folder only copies what is new.
+Each image goes to train or val by its hash, so the split never changes between
+runs, except that near-duplicates (see near_duplicates.py) always share a split:
+a new image joins the split of similar images already in the dataset. Copies (or
+hardlinks) run in parallel.
+
+    python ingest_dataset.py board sample-images
+    python ingest_dataset.py pieces "D:/downloads/pieces/train/images" --labels "D:/downloads/pieces/train/labels"
+    python ingest_dataset.py pieces new-images --link --dry-run
+
+Labels are matched to images by file name; Roboflow exports' _jpg.rf.<hash>
+suffix is ignored. Labels that changed since the last run are updated in place.
+"""
+
+import argparse
+import collections
+import hashlib
+import json
+import os
+import re
+import shutil
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import numpy as np
+import yaml
+from near_duplicates import DEFAULT_MAX_DISTANCE, cluster_labels, hash_files, near_duplicate_pairs
+
+# Fix encoding for Windows console
+if sys.platform == 'win32':
+    sys.stdout.reconfigure(encoding='utf-8')
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+MANIFEST_NAME = "manifest.json"
+# File name prefix per dataset (the organize_* scripts used board_NNN / piece_NNN)
+PREFIXES = {"board": "board", "pieces": "piece"}
+ROBOFLOW_SUFFIX = re.compile(r"_(jpe?g|png)\.rf\.[0-9a-f]+$", re.IGNORECASE)
+
+
+def file_hash(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def split_for(digest: str, val_fraction: float) -> str:
+    # The first 32 bits of the hash are uniform, so this is a stable random split
+    return "val" if int(digest[:8], 16) / 2**32 < val_fraction else "train"
+
+
+def load_dataset(dataset: str, base_dir: Path):
+    """
+    Resolve a dataset name (board, pieces) or dataset.yaml path.
+    Returns (root, {split: (images_dir, labels_dir)}, prefix). The yaml's `path`
+    is used when it exists on this machine, else the folder holding the yaml.
+    """
+    yaml_path = Path(dataset)
+    if not yaml_path.suffix:
+        yaml_path = base_dir / "data" / dataset / "dataset.yaml"
+    config = yaml.safe_load(yaml_path.read_text())
+    root = Path(config.get("path") or yaml_path.parent)
+    if not root.is_absolute():
+        root = yaml_path.parent / root
+    if not root.is_dir():
+        root = yaml_path.parent
+    splits = {}
+    for split in ("train", "val"):
+        images = root / config[split]
+        # YOLO finds labels by swapping the last "images" folder for "labels"
+        parts = list(images.relative_to(root).parts)
+        labels = root.joinpath(*["labels" if p == "images" else p for p in parts])
+        splits[split] = (images, labels)
+    prefix = PREFIXES.get(yaml_path.parent.name, yaml_path.parent.name)
+    return root, splits, prefix
+
+
+def label_key(path: Path) -> str:
+    return ROBOFLOW_SUFFIX.sub("", path.stem)
+
+
+def load_manifest(path: Path) -> dict:
+    if path.exists():
+        return json.loads(path.read_text())
+    return {"version": 1, "files": {}}
+
+
+def save_manifest(path: Path, manifest: dict):
+    # Write then rename, so an interrupted run never leaves a truncated manifest
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_text(json.dumps(manifest, indent=2, sort_keys=True))
+    os.replace(tmp, path)
+
+
+def place(src: Path, dest: Path, link: bool):
+    """Copy src to dest, or hardlink it (falling back to a copy across filesystems)."""
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    if link:
+        try:
+            if dest.exists():
+                dest.unlink()
+            os.link(src, dest)
+            return
+        except OSError:
+            pass
+    shutil.copy2(src, dest)
+
+
+def existing_images(root: Path, splits: dict, manifest: dict, jobs: int):
+    """
+    (split, phash) of every image already in the dataset. Manifest entries keep
+    their phash (added here if missing); images on disk that are not in the
+    manifest (from before it existed) are hashed on every run.
+    """
+    files = manifest["files"]
+    missing = [e for e in files.values() if e.get("phash") is None and (root / e["image"]).exists()]
+    for entry, value in zip(missing, hash_files([root / e["image"] for e in missing], jobs)):
+        entry["phash"] = None if value is None else f"{value:016x}"
+    known = {e["image"] for e in files.values()}
+    loose = [(split, path) for split, (images_dir, _) in splits.items() if images_dir.is_dir()
+             for path in sorted(images_dir.rglob("*"))
+             if path.suffix.lower() in IMAGE_EXTENSIONS and path.relative_to(root).as_posix() not in known]
+    out = [(e["split"], int(e["phash"], 16)) for e in files.values() if e.get("phash")]
+    for (split, _), value in zip(loose, hash_files([path for _, path in loose], jobs)):
+        if value is not None:
+            out.append((split, value))
+    return out
+
+
+def assign_splits(new: list, existing: list, val_fraction: float, max_distance: int):
+    """
+    Split for each new image, given as (digest, phash or None). A new image that
+    is a near-duplicate of images already in the dataset joins their split (the
+    majority's, if they disagree); other clusters of new images go by the
+    smallest digest in the cluster, so near-duplicates never straddle train and val.
+    """
+    values = [value for _, value in existing] + [value for _, value in new]
+    # Unreadable images have no hash and stay clusters of their own
+    hashed = np.array([k for k, value in enumerate(values) if value is not None], dtype=np.int64)
+    pairs = near_duplicate_pairs(np.array([values[k] for k in hashed], dtype=np.uint64), max_distance)
+    labels = np.arange(len(values))
+    labels[hashed] = hashed[cluster_labels(len(hashed), pairs)]
+    votes, digests = {}, {}
+    for (split, _), label in zip(existing, labels):
+        votes.setdefault(label, collections.Counter())[split] += 1
+    for (digest, _), label in zip(new, labels[len(existing):]):
+        digests[label] = min(digests.get(label, digest), digest)
+    splits = []
+    for (digest, _), label in zip(new, labels[len(existing):]):
+        if label in votes:
+            splits.append(votes[label].most_common(1)[0][0])
+        else:
+            splits.append(split_for(digests[label], val_fraction))
+    return splits
+
+
+def plan(sources: list, labels: dict, manifest: dict, root: Path, splits: dict, prefix: str,
+         val_fraction: float, jobs: int, max_distance: int = DEFAULT_MAX_DISTANCE):
+    """
+    Hash every source image (and its label) in parallel and work out what to place.
+    Manifest paths are relative to the dataset root.
+    Returns (actions, stats); each action is (kind, src, dest, digest, entry).
+    """
+    files = manifest["files"]
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        digests = list(pool.map(file_hash, sources))
+        label_paths = [labels.get(label_key(src)) for src in sources]
+        label_digests = list(pool.map(lambda p: file_hash(p) if p else None, label_paths))
+
+    stats = {"images": len(sources), "new": 0, "duplicates": 0, "unchanged": 0, "restored": 0,
+             "labels_updated": 0, "missing_labels": 0, "near_duplicates": 0}
+    seen = set()
+    # Of several copies of one image, the first one with a label wins
+    candidates = []
+    for candidate in sorted(zip(sources, digests, label_paths, label_digests), key=lambda c: c[2] is None):
+        if candidate[1] in seen:
+            stats["duplicates"] += 1
+            continue
+        seen.add(candidate[1])
+        candidates.append(candidate)
+
+    # New images go to the split of their near-duplicates
+    new = [(src, digest) for src, digest, _, _ in candidates if digest not in files]
+    new_entries = {}
+    if new:
+        phashes = hash_files([src for src, _ in new], jobs)
+        existing = existing_images(root, splits, manifest, jobs)
+        new_splits = assign_splits([(digest, value) for (_, digest), value in zip(new, phashes)],
+                                   existing, val_fraction, max_distance)
+        for (src, digest), value, split in zip(new, phashes, new_splits):
+            if split != split_for(digest, val_fraction):
+                stats["near_duplicates"] += 1
+            ext = src.suffix.lower().replace(".jpeg", ".jpg")
+            name = f"{prefix}_{digest[:12]}"
+            images_dir, labels_dir = splits[split]
+            new_entries[digest] = {
+                "split": split,
+                "image": (images_dir / f"{name}{ext}").relative_to(root).as_posix(),
+                "label": (labels_dir / f"{name}.txt").relative_to(root).as_posix(),
+                "source": src.as_posix(),
+                "label_sha256": None,
+                "phash": None if value is None else f"{value:016x}",
+            }
+
+    actions = []
+    for src, digest, label_path, label_digest in candidates:
+        entry = files.get(digest)
+        if entry is None:
+            entry = new_entries[digest]
+            stats["new"] += 1
+            actions.append(("image", src, root / entry["image"], digest, entry))
+        elif not (root / entry["image"]).exists():
+            stats["restored"] += 1
+            actions.append(("image", src, root / entry["image"], digest, entry))
+        else:
+            stats["unchanged"] += 1
+        if label_path is None:
+            if entry.get("label_sha256") is None:
+                stats["missing_labels"] += 1
+        elif label_digest != entry.get("label_sha256") or not (root / entry["label"]).exists():
+            if entry.get("label_sha256") not in (None, label_digest):
+                stats["labels_updated"] += 1
+            actions.append(("label", label_path, root / entry["label"], digest, dict(entry, label_sha256=label_digest)))
+    return actions, stats
+
+
+def main():
+    base_dir = Path(__file__).resolve().parent
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("dataset", help="board, pieces, or a dataset.yaml path")
+    parser.add_argument("images", help="folder of new images (searched recursively)")
+    parser.add_argument("--labels", help="folder of YOLO .txt labels (default: a labels/ folder next to the images)")
+    parser.add_argument("--val-fraction", type=float, default=0.15)
+    parser.add_argument("--max-distance", type=int, default=DEFAULT_MAX_DISTANCE,
+                        help="pHash bits two images may differ by and still count as near-duplicates")
+    parser.add_argument("--link", action="store_true", help="hardlink instead of copying")
+    parser.add_argument("--jobs", type=int, default=min(32, (os.cpu_count() or 1) * 4))
+    parser.add_argument("--dry-run", action="store_true", help="report what would change, write nothing")
+    args = parser.parse_args()
+
+    root, splits, prefix = load_dataset(args.dataset, base_dir)
+    source_dir = Path(args.images)
+    if not source_dir.is_dir():
+        print(f"Not a folder: {source_dir}")
+        return 1
+    sources = sorted(p for p in source_dir.rglob("*") if p.is_file() and p.suffix.lower() in IMAGE_EXTENSIONS)
+    label_dir = Path(args.labels) if args.labels else source_dir.parent / "labels"
+    labels = {}
+    if label_dir.is_dir():
+        labels = {label_key(p): p for p in sorted(label_dir.rglob("*.txt"))}
+    print(f"Found {len(sources)} images and {len(labels)} labels")
+
+    manifest_path = root / MANIFEST_NAME
+    manifest = load_manifest(manifest_path)
+    actions, stats = plan(sources, labels, manifest, root, splits, prefix, args.val_fraction, args.jobs,
+                          args.max_distance)
+
+    placed = {"train": 0, "val": 0}
+    if not args.dry_run:
+        with ThreadPoolExecutor(max_workers=args.jobs) as pool:
+            list(pool.map(lambda a: place(a[1], a[2], args.link), actions))
+        for kind, _, _, digest, entry in actions:
+            current = manifest["files"].setdefault(digest, entry)
+            if kind == "image":
+                placed[entry["split"]] += 1
+            else:
+                current["label_sha256"] = entry["label_sha256"]
+        # Also saves hashes added to older entries
+        save_manifest(manifest_path, manifest)
+
+    counts = {split: 0 for split in splits}
+    for entry in manifest["files"].values():
+        counts[entry["split"]] += 1
+
+    print("\n" + "="*60)
+    print(f"INGEST SUMMARY ({root}){' - DRY RUN' if args.dry_run else ''}")
+    print("="*60)
+    print(f"Images found:     {stats['images']}")
+    print(f"New:              {stats['new']}")
+    print(f"Already ingested: {stats['unchanged']}")
+    print(f"Restored:         {stats['restored']} (in the manifest but missing on disk)")
+    print(f"Duplicates:       {stats['duplicates']} (same content as another source image)")
+    print(f"Near-duplicates:  {stats['near_duplicates']} (placed with similar images, not by hash)")
+    print(f"Labels updated:   {stats['labels_updated']}")
+    print(f"Without labels:   {stats['missing_labels']}")
+    if not args.dry_run:
+        print(f"\nPlaced: {placed['train']} train, {placed['val']} val ({'hardlinked' if args.link else 'copied'})")
+        print(f"Dataset now: {counts['train']} train, {counts['val']} val")
+        print(f"Manifest: {manifest_path}")
+    print("="*60)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
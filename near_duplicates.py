@@ -0,0 +1,119 @@
+"""
+Perceptual hashes and near-duplicate clustering for dataset images.
+Used by ingest_dataset.py (new images join their near-duplicates' split) and
+dedup_dataset.py (leakage report and fix).
+
+Hashes are 64-bit DCT hashes (pHash) as uint64. Near-duplicate pairs are found
+with multi-index hashing instead of comparing every pair: the hash is cut into
+max_distance // 2 + 1 bands, so two hashes within max_distance bits differ by at
+most one bit in some band. Each band is sorted once and every hash is looked up
+with each of its bits flipped, all with numpy array operations; only those
+candidates get a full Hamming distance check.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+import cv2
+import numpy as np
+
+HASH_BITS = 64
+DEFAULT_MAX_DISTANCE = 6
+
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def phash(gray: np.ndarray) -> int:
+    """64-bit DCT hash of a grayscale image: signs of the 8x8 lowest frequencies against their median."""
+    small = cv2.resize(gray, (32, 32), interpolation=cv2.INTER_AREA).astype(np.float32)
+    low = cv2.dct(small)[:8, :8].ravel()
+    # The DC term only carries overall brightness
+    bits = low > np.median(low[1:])
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def image_phash(path):
+    """pHash of an image file, or None if it cannot be decoded."""
+    # A reduced JPEG decode is plenty for a 32x32 hash; fromfile handles non-ASCII paths
+    data = np.fromfile(str(path), dtype=np.uint8)
+    gray = cv2.imdecode(data, cv2.IMREAD_REDUCED_GRAYSCALE_4) if data.size else None
+    if gray is None or min(gray.shape[:2]) < 8:
+        gray = cv2.imdecode(data, cv2.IMREAD_GRAYSCALE) if data.size else None
+    return phash(gray) if gray is not None else None
+
+
+def hash_files(paths: list, jobs: int = 8):
+    """pHash every file in parallel. Returns a list of ints (None for unreadable files)."""
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as pool:
+        return list(pool.map(image_phash, paths))
+
+
+def hamming(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Element-wise Hamming distance between two uint64 arrays."""
+    x = np.ascontiguousarray(np.bitwise_xor(a, b), dtype=np.uint64)
+    return _POPCOUNT[x.view(np.uint8)].reshape(-1, 8).sum(axis=1, dtype=np.int64)
+
+
+def _join(keys: np.ndarray, order: np.ndarray, sorted_keys: np.ndarray, queries: np.ndarray):
+    # All (query index, key index) pairs with queries[q] == keys[k]
+    left = np.searchsorted(sorted_keys, queries, side="left")
+    counts = np.searchsorted(sorted_keys, queries, side="right") - left
+    total = int(counts.sum())
+    if not total:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    q = np.repeat(np.arange(len(queries)), counts)
+    offsets = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+    return q, order[np.repeat(left, counts) + offsets]
+
+
+def near_duplicate_pairs(hashes, max_distance: int = DEFAULT_MAX_DISTANCE) -> np.ndarray:
+    """
+    All index pairs (i < j) whose hashes are at most max_distance bits apart.
+    Returns an (n, 2) int64 array.
+    """
+    hashes = np.asarray(hashes, dtype=np.uint64)
+    n = len(hashes)
+    found = []
+    bands = min(HASH_BITS, max_distance // 2 + 1)
+    edges = np.linspace(0, HASH_BITS, bands + 1).round().astype(int)
+    for start, stop in zip(edges[:-1], edges[1:]):
+        width = int(stop - start)
+        keys = (hashes >> np.uint64(start)) & np.uint64((1 << width) - 1)
+        order = np.argsort(keys, kind="stable")
+        sorted_keys = keys[order]
+        flips = [np.uint64(0)] + [np.uint64(1 << bit) for bit in range(width)]
+        for flip in flips:
+            i, j = _join(keys, order, sorted_keys, keys ^ flip)
+            keep = i < j
+            i, j = i[keep], j[keep]
+            close = hamming(hashes[i], hashes[j]) <= max_distance
+            if close.any():
+                found.append(i[close] * n + j[close])
+    if not found:
+        return np.empty((0, 2), dtype=np.int64)
+    flat = np.unique(np.concatenate(found))
+    return np.stack([flat // n, flat % n], axis=1)
+
+
+def cluster_labels(n: int, pairs: np.ndarray) -> np.ndarray:
+    """
+    Connected components of the near-duplicate graph.
+    Returns one label per item: the smallest index in its cluster.
+    """
+    labels = np.arange(n)
+    if not len(pairs):
+        return labels
+    i, j = pairs[:, 0], pairs[:, 1]
+    while True:
+        # Hook each edge to the smaller label, then jump pointers until they settle
+        low = np.minimum(labels[i], labels[j])
+        updated = labels.copy()
+        np.minimum.at(updated, labels[i], low)
+        np.minimum.at(updated, labels[j], low)
+        updated = updated[updated]
+        while True:
+            jumped = updated[updated]
+            if np.array_equal(jumped, updated):
+                break
+            updated = jumped
+        if np.array_equal(updated, labels):
+            return labels
+        labels = updated
@@ -0,0 +1,297 @@
+"""
+Pack a dataset split into memory-mapped NumPy shards of pre-decoded images.
+Every image is letterboxed to imgsz x imgsz (aspect kept, centered on gray like
+YOLO's loader) and stored as uint8 BGR rows of shard_NNNNN.npy files; index.json
+maps each image's content hash (the ingest manifest key) to its shard row, its
+letterbox geometry and its YOLO label. ImageShards reads them back with np.load
+mmap_mode, so loading an image is a zero-copy view of the page cache.
+
+Rebuilding is incremental: shards are never rewritten in place. Images added to
+the manifest go into new shards, removed ones are dropped from the index, changed
+labels only update the index, and shards that are mostly dead rows are repacked
+(from the old shard, without decoding again).
+
+    python shard_dataset.py build pieces --split val
+    python shard_dataset.py build board --split train --imgsz 640 --shard-size 512
+    python shard_dataset.py info data/pieces/shards/val-640
+"""
+
+import argparse
+import json
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import cv2
+import numpy as np
+from ingest_dataset import IMAGE_EXTENSIONS, MANIFEST_NAME, file_hash, load_dataset, load_manifest
+
+# Fix encoding for Windows console
+if sys.platform == 'win32':
+    sys.stdout.reconfigure(encoding='utf-8')
+
+INDEX_NAME = "index.json"
+PAD_VALUE = 114  # YOLO's letterbox gray
+
+
+def letterbox(bgr: np.ndarray, imgsz: int):
+    """Resize to fit imgsz x imgsz and center on gray. Returns (image, scale, (left, top))."""
+    h, w = bgr.shape[:2]
+    scale = imgsz / max(h, w)
+    nw, nh = max(1, round(w * scale)), max(1, round(h * scale))
+    interpolation = cv2.INTER_AREA if scale < 1 else cv2.INTER_LINEAR
+    resized = cv2.resize(bgr, (nw, nh), interpolation=interpolation)
+    left, top = (imgsz - nw) // 2, (imgsz - nh) // 2
+    out = np.full((imgsz, imgsz, 3), PAD_VALUE, dtype=np.uint8)
+    out[top:top + nh, left:left + nw] = resized
+    return out, scale, (left, top)
+
+
+class ImageShards:
+    """
+    Read-only view of a shard directory built by this script.
+    shards[i] or shards[digest] is the letterboxed BGR image (a read-only memmap
+    view); info(key) has its geometry and source paths; labels(key) its YOLO rows
+    in letterboxed coordinates.
+    """
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        self.index = json.loads((self.directory / INDEX_NAME).read_text())
+        self.imgsz = self.index["imgsz"]
+        self.keys = sorted(self.index["entries"], key=lambda k: self.index["entries"][k]["image"])
+        self._shards = {}
+
+
+    def __len__(self):
+        return len(self.keys)
+
+
+    def __iter__(self):
+        for key in self.keys:
+            yield key, self[key]
+
+
+    def _entry(self, key):
+        return self.index["entries"][self.keys[key] if isinstance(key, (int, np.integer)) else key]
+
+
+    def __getitem__(self, key) -> np.ndarray:
+        entry = self._entry(key)
+        shard = self._shards.get(entry["shard"])
+        if shard is None:
+            shard = self._shards[entry["shard"]] = np.load(self.directory / entry["shard"], mmap_mode="r")
+        return shard[entry["row"]]
+
+
+    def info(self, key) -> dict:
+        return self._entry(key)
+
+
+    def labels(self, key) -> np.ndarray:
+        """YOLO label rows (class, cx, cy, w, h), normalized to the letterboxed image."""
+        entry = self._entry(key)
+        rows = [list(map(float, line.split()[:5])) for line in (entry.get("label") or "").splitlines()
+                if len(line.split()) >= 5]
+        if not rows:
+            return np.zeros((0, 5), dtype=np.float32)
+        rows = np.array(rows, dtype=np.float32)
+        h, w = entry["source_hw"]
+        left, top = entry["pad"]
+        k = entry["scale"] / self.imgsz
+        rows[:, 1] = (rows[:, 1] * w * entry["scale"] + left) / self.imgsz
+        rows[:, 2] = (rows[:, 2] * h * entry["scale"] + top) / self.imgsz
+        rows[:, 3] *= w * k
+        rows[:, 4] *= h * k
+        return rows
+
+
+def split_entries(root: Path, splits: dict, split: str, jobs: int):
+    """
+    {digest: manifest entry} for one split. Datasets ingested before the manifest
+    existed are listed from the split folders and hashed here instead.
+    """
+    manifest_path = root / MANIFEST_NAME
+    if manifest_path.exists():
+        files = load_manifest(manifest_path)["files"]
+        return {digest: e for digest, e in files.items() if e["split"] == split and (root / e["image"]).exists()}
+    images_dir, labels_dir = splits[split]
+    paths = sorted(p for p in images_dir.rglob("*") if p.suffix.lower() in IMAGE_EXTENSIONS) if images_dir.is_dir() else []
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        digests = list(pool.map(file_hash, paths))
+    entries = {}
+    for path, digest in zip(paths, digests):
+        label = labels_dir / path.relative_to(images_dir).with_suffix(".txt")
+        entries.setdefault(digest, {
+            "split": split,
+            "image": path.relative_to(root).as_posix(),
+            "label": label.relative_to(root).as_posix(),
+            "label_sha256": file_hash(label) if label.exists() else None,
+        })
+    return entries
+
+
+def _load(root: Path, entry: dict, imgsz: int):
+    data = np.fromfile(str(root / entry["image"]), dtype=np.uint8)
+    bgr = cv2.imdecode(data, cv2.IMREAD_COLOR) if data.size else None
+    if bgr is None:
+        return None
+    image, scale, pad = letterbox(bgr, imgsz)
+    return image, {"source_hw": list(bgr.shape[:2]), "scale": scale, "pad": list(pad)}
+
+
+def _read_label(root: Path, entry: dict):
+    path = root / entry["label"]
+    return path.read_text() if path.exists() else None
+
+
+def _write_shard(path: Path, images: list, imgsz: int):
+    # Write under a temporary name so a crash never leaves a truncated shard behind
+    tmp = path.with_name(path.stem + ".tmp.npy")
+    out = np.lib.format.open_memmap(tmp, mode="w+", dtype=np.uint8, shape=(len(images), imgsz, imgsz, 3))
+    for row, image in enumerate(images):
+        out[row] = image
+    out.flush()
+    del out
+    os.replace(tmp, path)
+
+
+def build(root: Path, splits: dict, split: str, out_dir: Path, imgsz: int, shard_size: int,
+          jobs: int, repack_ratio: float = 0.5):
+    """Bring out_dir up to date with the split. Returns counts of what changed."""
+    out_dir.mkdir(parents=True, exist_ok=True)
+    index_path = out_dir / INDEX_NAME
+    index = json.loads(index_path.read_text()) if index_path.exists() else None
+    if index is None or index["imgsz"] != imgsz:
+        for stale in out_dir.glob("shard_*.npy"):
+            stale.unlink()
+        index = {"version": 1, "imgsz": imgsz, "split": split, "root": str(root), "shards": {}, "entries": {}}
+    entries = index["entries"]
+    wanted = split_entries(root, splits, split, jobs)
+    stats = {"added": 0, "removed": 0, "relabelled": 0, "repacked": 0, "unreadable": 0, "shards_written": 0}
+
+    for digest in [d for d in entries if d not in wanted]:
+        index["shards"][entries.pop(digest)["shard"]]["dead"] += 1
+        stats["removed"] += 1
+    for digest, entry in wanted.items():
+        current = entries.get(digest)
+        if current is not None and current.get("label_sha256") != entry.get("label_sha256"):
+            current.update(label_sha256=entry.get("label_sha256"), label=_read_label(root, entry))
+            stats["relabelled"] += 1
+        if current is not None:
+            current["image"] = entry["image"]
+
+    # Live rows of mostly-dead shards are copied into the new shards; the old files
+    # go only once the new index is in place
+    carry = []
+    repacked = []
+    # New shards never reuse a name the current index may still point to
+    next_id = max([int(name[6:11]) for name in index["shards"]], default=-1) + 1
+    for name, shard in list(index["shards"].items()):
+        if shard["dead"] >= shard["rows"] * repack_ratio:
+            old = np.load(out_dir / name, mmap_mode="r")
+            moving = [d for d, e in entries.items() if e["shard"] == name]
+            carry.extend((d, np.array(old[entries[d]["row"]])) for d in moving)
+            stats["repacked"] += len(moving)
+            del old
+            del index["shards"][name]
+            repacked.append(name)
+
+    new = [d for d in sorted(wanted, key=lambda d: wanted[d]["image"]) if d not in entries]
+    pending = list(carry)
+
+    def flush():
+        nonlocal next_id, pending
+        rows, pending = pending[:shard_size], pending[shard_size:]
+        name = f"shard_{next_id:05d}.npy"
+        _write_shard(out_dir / name, [image for _, image in rows], imgsz)
+        index["shards"][name] = {"rows": len(rows), "dead": 0}
+        for row, (digest, _) in enumerate(rows):
+            entries[digest].update(shard=name, row=row)
+        next_id += 1
+        stats["shards_written"] += 1
+
+    # Decode in parallel, a shard's worth at a time so memory stays bounded
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        for start in range(0, len(new), shard_size):
+            chunk = new[start:start + shard_size]
+            for digest, loaded in zip(chunk, pool.map(lambda d: _load(root, wanted[d], imgsz), chunk)):
+                if loaded is None:
+                    stats["unreadable"] += 1
+                    continue
+                image, geometry = loaded
+                entries[digest] = dict(geometry, image=wanted[digest]["image"],
+                                       label=_read_label(root, wanted[digest]),
+                                       label_sha256=wanted[digest].get("label_sha256"))
+                pending.append((digest, image))
+                stats["added"] += 1
+                if len(pending) >= shard_size:
+                    flush()
+        while pending:
+            flush()
+
+    # Index last: until it is replaced, readers keep seeing the previous state
+    tmp = index_path.with_name(INDEX_NAME + ".tmp")
+    tmp.write_text(json.dumps(index))
+    os.replace(tmp, index_path)
+    for name in repacked:
+        (out_dir / name).unlink(missing_ok=True)
+    return stats
+
+
+def cmd_build(args, base_dir: Path):
+    root, splits, _ = load_dataset(args.dataset, base_dir)
+    out_dir = Path(args.output) if args.output else root / "shards" / f"{args.split}-{args.imgsz}"
+    print(f"Packing {root} ({args.split}) into {out_dir}...")
+    stats = build(root, splits, args.split, out_dir, args.imgsz, args.shard_size, args.jobs)
+    shards = ImageShards(out_dir)
+    size_mb = sum((out_dir / name).stat().st_size for name in shards.index["shards"]) / (1024 * 1024)
+
+    print("\n" + "="*60)
+    print("SHARD SUMMARY")
+    print("="*60)
+    print(f"Added:       {stats['added']}")
+    print(f"Removed:     {stats['removed']}")
+    print(f"Relabelled:  {stats['relabelled']}")
+    print(f"Repacked:    {stats['repacked']}")
+    print(f"Unreadable:  {stats['unreadable']}")
+    print(f"\nImages: {len(shards)} in {len(shards.index['shards'])} shards "
+          f"({stats['shards_written']} written), {size_mb:.1f} MB")
+    print(f"Index: {out_dir / INDEX_NAME}")
+    print("="*60)
+    return 0
+
+
+def cmd_info(args, base_dir: Path):
+    shards = ImageShards(args.directory)
+    print(f"{args.directory}: {len(shards)} images, {shards.imgsz}x{shards.imgsz}, split {shards.index['split']}")
+    for name, shard in sorted(shards.index["shards"].items()):
+        print(f"   {name}: {shard['rows']} rows, {shard['dead']} dead")
+    labelled = sum(1 for key in shards.keys if shards.info(key).get("label"))
+    print(f"   {labelled} images with labels")
+    return 0
+
+
+def main():
+    base_dir = Path(__file__).resolve().parent
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    build_parser = sub.add_parser("build", help="create or update the shards of one split")
+    build_parser.add_argument("dataset", help="board, pieces, or a dataset.yaml path")
+    build_parser.add_argument("--split", choices=["train", "val"], default="val")
+    build_parser.add_argument("--imgsz", type=int, default=640)
+    build_parser.add_argument("--shard-size", type=int, default=256, help="images per shard file")
+    build_parser.add_argument("--output", help="default: data/<dataset>/shards/<split>-<imgsz>")
+    build_parser.add_argument("--jobs", type=int, default=min(32, (os.cpu_count() or 1) * 2))
+    build_parser.set_defaults(func=cmd_build)
+
+    info_parser = sub.add_parser("info", help="describe a shard directory")
+    info_parser.add_argument("directory")
+    info_parser.set_defaults(func=cmd_info)
+
+    args = parser.parse_args()
+    return args.func(args, base_dir)
+
+
+if __name__ == "__main__":
+    sys.exit(main())